@@ -0,0 +1,246 @@
+"""
+Нагрузочный тест REST API на синтетических данных (`manage.py seed_benchmark_data`):
+списки и карточки продуктов и приемов пищи, создание приемов пищи. Для каждого
+сценария и уровня параллельности - пропускная способность, задержки p50/p95/p99
+и число SQL-запросов на HTTP-запрос (из заголовка Server-Timing).
+
+    python -m benchmarks.api_load --concurrency 1 8 32 --duration 10 --output run.json
+    python -m benchmarks.api_load --baseline run.json
+
+Сервер - gunicorn с production-настройками на тестовой базе в локальном Postgres
+(сервис db из docker-compose), внешние сервисы не нужны. С --baseline к каждому
+результату добавляется изменение относительно прошлого прогона с тем же сценарием
+и параллельностью.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import secrets
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks import free_port, setup_django, start_server, test_database
+from benchmarks.load_test import percentile
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def products_list(context):
+    return 'GET', '/products/products/?page_size=20', None
+
+
+def product_detail(context):
+    return 'GET', f'/products/products/{context.rng.choice(context.product_ids)}/', None
+
+
+def meals_list(context):
+    return 'GET', '/products/meals/?page_size=20', None
+
+
+def meal_detail(context):
+    return 'GET', f'/products/meals/{context.rng.choice(context.meal_ids)}/', None
+
+
+def random_meal_products(context):
+    return [{'product': product_id, 'weight': context.rng.randint(50, 300)}
+            for product_id in context.rng.sample(context.product_ids, 3)]
+
+
+def meal_create(context):
+    return 'POST', '/products/meals/', {'name': context.rng.choice(['Завтрак', 'Обед', 'Ужин']),
+                                        'meal_products': random_meal_products(context)}
+
+
+def meal_bulk_create(context):
+    return 'POST', '/products/meals/bulk/', [{'name': 'Обед', 'meal_products': random_meal_products(context)}]
+
+
+SCENARIOS = {
+    'products-list': products_list,
+    'product-detail': product_detail,
+    'meals-list': meals_list,
+    'meal-detail': meal_detail,
+    'meal-create': meal_create,
+    'meal-bulk-create': meal_bulk_create,
+}
+
+
+class Session:
+    """Пользователь, от имени которого работает один поток нагрузки."""
+
+    def __init__(self, cookie, meal_ids, product_ids, seed):
+        csrf_token = secrets.token_hex(16)
+        self.headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Cookie': f'sessionid={cookie}; csrftoken={csrf_token}',
+            'X-CSRFToken': csrf_token,
+        }
+        self.meal_ids = meal_ids
+        self.product_ids = product_ids
+        self.rng = random.Random(seed)
+
+
+def worker(port, scenario, session, deadline, samples, lock):
+    connection = None
+    latencies, queries, errors = [], [], 0
+    while time.perf_counter() < deadline:
+        method, path, payload = scenario(session)
+        body = json.dumps(payload) if payload is not None else None
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request(method, path, body=body, headers=session.headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status not in (200, 201):
+                raise ValueError(response.status)
+            latencies.append(time.perf_counter() - started)
+            match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing', ''))
+            if match:
+                queries.append(int(match.group(1)))
+        except (OSError, ValueError, http.client.HTTPException):
+            errors += 1
+            if connection is not None:
+                connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+    with lock:
+        samples['latencies'].extend(latencies)
+        samples['queries'].extend(queries)
+        samples['errors'] += errors
+
+
+def run(port, scenario, sessions, concurrency, duration):
+    samples = {'latencies': [], 'queries': [], 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(port, scenario, sessions[number % len(sessions)], deadline, samples,
+                                              lock))
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies, queries = samples['latencies'], samples['queries']
+    return {
+        'requests': len(latencies),
+        'errors': samples['errors'],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        },
+        'queries_per_request': {
+            'mean': round(statistics.mean(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def compare(result, baseline):
+    """Относительное изменение метрик к прошлому прогону (+0.1 - на 10% больше)."""
+    def change(current, previous):
+        if current is None or not previous:
+            return None
+        return round(current / previous - 1, 3)
+
+    return {
+        'requests_per_second': change(result['requests_per_second'], baseline['requests_per_second']),
+        'p95': change(result['latency_ms']['p95'], baseline['latency_ms']['p95']),
+        'p99': change(result['latency_ms']['p99'], baseline['latency_ms']['p99']),
+        'queries_per_request': change(result['queries_per_request']['mean'], baseline['queries_per_request']['mean']),
+    }
+
+
+def create_sessions(count, seed):
+    from django.test import Client
+
+    from products.models import Meal, Product, User
+    from products.management.commands.seed_benchmark_data import USERNAME_PREFIX
+
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    sessions = []
+    for number, user in enumerate(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id')[:count]):
+        client = Client()
+        client.force_login(user)
+        meal_ids = list(Meal.objects.filter(user=user).values_list('id', flat=True))
+        sessions.append(Session(client.cookies['sessionid'].value, meal_ids, product_ids, seed + number))
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10, help='Секунд на сценарий и уровень параллельности.')
+    parser.add_argument('--workers', type=int, default=2, help='Процессов gunicorn.')
+    parser.add_argument('--threads', type=int, default=4, help='Потоков в процессе gunicorn.')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--meals-per-user', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Записать результаты в JSON-файл.')
+    parser.add_argument('--baseline', help='JSON-файл прошлого прогона для сравнения.')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = {(result['scenario'], result['concurrency']): result for result in json.load(file)['results']}
+
+    setup_django()
+    from django.core.management import call_command
+
+    with test_database() as connection:
+        call_command('seed_benchmark_data', users=args.users, products=args.products,
+                     meals_per_user=args.meals_per_user, seed=args.seed, stdout=sys.stderr)
+        sessions = create_sessions(max(args.concurrency), args.seed)
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'nutrition_tracker.settings_production',
+            'DB_NAME': connection.settings_dict['NAME'],
+            'GUNICORN_THREADS': str(args.threads),
+        }
+        port = free_port()
+        server = start_server('nutrition_tracker.wsgi', 'gthread', port, args.workers, env)
+        results = []
+        try:
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = {'scenario': name, 'concurrency': concurrency,
+                              **run(port, SCENARIOS[name], sessions, concurrency, args.duration)}
+                    if (name, concurrency) in baseline:
+                        result['change'] = compare(result, baseline[name, concurrency])
+                    results.append(result)
+                    print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Сравнивает синхронный путь чтения (gunicorn gthread + nutrition_tracker.wsgi) с
+асинхронным (gunicorn + UvicornWorker + nutrition_tracker.asgi, products.async_views)
+при 100-1000 одновременных соединениях: пропускную способность и задержки p50/p95/p99.
+
+    python -m benchmarks.async_reads --concurrency 100 250 500 1000 --duration 15
+
+Оба сервера запускаются с production-настройками на тестовой базе с синтетическими
+данными, с одинаковым числом воркеров. Клиент - asyncio с keep-alive соединениями;
+на одной машине он делит процессор с серверами, поэтому сравнивайте профили между
+собой, а не с абсолютными цифрами продакшена.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from benchmarks import free_port, setup_django, start_server, test_database
+
+PATHS = (
+    ('/products/meals/?page_size=20', '/products/async/meals/?page_size=20'),
+    ('/products/products/?page_size=20', '/products/async/products/?page_size=20'),
+)
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while size := int((await reader.readline()).strip(), 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    return status
+
+
+async def client(port, request, deadline, latencies, errors):
+    reader = writer = None
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            status = await asyncio.wait_for(read_response(reader), timeout=30)
+            if status != 200:
+                raise ValueError(status)
+            latencies.append(time.perf_counter() - started)
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            errors.append(1)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, path, cookie, concurrency, duration):
+    request = (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAccept: application/json\r\n'
+               f'Cookie: sessionid={cookie}\r\n\r\n').encode()
+    latencies, errors = [], []
+    deadline = asyncio.get_running_loop().time() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, request, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(percent):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, round(percent / 100 * (len(latencies) - 1)))] * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+        },
+    }
+
+
+def seed(products, meals, rng):
+    from django.test import Client
+    from django.utils import timezone
+
+    from products.models import Meal, MealProduct, Product, ProductCategory, User
+
+    category = ProductCategory.objects.create(name='Категория')
+    Product.objects.bulk_create(
+        (Product(name=f'Продукт {number}', proteins=rng.randint(0, 40), fats=rng.randint(0, 40),
+                 carbs=rng.randint(0, 80), category=category) for number in range(products)),
+        batch_size=5000,
+    )
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    user = User.objects.create_user(username='benchmark', password='benchmark')
+    now = timezone.now()
+    created = Meal.objects.bulk_create(
+        Meal(user=user, name='Обед', created_at=now - datetime.timedelta(hours=number)) for number in range(meals)
+    )
+    MealProduct.objects.bulk_create(
+        (MealProduct(meal=meal, product_id=product_id, weight=rng.randint(10, 300))
+         for meal in created for product_id in rng.sample(product_ids, 3)),
+        batch_size=5000,
+    )
+    # bulk_create не отправляет сигналы, поэтому хранимые итоги считаются явно.
+    Meal.refresh_totals(meal.id for meal in created)
+    client = Client()
+    client.force_login(user)
+    return client.cookies['sessionid'].value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 250, 500, 1000])
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--meals', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database() as connection:
+        cookie = seed(args.products, args.meals, random.Random(args.seed))
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'nutrition_tracker.settings_production',
+            'DB_NAME': connection.settings_dict['NAME'],
+        }
+        servers = {
+            'wsgi': ('nutrition_tracker.wsgi', 'gthread', env),
+            # Под ASGI постоянные соединения не переиспользуются между запросами.
+            'asgi': ('nutrition_tracker.asgi', 'uvicorn.workers.UvicornWorker', {**env, 'DB_CONN_MAX_AGE': '0'}),
+        }
+        results = []
+        for sync_path, async_path in PATHS:
+            for name, path in (('wsgi', sync_path), ('asgi', async_path)):
+                app, worker_class, server_env = servers[name]
+                port = free_port()
+                server = start_server(app, worker_class, port, args.workers, server_env)
+                try:
+                    for concurrency in args.concurrency:
+                        result = asyncio.run(load(port, path, cookie, concurrency, args.duration))
+                        results.append({'server': name, 'path': path, 'concurrency': concurrency, **result})
+                        print(json.dumps(results[-1]), file=sys.stderr)
+                finally:
+                    server.terminate()
+                    server.wait()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
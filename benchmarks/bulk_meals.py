@@ -0,0 +1,69 @@
+"""
+Замеряет загрузку приемов пищи через POST /products/meals/bulk/.
+
+    python -m benchmarks.bulk_meals --meals 100 --items 10
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--meals', type=int, default=100)
+    parser.add_argument('--items', type=int, default=10, help='Продуктов в одном приеме пищи.')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from products.models import Product, ProductCategory, User
+
+    with test_database():
+        category = ProductCategory.objects.create(name='Категория')
+        products = Product.objects.bulk_create(
+            Product(name=f'Продукт {i}', proteins=i % 40, fats=i % 30, carbs=i % 60, category=category)
+            for i in range(args.products)
+        )
+        user = User.objects.create_user(username='benchmark', password='benchmark')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('products:meals-bulk')
+        payload = [
+            {
+                'name': 'Обед',
+                'meal_products': [
+                    {'product': products[(meal * args.items + item) % len(products)].id, 'weight': 100}
+                    for item in range(args.items)
+                ],
+            }
+            for meal in range(args.meals)
+        ]
+
+        timings = []
+        for _ in range(args.repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.post(url, payload, format='json')
+                timings.append(time.perf_counter() - started)
+            assert response.status_code == 201, response.data
+
+    print(json.dumps({
+        'meals': args.meals,
+        'meal_products': args.meals * args.items,
+        'queries': len(queries.captured_queries),
+        'best_seconds': round(min(timings), 4),
+        'median_seconds': round(statistics.median(timings), 4),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
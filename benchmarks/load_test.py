@@ -0,0 +1,110 @@
+"""
+Нагрузочный тест запущенного сервера: N потоков в течение заданного времени
+запрашивают URL и считают запросы в секунду и задержки.
+
+    python -m benchmarks.load_test http://localhost:8000/products/products/ \
+        --user admin --password admin --concurrency 16 --duration 20
+
+Вход выполняется один раз через /api-auth/login/, дальше запросы идут с
+сессионной cookie: проверка пароля на каждый запрос (Basic) исказила бы замер.
+
+Чтобы сравнить профили, запустите его против `manage.py runserver` и против
+gunicorn с nutrition_tracker.settings_production.
+"""
+import argparse
+import http.cookiejar
+import json
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def login(url, user, password):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    login_url = urllib.parse.urljoin(url, '/api-auth/login/')
+    with opener.open(login_url) as response:
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.read().decode()).group(1)
+    data = urllib.parse.urlencode({'username': user, 'password': password, 'csrfmiddlewaretoken': token,
+                                   'next': urllib.parse.urlparse(url).path})
+    request = urllib.request.Request(login_url, data=data.encode(), headers={'Referer': login_url})
+    opener.open(request).close()
+    cookies = {cookie.name: cookie.value for cookie in jar}
+    if 'sessionid' not in cookies:
+        raise SystemExit('Не удалось войти: проверьте имя пользователя и пароль.')
+    return '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+
+def run(url, concurrency, duration, headers):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(url, headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                local_latencies.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--user', help='Пользователь, от имени которого идут запросы.')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    headers = {'Accept': 'application/json'}
+    if args.user:
+        headers['Cookie'] = login(args.url, args.user, args.password)
+    print(json.dumps(run(args.url, args.concurrency, args.duration, headers), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Запрос истории приемов пищи за 30 дней (GET /products/meals/?from=&to=) по мере
+роста всей истории в базе: от 1 до 50 млн продуктов в приемах пищи.
+
+    python -m benchmarks.meal_history --sizes 1000000 10000000 50000000
+
+История растет в прошлое, месяц за месяцем, с одинаковым числом приемов пищи на
+пользователя в месяц; для каждого месяца создаются секции (products.partitions).
+После каждого шага - задержки запроса и секции, которые он читает: при
+отсечении секций это только последние два месяца, сколько бы истории ни было.
+"""
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+
+from benchmarks import setup_django, test_database
+from benchmarks.load_test import percentile
+
+USERNAME_PREFIX = 'history_'
+
+
+def relations(plan):
+    if 'Relation Name' in plan:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from relations(child)
+
+
+def add_month(cursor, month, meals_per_user, items, product_ids):
+    """Приемы пищи всех пользователей за месяц month и по items продуктов в каждом."""
+    from django.utils import timezone
+
+    from products import partitions
+
+    partitions.create_partitions(cursor, month)
+    start, end = partitions.month_bounds(month)
+    end = min(end, timezone.now())
+    cursor.execute(
+        'INSERT INTO products_meal '
+        '(name, user_id, created_at, total_calories, total_carbs, total_fats, total_proteins) '
+        "SELECT 'Обед', users.id, %s::timestamptz + random() * (%s::timestamptz - %s::timestamptz), 0, 0, 0, 0 "
+        'FROM products_user AS users, generate_series(1, %s) '
+        'WHERE users.username LIKE %s',
+        [start, end, start, meals_per_user, USERNAME_PREFIX + '%'],
+    )
+    cursor.execute(
+        f'INSERT INTO products_mealproduct (weight, meal_id, product_id, meal_created_at) '
+        f'SELECT 50 + random() * 200, meal.id, (%s::bigint[])[1 + floor(random() * %s)::int], meal.created_at '
+        f'FROM "{partitions.partition_name("products_meal", month)}" AS meal, generate_series(1, %s)',
+        [product_ids, len(product_ids), items],
+    )
+    return cursor.rowcount
+
+
+def measure(client, connection, params, repeat):
+    from django.test.utils import CaptureQueriesContext
+
+    client.get('/products/meals/', params)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get('/products/meals/', params)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+
+    with CaptureQueriesContext(connection) as queries:
+        client.get('/products/meals/', params)
+    scanned = set()
+    with connection.cursor() as cursor:
+        for query in queries:
+            if 'products_meal' in query['sql']:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+                scanned.update(name for name in relations(cursor.fetchone()[0][0]['Plan'])
+                               if name.startswith('products_meal'))
+    return {
+        'meals': len(response.data['results']),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'mean_ms': round(statistics.mean(timings) * 1000, 2),
+        'queries': len(queries),
+        'partitions_scanned': sorted(scanned),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000, 50_000_000],
+                        help='Размеры истории (строк products_mealproduct), на которых делаются замеры.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--meals-per-month', type=int, default=90, help='Приемов пищи на пользователя в месяц.')
+    parser.add_argument('--items', type=int, default=3, help='Продуктов в одном приеме пищи.')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30, help='Длина запрашиваемого периода.')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+
+    from products import partitions
+    from products.models import Product, ProductCategory, User
+
+    results = []
+    with test_database() as connection:
+        category = ProductCategory.objects.create(name='Категория')
+        product_ids = [product.id for product in Product.objects.bulk_create(
+            Product(name=f'Продукт {i}', proteins=i % 40, fats=i % 30, carbs=i % 60, category=category)
+            for i in range(args.products)
+        )]
+        users = User.objects.bulk_create(User(username=f'{USERNAME_PREFIX}{number}', password='!')
+                                         for number in range(args.users))
+        client = APIClient()
+        client.force_authenticate(user=users[0])
+        today = timezone.localdate()
+        params = {'from': today - datetime.timedelta(days=args.days - 1), 'to': today, 'page_size': 500}
+
+        month = partitions.month_start(today)
+        total = months = 0
+        for size in sorted(args.sizes):
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                while total < size:
+                    total += add_month(cursor, month, args.meals_per_month, args.items, product_ids)
+                    month = partitions.add_months(month, -1)
+                    months += 1
+                cursor.execute('VACUUM ANALYZE products_meal, products_mealproduct')
+            print(f'История: {total} продуктов за {months} мес. ({time.perf_counter() - started:.0f} с)',
+                  file=sys.stderr)
+            result = {'meal_products': total, 'months': months, **measure(client, connection, params, args.repeat)}
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    print(json.dumps({'config': vars(args), 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Замеряет POST /products/meals/optimize/ на синтетических каталогах разного размера:
+подбор весов для 200 случайных продуктов и для всей категории (весь каталог).
+
+    python -m benchmarks.meal_optimizer --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks import setup_django, test_database
+
+TARGETS = {'proteins': 150, 'fats': 70, 'carbs': 250, 'calories': 2200}
+
+
+def timings_summary(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 50000])
+    parser.add_argument('--candidates', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from products import cache, nutrition, optimizer
+    from products.models import Product, ProductCategory, User
+
+    rng = random.Random(args.seed)
+    results = []
+    with test_database():
+        category = ProductCategory.objects.create(name='Категория')
+        user = User.objects.create_user(username='benchmark', password='benchmark')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('products:meals-optimize')
+
+        created = 0
+        for size in sorted(args.sizes):
+            Product.objects.bulk_create(
+                (Product(name=f'Продукт {number}', proteins=rng.randint(0, 40), fats=rng.randint(0, 40),
+                         carbs=rng.randint(0, 80), category=category) for number in range(created, size)),
+                batch_size=5000,
+            )
+            cache.invalidate('products')
+            created = size
+            product_ids = list(Product.objects.values_list('id', flat=True))
+            matrix = nutrition.get_matrix(product_ids)
+
+            result = {'products': size}
+            timings = {'candidates': [], 'category': [], 'solver': []}
+            for _ in range(args.repeat):
+                candidates = rng.sample(product_ids, min(args.candidates, size))
+                payload = {'items': [{'product': product_id} for product_id in candidates], 'targets': TARGETS}
+                started = time.perf_counter()
+                response = client.post(url, payload, format='json')
+                timings['candidates'].append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+
+                nutrients = matrix.nutrients[matrix.index(candidates)]
+                started = time.perf_counter()
+                optimizer.optimize_weights(nutrients, TARGETS, [0] * len(candidates), [500] * len(candidates))
+                timings['solver'].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                response = client.post(url, {'category': category.id, 'targets': TARGETS}, format='json')
+                timings['category'].append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+            for name, values in timings.items():
+                result[name] = timings_summary(values)
+            results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
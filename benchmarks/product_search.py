@@ -0,0 +1,74 @@
+"""
+Замеряет GET /products/products/search/ на синтетическом каталоге.
+
+    python -m benchmarks.product_search --products 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks import setup_django, test_database
+
+SYLLABLES = ('ба', 'ва', 'гре', 'ка', 'ло', 'ма', 'но', 'ри', 'са', 'то', 'фу', 'хе', 'ча', 'шо', 'ю', 'як')
+QUERIES = ('гречка', 'молоко', 'творог', 'баночка', 'хеча')
+
+
+def product_names(count, rng):
+    names = set()
+    while len(names) < count:
+        words = [''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        names.add(' '.join(words).capitalize()[:50])
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from products.models import Product, ProductCategory, User
+
+    rng = random.Random(args.seed)
+    with test_database():
+        category = ProductCategory.objects.create(name='Категория')
+        Product.objects.bulk_create(
+            (Product(name=name, proteins=rng.randint(0, 40), fats=rng.randint(0, 40), carbs=rng.randint(0, 80),
+                     category=category) for name in product_names(args.products, rng)),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products_product')
+        user = User.objects.create_user(username='benchmark', password='benchmark')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('products:products-search')
+
+        results = {'products': args.products}
+        for mode in ('similar', 'prefix'):
+            timings = []
+            for _ in range(args.repeat):
+                for query in QUERIES:
+                    q = query if mode == 'similar' else query[:4]
+                    started = time.perf_counter()
+                    response = client.get(url, {'q': q, 'mode': mode})
+                    timings.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.data
+            results[mode] = {
+                'median_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(statistics.quantiles(timings, n=20)[-1], 2),
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
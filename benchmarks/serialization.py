@@ -0,0 +1,120 @@
+"""
+Процессорное время на запись в ответах списков на 10 тыс. записей: обычные
+сериализаторы DRF с JSONRenderer против быстрого пути (products.representations
+и FastJSONRenderer).
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+
+Замеряется время процесса Django (time.process_time) на чтение строк из базы,
+построение записей и запись JSON - то, что list() делает с уже отфильтрованной
+страницей. Время самого Postgres сюда не входит. Ответы обоих путей сверяются
+побайтно.
+"""
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def measure(build, render, repeat):
+    """Медианы процессорного времени (с) на построение записей и запись JSON, и сам ответ."""
+    build_times, render_times = [], []
+    for _ in range(repeat):
+        started = time.process_time()
+        data = build()
+        built = time.process_time()
+        content = render(data)
+        build_times.append(built - started)
+        render_times.append(time.process_time() - built)
+    return statistics.median(build_times), statistics.median(render_times), content
+
+
+def compare(name, rows, regular, fast, repeat):
+    from rest_framework.renderers import JSONRenderer
+
+    from products.renderers import FastJSONRenderer
+
+    regular_build, regular_render, regular_content = measure(regular, JSONRenderer().render, repeat)
+    fast_build, fast_render, fast_content = measure(fast, FastJSONRenderer().render, repeat)
+    if fast_content != regular_content:
+        raise SystemExit(f'{name}: ответы быстрого пути и сериализаторов различаются.')
+    regular_total, fast_total = regular_build + regular_render, fast_build + fast_render
+    return {
+        'endpoint': name,
+        'rows': rows,
+        'bytes': len(fast_content),
+        'regular_us_per_row': {'build': round(regular_build / rows * 1e6, 2),
+                               'render': round(regular_render / rows * 1e6, 2),
+                               'total': round(regular_total / rows * 1e6, 2)},
+        'fast_us_per_row': {'build': round(fast_build / rows * 1e6, 2),
+                            'render': round(fast_render / rows * 1e6, 2),
+                            'total': round(fast_total / rows * 1e6, 2)},
+        'speedup': round(regular_total / fast_total, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000, help='Записей в ответе.')
+    parser.add_argument('--items', type=int, default=3, help='Продуктов в одном приеме пищи.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import Prefetch
+    from django.utils import timezone
+
+    from products import representations
+    from products.models import Meal, MealProduct, Product, ProductCategory, User
+    from products.serializers import MealSerializer, ProductSerializer
+
+    results = []
+    with test_database():
+        categories = ProductCategory.objects.bulk_create(ProductCategory(name=f'Категория {i}') for i in range(20))
+        products = Product.objects.bulk_create(
+            Product(name=f'Продукт {i}', proteins=i % 40, fats=i % 30, carbs=i % 60, category=categories[i % 20])
+            for i in range(args.rows)
+        )
+        user = User.objects.create(username='serialization', password='!')
+        now = timezone.now()
+        meals = Meal.objects.bulk_create(
+            Meal(user=user, name='Обед', created_at=now - datetime.timedelta(minutes=i), total_proteins=i * 0.37,
+                 total_fats=i * 0.11, total_carbs=i * 1.3, total_calories=i * 7.7)
+            for i in range(args.rows)
+        )
+        MealProduct.objects.bulk_create(
+            MealProduct(meal=meal, product=products[(i * args.items + j) % len(products)], weight=50 + j * 33.3)
+            for i, meal in enumerate(meals) for j in range(args.items)
+        )
+
+        product_queryset = Product.objects.select_related('category').order_by('id')
+        compiled = representations.compile_serializer(ProductSerializer())
+        results.append(compare(
+            'products', args.rows,
+            lambda: ProductSerializer(list(product_queryset), many=True).data,
+            lambda: compiled.serialize(list(compiled.values(product_queryset))),
+            args.repeat,
+        ))
+
+        meal_queryset = Meal.objects.select_related('user').prefetch_related(
+            Prefetch('meal_products', queryset=MealProduct.objects.select_related('product__category').order_by('id'))
+        ).order_by('-created_at', '-id')
+        compiled = representations.compile_serializer(MealSerializer())
+        results.append(compare(
+            'meals', args.rows,
+            lambda: MealSerializer(list(meal_queryset), many=True).data,
+            lambda: compiled.serialize(list(compiled.values(meal_queryset)), meal_queryset),
+            args.repeat,
+        ))
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    print(json.dumps({'config': vars(args), 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
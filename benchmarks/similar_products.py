@@ -0,0 +1,100 @@
+"""
+Замеряет поиск похожих продуктов (products.similarity) на синтетическом каталоге:
+построение индекса, запрос к индексу, GET /products/products/{id}/similar/ целиком
+и применение изменений продуктов к индексу без перестройки.
+
+    python -m benchmarks.similar_products --products 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks import setup_django, test_database
+
+
+def summary(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from products import nutrition, similarity
+    from products.models import Product, ProductCategory, User
+
+    rng = random.Random(args.seed)
+    with test_database():
+        categories = ProductCategory.objects.bulk_create(
+            ProductCategory(name=f'Категория {number}') for number in range(args.categories)
+        )
+        Product.objects.bulk_create(
+            (Product(name=f'Продукт {number}', proteins=rng.randint(0, 40), fats=rng.randint(0, 40),
+                     carbs=rng.randint(0, 80), category=rng.choice(categories)) for number in range(args.products)),
+            batch_size=5000,
+        )
+        products = list(Product.objects.values_list('id', *nutrition.NUTRIENTS, 'category_id'))
+        samples = rng.sample(products, min(args.queries, len(products)))
+
+        started = time.perf_counter()
+        index = similarity.get_index()
+        results = {'products': args.products, 'load_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+        for name, by_category in (('index_all', False), ('index_category', True)):
+            timings = []
+            for product_id, *nutrients, category_id in samples:
+                started = time.perf_counter()
+                index.nearest(nutrients, 10, {category_id} if by_category else None, exclude=[product_id])
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = summary(timings)
+
+        user = User.objects.create_user(username='benchmark', password='benchmark')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        names = {category.id: category.name for category in categories}
+        for name, by_category in (('endpoint_all', False), ('endpoint_category', True)):
+            timings = []
+            for product_id, *_, category_id in samples:
+                params = {'k': 10}
+                if by_category:
+                    params['category'] = names[category_id]
+                started = time.perf_counter()
+                response = client.get(reverse('products:products-similar', args=[product_id]), params)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+            results[name] = summary(timings)
+
+        # Изменения применяются так же, как после коммита сохранения продукта в этом процессе.
+        timings = []
+        for product_id, *_, category_id in rng.sample(products, min(args.updates, len(products))):
+            nutrients = nutrition.with_calories([(rng.randint(0, 40), rng.randint(0, 40), rng.randint(0, 80))])[0]
+            started = time.perf_counter()
+            index.update(product_id, nutrients, category_id)
+            timings.append((time.perf_counter() - started) * 1000)
+        results['update'] = {**summary(timings), 'max_ms': round(max(timings), 1)}
+        timings = []
+        for product_id, *nutrients, category_id in samples:
+            started = time.perf_counter()
+            index.nearest(nutrients, 10, exclude=[product_id])
+            timings.append((time.perf_counter() - started) * 1000)
+        results['index_all_after_updates'] = summary(timings)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
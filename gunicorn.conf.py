@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for the production profile.
+
+    gunicorn -c gunicorn.conf.py nutrition_tracker.wsgi
+
+Set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker and serve
+nutrition_tracker.asgi instead to run the ASGI application (async read
+endpoints under /products/async/). Persistent connections are not reused
+under ASGI, so also set DB_CONN_MAX_AGE=0 there.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Threads per worker; with CONN_MAX_AGE each thread holds one database connection.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+# Restart workers periodically to bound memory growth.
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = '-'
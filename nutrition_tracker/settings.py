@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 from pathlib import Path
 
-from decouple import config
+from decouple import Csv, config
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,7 +25,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
 
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'products.instrumentation.InstrumentationMiddleware',
+    'products.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,6 +91,140 @@ DATABASES = {
     }
 }
 
+# Read replicas (products.routers)
+# Safe-method requests read from a random replica listed in DB_REPLICA_HOSTS
+# (host or host:port, comma-separated); everything else uses the primary.
+# A client that wrote something keeps reading from the primary for
+# DB_REPLICA_PIN_SECONDS, which should exceed the usual replication lag.
+# In tests the replicas mirror the test database of the primary.
+
+DATABASE_REPLICAS = []
+for number, replica_host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    replica_host, _, replica_port = replica_host.partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': config('DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['products.routers.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Catalogue response cache (products.cache). Entries are invalidated by signals
+# whenever products or categories change, so the timeout can be long. The
+# invalidation is a version stored in this cache: with the per-process LocMemCache
+# a write is seen only by the process that made it, and other processes serve stale
+# responses and ETags for up to CATALOGUE_CACHE_TIMEOUT. Use REDIS_URL whenever
+# more than one process serves the API (settings_production requires it).
+CATALOGUE_CACHE_ALIAS = 'default'
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=3600, cast=int)
+
+
+# Instrumentation
+# SQL queries slower than this are logged by products.instrumentation.
+
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=int)
+
+
+# Async read endpoints (products.async_views)
+# Under ASGI every request opens its own database connection; this caps the
+# number of requests per process that talk to the database at the same time.
+
+ASYNC_DB_CONCURRENCY = config('ASYNC_DB_CONCURRENCY', default=20, cast=int)
+
+
+# API responses
+# List endpoints build records straight from .values() rows (products.representations)
+# and responses are encoded with orjson (products.renderers); both produce the same
+# bytes as the regular serializers and JSONRenderer, except that NaN and infinite
+# floats are written as null instead of failing the response. Set
+# FAST_SERIALIZATION=False to serve lists through the regular serializers.
+
+FAST_SERIALIZATION = config('FAST_SERIALIZATION', default=True, cast=bool)
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'products.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
+# Similar products (products.similarity)
+# Each process keeps a nearest-neighbour index of the catalogue in memory. Its own
+# product writes are applied to the index incrementally; writes from other processes
+# trigger a reload through the catalogue version. The index is also reloaded after
+# SIMILAR_PRODUCTS_INDEX_MAX_AGE seconds in case two processes wrote at the same moment.
+
+SIMILAR_PRODUCTS_INDEX_MAX_AGE = config('SIMILAR_PRODUCTS_INDEX_MAX_AGE', default=600, cast=int)
+
+
+# Meal evaluation and optimization (products.nutrition)
+# Each process keeps the nutrients of the whole catalogue in memory. It is reloaded
+# when the catalogue version changes, after NUTRIENT_MATRIX_MAX_AGE seconds (the
+# version is per process without a shared cache) and, at most once per
+# NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS, when a request names products it lacks.
+
+NUTRIENT_MATRIX_MAX_AGE = config('NUTRIENT_MATRIX_MAX_AGE', default=600, cast=int)
+NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS = config('NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS', default=5, cast=int)
+
+
+# Background jobs (products.jobs, `manage.py run_workers`)
+# Failed jobs are retried with exponential backoff from JOBS_RETRY_BASE_SECONDS
+# up to JOBS_RETRY_MAX_SECONDS. A worker refreshes the heartbeat of its running job
+# every JOBS_HEARTBEAT_SECONDS; jobs without a heartbeat for JOBS_STALE_SECONDS are
+# assumed to have lost their worker and are queued again. `manage.py prune_jobs`
+# deletes jobs finished more than JOBS_KEEP_DAYS ago together with their files.
+
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_BASE_SECONDS = config('JOBS_RETRY_BASE_SECONDS', default=10, cast=int)
+JOBS_RETRY_MAX_SECONDS = config('JOBS_RETRY_MAX_SECONDS', default=3600, cast=int)
+JOBS_HEARTBEAT_SECONDS = config('JOBS_HEARTBEAT_SECONDS', default=30, cast=int)
+JOBS_STALE_SECONDS = config('JOBS_STALE_SECONDS', default=300, cast=int)
+JOBS_KEEP_DAYS = config('JOBS_KEEP_DAYS', default=7, cast=int)
+# Recompute stored meal totals after product nutrient edits, deletions and
+# imports in a background job instead of inside the request's transaction.
+JOBS_DEFER_MEAL_TOTALS = config('JOBS_DEFER_MEAL_TOTALS', default=False, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'products': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +262,12 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Uploaded files waiting for a background import and finished exports.
+
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,59 @@
+"""
+Production settings for nutrition_tracker project.
+
+Enabled with DJANGO_SETTINGS_MODULE=nutrition_tracker.settings_production;
+the app is served by gunicorn with the options from gunicorn.conf.py.
+"""
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
+
+from nutrition_tracker.settings import *  # noqa: F401, F403
+from nutrition_tracker.settings import CACHES, DATABASES, MIDDLEWARE
+
+DEBUG = False
+
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1', cast=Csv())
+
+
+# Database
+# Each gunicorn worker thread keeps its own persistent connection, so the
+# per-worker pool size equals GUNICORN_THREADS and the server opens at most
+# WEB_CONCURRENCY * GUNICORN_THREADS connections to Postgres (and as many to
+# each read replica).
+# https://docs.djangoproject.com/en/5.1/ref/databases/#persistent-connections
+
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+    database['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# Catalogue response invalidation and ETags, replica pins, the catalogue version
+# of in-memory indexes and memoised targets are kept in the cache and have to be
+# seen by every gunicorn and job worker, so a per-process cache is refused.
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+    raise ImproperlyConfigured('The production profile needs a cache shared by all processes: set REDIS_URL.')
+
+
+# Static files are served by WhiteNoise from STATIC_ROOT (collectstatic),
+# compressed and with far-future cache headers for hashed file names.
+# http://whitenoise.evans.io/en/stable/django.html
+
+MIDDLEWARE = MIDDLEWARE.copy()
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
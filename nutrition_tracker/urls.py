@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from products.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls')),
     path('products/', include('products.urls', namespace='products')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,10 +1,19 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 
-from products.models import Meal, Product, ProductCategory, User
+from products import duplicates, jobs
+from products.models import DailyNutrition, Job, Meal, MealTemplate, Product, ProductCategory, User
 
 admin.site.register(User)
 admin.site.register(ProductCategory)
 admin.site.register(Meal)
+admin.site.register(MealTemplate)
+admin.site.register(DailyNutrition)
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -13,4 +22,71 @@ class ProductAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'calories')
     search_fields = ('name',)
     ordering = ('name',)
-    list_filter = ('category',)
\ No newline at end of file
+    list_filter = ('category',)
+    DUPLICATES_PER_PAGE = 50
+
+    def get_urls(self):
+        return [
+            path('duplicates/', self.admin_site.admin_view(self.duplicates_view), name='products_product_duplicates'),
+            *super().get_urls(),
+        ]
+
+    def duplicates_view(self, request):
+        """Кластеры дубликатов из последнего поиска (задача find_duplicate_products) и их слияние."""
+        if not (self.has_change_permission(request) and self.has_delete_permission(request)):
+            raise PermissionDenied
+        if request.method == 'POST':
+            if 'search' in request.POST:
+                job = jobs.enqueue('find_duplicate_products', user=request.user)
+                self.message_user(request, f'Поиск дубликатов поставлен в очередь, задача #{job.id}.')
+            else:
+                self.merge_cluster(request)
+            return redirect(request.get_full_path())
+
+        job = (Job.objects.filter(kind='find_duplicate_products', status=Job.SUCCEEDED)
+               .order_by('-finished_at').first())
+        page = Paginator(job.result['clusters'] if job else [], self.DUPLICATES_PER_PAGE).get_page(
+            request.GET.get('page'))
+        product_ids = [product_id for cluster in page for product_id in cluster]
+        products = Product.objects.select_related('category').annotate(
+            meal_products_count=Count('mealproduct')).in_bulk(product_ids)
+        # Слитые с тех пор продукты пропадают из кластеров; первым идет самый используемый продукт.
+        clusters = []
+        for cluster in page:
+            cluster = sorted((products[product_id] for product_id in cluster if product_id in products),
+                             key=lambda product: (-product.meal_products_count, product.id))
+            if len(cluster) > 1:
+                clusters.append(cluster)
+        return TemplateResponse(request, 'admin/products/product/duplicates.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Дубликаты продуктов',
+            'job': job,
+            'page': page,
+            'clusters': clusters,
+        })
+
+    def merge_cluster(self, request):
+        try:
+            product_ids = {int(product_id) for product_id in request.POST.getlist('products')}
+            winner_id = int(request.POST['winner'])
+        except (KeyError, ValueError):
+            product_ids, winner_id = set(), None
+        if winner_id not in product_ids or len(product_ids) < 2:
+            self.message_user(request, 'Выберите продукт, который останется в каталоге.', level='error')
+            return
+        try:
+            moved = duplicates.merge_products(winner_id, product_ids)
+        except Product.DoesNotExist:
+            self.message_user(request, 'Продукт уже удален.', level='error')
+            return
+        self.message_user(request, f'Продукты объединены, перенесено записей о приемах пищи: {moved}.')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'finished_at', 'user')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'payload', 'user', 'attempts', 'created_at', 'started_at', 'finished_at', 'worker',
+                       'result', 'error')
+    ordering = ('-created_at',)
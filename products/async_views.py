@@ -0,0 +1,238 @@
+"""
+Асинхронные (ASGI) версии эндпоинтов чтения каталога и приемов пищи.
+
+DRF не поддерживает асинхронные представления, поэтому это обычные async-функции
+Django поверх асинхронного ORM (aiterator, aget, aaggregate). Формат записей тот же,
+что у синхронных сериализаторов; списки постраничные по ключу (?after= / ?before=).
+Под WSGI они тоже работают, но выигрыш дают только под ASGI (nutrition_tracker.asgi).
+"""
+import asyncio
+import functools
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, serializers, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from products.models import Meal, MealProduct, Product, ProductCategory
+from products.pagination import MealCursorPagination, ProductCursorPagination
+from products.serializers import DateRangeQuerySerializer, ProductFilterSerializer
+
+PRODUCT_FIELDS = ('id', 'name', 'proteins', 'fats', 'carbs', 'calories', 'category__name')
+TOTAL_FIELDS = ('proteins', 'fats', 'carbs', 'calories')
+datetime_field = serializers.DateTimeField()
+
+_db_slots = weakref.WeakKeyDictionary()
+
+
+def db_slots():
+    """
+    Ограничивает число одновременных обращений к базе из одного процесса: под ASGI
+    каждый запрос открывает свое соединение, и без лимита тысяча клиентов
+    исчерпала бы max_connections Postgres. Остальные запросы ждут в цикле событий.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _db_slots:
+        _db_slots[loop] = asyncio.Semaphore(settings.ASYNC_DB_CONCURRENCY)
+    return _db_slots[loop]
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+async def authenticate(request):
+    """Проверяет запрос теми же классами аутентификации, что и синхронное API."""
+    def get_user():
+        authenticators = [authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        return Request(request, authenticators=authenticators).user
+
+    return await sync_to_async(get_user)()
+
+
+def async_api_view(view):
+    """GET-представление для авторизованных пользователей с ошибками в формате DRF."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method != 'GET':
+                raise exceptions.MethodNotAllowed(request.method)
+            async with db_slots():
+                user = await authenticate(request)
+                if not user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                return await view(request, user, *args, **kwargs)
+        except exceptions.APIException as error:
+            detail = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+            response = json_response(detail, status=error.status_code)
+            if isinstance(error, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                # Как в APIView.permission_denied: 401 только если первый класс
+                # аутентификации умеет отдавать WWW-Authenticate, иначе 403.
+                header = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]().authenticate_header(request)
+                if header:
+                    response['WWW-Authenticate'] = header
+                else:
+                    response.status_code = status.HTTP_403_FORBIDDEN
+            return response
+
+    return wrapper
+
+
+def page_size(request, pagination_class):
+    try:
+        size = int(request.GET[pagination_class.page_size_query_param])
+    except (KeyError, ValueError):
+        return pagination_class.page_size
+    return min(size, pagination_class.max_page_size) if size > 0 else pagination_class.page_size
+
+
+async def fetch_page(request, queryset, size, cursor):
+    """Страница из size записей и ссылка на следующую с параметрами cursor(последняя запись)."""
+    rows = [row async for row in queryset[:size + 1].aiterator()]
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    params = request.GET.copy()
+    for name, value in cursor(rows[-1]).items():
+        params[name] = value
+    return rows, request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def product_representation(row, prefix=''):
+    return {
+        'id': row[f'{prefix}id'],
+        'name': row[f'{prefix}name'],
+        'proteins': row[f'{prefix}proteins'],
+        'fats': row[f'{prefix}fats'],
+        'carbs': row[f'{prefix}carbs'],
+        'calories': row[f'{prefix}calories'],
+        'category': row[f'{prefix}category__name'],
+    }
+
+
+@async_api_view
+async def product_list(request, user):
+    query = ProductFilterSerializer(data=request.GET)
+    query.is_valid(raise_exception=True)
+    filters = dict(query.validated_data)
+    if 'category' in filters:
+        filters['category__name'] = filters.pop('category')
+    queryset = Product.objects.filter(**filters).order_by('id')
+    if 'after' in request.GET:
+        try:
+            queryset = queryset.filter(id__gt=int(request.GET['after']))
+        except ValueError:
+            raise exceptions.ValidationError({'after': ['Неверный курсор.']})
+
+    rows, next_url = await fetch_page(request, queryset.values(*PRODUCT_FIELDS),
+                                      page_size(request, ProductCursorPagination), lambda row: {'after': row['id']})
+    return json_response({'next': next_url, 'results': [product_representation(row) for row in rows]})
+
+
+@async_api_view
+async def product_detail(request, user, pk):
+    try:
+        row = await Product.objects.values(*PRODUCT_FIELDS).aget(pk=pk)
+    except Product.DoesNotExist:
+        raise exceptions.NotFound()
+    return json_response(product_representation(row))
+
+
+@async_api_view
+async def category_list(request, user):
+    categories = ProductCategory.objects.order_by('id').values('id', 'name')
+    return json_response([category async for category in categories.aiterator()])
+
+
+@async_api_view
+async def category_detail(request, user, pk):
+    try:
+        category = await ProductCategory.objects.values('id', 'name').aget(pk=pk)
+    except ProductCategory.DoesNotExist:
+        raise exceptions.NotFound()
+    return json_response(category)
+
+
+def user_meals(user):
+    return Meal.objects.all() if user.is_staff else Meal.objects.filter(user=user)
+
+
+def meal_values(queryset):
+    return queryset.values('id', 'name', 'user__username', 'created_at',
+                           *(f'total_{nutrient}' for nutrient in TOTAL_FIELDS))
+
+
+async def meal_representations(rows):
+    """
+    Записи приемов пищи с продуктами; продукты всех приемов читаются одним запросом.
+    Фильтр по meal_created_at задает ключ секции, как и в MealViewSet.meal_products_prefetch.
+    """
+    meal_products = {row['id']: [] for row in rows}
+    queryset = MealProduct.objects.filter(
+        meal_id__in=meal_products, meal_created_at__in={row['created_at'] for row in rows},
+    ).order_by('id').values(
+        'meal_id', 'weight', *(f'product__{field}' for field in PRODUCT_FIELDS))
+    async for meal_product in queryset.aiterator():
+        meal_products[meal_product['meal_id']].append({
+            'product': product_representation(meal_product, prefix='product__'),
+            'weight': meal_product['weight'],
+        })
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'user': row['user__username'],
+            'created_at': datetime_field.to_representation(row['created_at']),
+            'meal_products': meal_products[row['id']],
+            **{f'total_{nutrient}': row[f'total_{nutrient}'] for nutrient in TOTAL_FIELDS},
+        }
+        for row in rows
+    ]
+
+
+@async_api_view
+async def meal_list(request, user):
+    queryset = user_meals(user).order_by('-created_at', '-id')
+    if 'before' in request.GET:
+        created_at, _, meal_id = request.GET['before'].rpartition(',')
+        try:
+            created_at = parse_datetime(created_at)
+        except ValueError:
+            created_at = None
+        if created_at is None or not meal_id.isdigit():
+            raise exceptions.ValidationError({'before': ['Неверный курсор.']})
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=int(meal_id)))
+
+    rows, next_url = await fetch_page(
+        request, meal_values(queryset), page_size(request, MealCursorPagination),
+        lambda row: {'before': f'{row["created_at"].isoformat()},{row["id"]}'},
+    )
+    return json_response({'next': next_url, 'results': await meal_representations(rows)})
+
+
+@async_api_view
+async def meal_detail(request, user, pk):
+    try:
+        row = await meal_values(user_meals(user)).aget(pk=pk)
+    except Meal.DoesNotExist:
+        raise exceptions.NotFound()
+    return json_response((await meal_representations([row]))[0])
+
+
+@async_api_view
+async def meal_totals(request, user):
+    """Итоги приемов пищи пользователя за период (?from=&to=) одним агрегирующим запросом."""
+    query = DateRangeQuerySerializer(data=request.GET)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    start, end = DateRangeQuerySerializer.datetime_range(params)
+    totals = await Meal.objects.filter(user=user, created_at__gte=start, created_at__lt=end).aaggregate(
+        meals_count=Count('id'),
+        **{nutrient: Coalesce(Sum(f'total_{nutrient}'), 0.0) for nutrient in TOTAL_FIELDS})
+    return json_response({'from': params['from'].isoformat(), 'to': params['to'].isoformat(), **totals})
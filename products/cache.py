@@ -0,0 +1,116 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+STATS = ('hits', 'misses', 'not_modified')
+
+
+def get_cache():
+    return caches[settings.CATALOGUE_CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f'catalogue:version:{namespace}'
+
+
+def get_versions(namespaces):
+    """
+    Версия пространства имен - время его последнего изменения в наносекундах.
+    Она входит в ключ кеша и ETag, поэтому смена версии делает старые ответы недоступными.
+    Версии хранятся в том же кеше: другие процессы видят их смену, только если кеш общий.
+    """
+    cache = get_cache()
+    keys = {namespace: version_key(namespace) for namespace in namespaces}
+    versions = cache.get_many(keys.values())
+    missing = [namespace for namespace, key in keys.items() if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for namespace in missing:
+            cache.add(keys[namespace], now, timeout=None)
+        versions.update(cache.get_many(keys[namespace] for namespace in missing))
+    return [versions.get(key, 0) for key in keys.values()]
+
+
+def invalidate(*namespaces):
+    def bump():
+        get_cache().set_many({version_key(namespace): time.time_ns() for namespace in namespaces}, timeout=None)
+
+    # Повторный сброс после коммита убирает ответы, закешированные конкурентными
+    # запросами по еще не закоммиченным данным.
+    bump()
+    transaction.on_commit(bump)
+
+
+def count(stat):
+    cache = get_cache()
+    key = f'catalogue:stats:{stat}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many(f'catalogue:stats:{stat}' for stat in STATS)
+    stats = {stat: values.get(f'catalogue:stats:{stat}', 0) for stat in STATS}
+    served = stats['hits'] + stats['not_modified']
+    total = served + stats['misses']
+    stats['hit_ratio'] = round(served / total, 4) if total else None
+    return stats
+
+
+class CachedResponseMixin:
+    """
+    Кеширует list/retrieve во вьюсетах каталога. Ответ зависит от версий
+    пространств имен из cache_namespaces; сигналы изменения моделей
+    сбрасывают эти версии (products.signals).
+    """
+
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = max(get_versions(self.cache_namespaces))
+        representation = f'{self.basename}:{request.accepted_renderer.format}:{request.build_absolute_uri()}'
+        digest = hashlib.md5(representation.encode()).hexdigest()
+        etag = quote_etag(f'{digest}-{version}')
+        last_modified = version // 10 ** 9
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            count('not_modified')
+            return self.with_validators(not_modified, etag, last_modified)
+
+        cache = get_cache()
+        key = f'catalogue:response:{digest}:{version}'
+        data = cache.get(key)
+        if data is not None:
+            count('hits')
+            return self.with_validators(Response(data), etag, last_modified)
+
+        count('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.CATALOGUE_CACHE_TIMEOUT)
+            self.with_validators(response, etag, last_modified)
+        return response
+
+    @staticmethod
+    def with_validators(response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
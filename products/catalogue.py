@@ -0,0 +1,144 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from products import cache
+from products.models import Meal, MealTemplate, Product, ProductCategory
+from products.serializers import ProductImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('name', 'proteins', 'fats', 'carbs', 'category')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/jsonl; charset=utf-8',
+}
+
+
+def detect_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in FORMATS else default
+
+
+def check_encoding(upload):
+    """Проверяет, что загруженный файл целиком в UTF-8 (UnicodeDecodeError, если нет), и перематывает его."""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    for chunk in upload.chunks():
+        decoder.decode(chunk)
+    decoder.decode(b'', final=True)
+    upload.seek(0)
+
+
+def read_rows(lines, file_format):
+    """Построчно читает CSV или JSONL, возвращая пары (номер строки, словарь)."""
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else {}
+
+
+class ProductImporter:
+    """
+    Загружает продукты пачками: проверяет строки без запросов к базе,
+    сопоставляет категории через общий на весь прогон кеш и делает upsert
+    по уникальному названию одним bulk_create на пачку.
+    """
+
+    def __init__(self, chunk_size=1000, create_categories=False):
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.categories = {}
+        self.imported = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.import_chunk(chunk)
+        return self
+
+    def import_chunk(self, chunk):
+        valid = []
+        for line_num, row in chunk:
+            serializer = ProductImportSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((line_num, serializer.validated_data))
+            else:
+                self.errors.append({'line': line_num, 'errors': serializer.errors})
+
+        self.resolve_categories({data['category'] for _, data in valid})
+        products = {}
+        for line_num, data in valid:
+            category_id = self.categories.get(data['category'])
+            if category_id is None:
+                self.errors.append({'line': line_num, 'errors': {'category': ['Категория не найдена.']}})
+                continue
+            # Повтор названия внутри пачки: побеждает последняя строка, как и при upsert.
+            products[data['name']] = Product(name=data['name'], proteins=data['proteins'], fats=data['fats'],
+                                             carbs=data['carbs'], category_id=category_id)
+
+        with transaction.atomic():
+            previous = {
+                name: (product_id, nutrients)
+                for product_id, name, *nutrients in Product.objects.filter(name__in=products).values_list(
+                    'id', 'name', *Product.NUTRIENT_FIELDS)
+            }
+            Product.objects.bulk_create(products.values(), update_conflicts=True, unique_fields=['name'],
+                                        update_fields=['proteins', 'fats', 'carbs', 'category'])
+            # Хранимые итоги приемов пищи и шаблонов с продуктами, у которых изменилось БЖУ.
+            changed_ids = [
+                product_id for name, (product_id, nutrients) in previous.items()
+                if nutrients != [getattr(products[name], field) for field in Product.NUTRIENT_FIELDS]
+            ]
+            if changed_ids:
+                Meal.schedule_refresh_totals(product_ids=changed_ids)
+                MealTemplate.refresh_totals_for_products(changed_ids)
+        # bulk_create без сигналов: версия каталога сбрасывается здесь.
+        cache.invalidate('products')
+        self.imported += len(products)
+
+    def resolve_categories(self, names):
+        missing = names - self.categories.keys()
+        if not missing:
+            return
+        for category_id, name in ProductCategory.objects.filter(name__in=missing).order_by('-id').values_list(
+                'id', 'name'):
+            self.categories[name] = category_id
+        if self.create_categories:
+            created = ProductCategory.objects.bulk_create(
+                ProductCategory(name=name) for name in missing - self.categories.keys()
+            )
+            self.categories.update((category.name, category.id) for category in created)
+            if created:
+                cache.invalidate('categories')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_rows(file_format, chunk_size=2000):
+    """Отдает каталог построчно, читая его из базы серверным курсором пачками по chunk_size."""
+    rows = Product.objects.order_by('id').values_list(
+        'name', 'proteins', 'fats', 'carbs', 'category__name'
+    ).iterator(chunk_size=chunk_size)
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
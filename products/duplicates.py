@@ -0,0 +1,156 @@
+"""
+Поиск и слияние дубликатов продуктов ("Гречка варёная" / "гречка вареная" / "Гречка отварная").
+
+Дубликаты - продукты с похожими нормализованными названиями (сходство Жаккара
+по триграммам, как у pg_trgm, и одинаковые числа в названии) и близкими БЖУ
+(евклидово расстояние в граммах на 100 г). Чтобы не сравнивать все пары, кандидаты отбираются блокировкой MinHash LSH:
+сравниваются только продукты, у которых совпала хотя бы одна полоса сигнатуры.
+Пары объединяются в кластеры по связности. Поиск запускает
+`manage.py find_duplicate_products`, сливает кластеры персонал в админке.
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from products.models import Meal, MealProduct, MealTemplate, MealTemplateItem, Product, ProductUsage
+
+NAME_SIMILARITY = 0.45
+MAX_DISTANCE = 5.0
+# 32 полосы по 3 хеша: пару со сходством 0.45 LSH находит с вероятностью ~0.95, 0.2 - ~0.23.
+BANDS = 32
+BAND_ROWS = 3
+# Полосы, совпавшие у слишком многих продуктов (очень короткие названия), пропускаются:
+# иначе сравнение внутри них снова становится квадратичным.
+MAX_BUCKET_SIZE = 100
+PRIME = 2 ** 31 - 1
+WORD = re.compile(r'[0-9a-zа-я]+')
+NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def normalize_name(name):
+    return ' '.join(WORD.findall(name.lower().replace('ё', 'е')))
+
+
+def trigrams(name):
+    """Триграммы слов нормализованного названия с отступами, как в pg_trgm."""
+    return {f'  {word} '[index:index + 3] for word in normalize_name(name).split()
+            for index in range(len(word) + 1)}
+
+
+def numbers(name):
+    return set(NUMBER.findall(name))
+
+
+def similarity(first, second):
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+
+def signatures(token_sets, seed=0):
+    """MinHash-сигнатуры (n, BANDS * BAND_ROWS) непустых множеств токенов."""
+    # Номера токенов не зависят от порядка обхода множеств (он меняется от запуска к запуску).
+    vocabulary = {}
+    tokens = np.fromiter((vocabulary.setdefault(token, len(vocabulary))
+                          for token_set in token_sets for token in sorted(token_set)), dtype=np.int64)
+    offsets = np.cumsum([0] + [len(token_set) for token_set in token_sets[:-1]])
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, BANDS * BAND_ROWS)
+    b = rng.integers(0, PRIME, BANDS * BAND_ROWS)
+    result = np.empty((len(token_sets), BANDS * BAND_ROWS), dtype=np.int64)
+    for column in range(BANDS * BAND_ROWS):
+        result[:, column] = np.minimum.reduceat((a[column] * tokens + b[column]) % PRIME, offsets)
+    return result
+
+
+def candidate_pairs(token_sets):
+    """
+    Пары индексов (first < second) с совпавшей полосой MinHash-сигнатуры - по массиву
+    (n, 2) на полосу; одна пара может прийти из нескольких полос.
+    """
+    count = len(token_sets)
+    if count < 2:
+        return
+    signature = signatures(token_sets).astype(np.uint64)
+    for band in range(BANDS):
+        rows = signature[:, band * BAND_ROWS:(band + 1) * BAND_ROWS]
+        # Хеш полосы; случайные совпадения дают только лишние кандидаты, которые отсеет проверка.
+        keys = rows[:, 0] * np.uint64(0x9E3779B97F4A7C15) ^ rows[:, 1] * np.uint64(0xC2B2AE3D27D4EB4F) ^ rows[:, 2]
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, count])
+        pairs = []
+        # Полосы одного размера разбираются вместе: матрица (полос, size) участников.
+        for size in np.unique(sizes[(sizes > 1) & (sizes <= MAX_BUCKET_SIZE)]):
+            members = np.sort(order[starts[sizes == size][:, None] + np.arange(size)], axis=1)
+            first, second = np.triu_indices(size, 1)
+            pairs.append(np.column_stack([members[:, first].ravel(), members[:, second].ravel()]))
+        if pairs:
+            yield np.concatenate(pairs)
+
+
+def find_clusters(rows, name_similarity=NAME_SIMILARITY, max_distance=MAX_DISTANCE):
+    """
+    Кластеры дубликатов среди rows [(id, название, белки, жиры, углеводы), ...]:
+    списки id по возрастанию, отсортированные по первому id.
+    """
+    rows = [row for row in rows if normalize_name(row[1])]
+    token_sets = [trigrams(row[1]) for row in rows]
+    nutrients = np.array([row[2:5] for row in rows], dtype=np.float64).reshape(-1, 3)
+
+    # Сначала дешевая векторная проверка БЖУ, затем сходство названий у оставшихся пар.
+    close = set()
+    for pairs in candidate_pairs(token_sets):
+        distances = np.linalg.norm(nutrients[pairs[:, 0]] - nutrients[pairs[:, 1]], axis=1)
+        close.update(map(tuple, pairs[distances <= max_distance].tolist()))
+
+    parent = list(range(len(rows)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    # Числа в названиях ("Молоко 2,5%" и "Молоко 3,2%") должны совпадать: это разные продукты.
+    number_sets = [numbers(row[1]) for row in rows]
+    for first, second in close:
+        if (number_sets[first] == number_sets[second]
+                and similarity(token_sets[first], token_sets[second]) >= name_similarity):
+            parent[root(second)] = root(first)
+
+    clusters = defaultdict(list)
+    for index, row in enumerate(rows):
+        clusters[root(index)].append(row[0])
+    return sorted(sorted(ids) for ids in clusters.values() if len(ids) > 1)
+
+
+def find_duplicates(name_similarity=NAME_SIMILARITY, max_distance=MAX_DISTANCE):
+    rows = Product.objects.values_list('id', 'name', *Product.NUTRIENT_FIELDS).iterator(chunk_size=10000)
+    return find_clusters(rows, name_similarity, max_distance)
+
+
+def merge_products(winner_id, product_ids):
+    """
+    Сливает продукты product_ids в winner_id: продукты приемов пищи и шаблонов переходят
+    на него одним UPDATE на таблицу, счетчики недавних продуктов складываются, остальные
+    продукты удаляются, итоги затронутых приемов пищи и шаблонов пересчитываются.
+    Возвращает число перенесенных строк MealProduct.
+    """
+    losers = set(product_ids) - {winner_id}
+    with transaction.atomic():
+        winner = Product.objects.select_for_update().get(pk=winner_id)
+        meal_products = MealProduct.objects.filter(product_id__in=losers)
+        meal_ids = list(meal_products.values_list('meal_id', flat=True).distinct())
+        moved = meal_products.update(product=winner)
+        template_items = MealTemplateItem.objects.filter(product_id__in=losers)
+        template_ids = list(template_items.values_list('template_id', flat=True).distinct())
+        template_items.update(product=winner)
+        ProductUsage.merge(losers, winner.id)
+        Product.objects.filter(id__in=losers).delete()
+        if meal_ids:
+            Meal.schedule_refresh_totals(meal_ids=meal_ids)
+        if template_ids:
+            MealTemplate.refresh_totals(template_ids)
+    return moved
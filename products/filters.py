@@ -0,0 +1,15 @@
+from rest_framework.filters import BaseFilterBackend
+
+from products.serializers import ProductFilterSerializer
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """Фильтры ?calories__lte=, ?proteins__gte=, ?category=<название> для списка продуктов."""
+
+    def filter_queryset(self, request, queryset, view):
+        serializer = ProductFilterSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        if 'category' in filters:
+            filters['category__name'] = filters.pop('category')
+        return queryset.filter(**filters)
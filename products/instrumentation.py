@@ -0,0 +1,187 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from products import cache
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=('view', 'method')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self.samples = defaultdict(lambda: {'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0})
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            sample = self.samples[label_values]
+            sample['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            samples = sorted(self.samples.items())
+            for label_values, sample in samples:
+                labels = ','.join(f'{label}="{value}"' for label, value in zip(self.labels, label_values))
+                cumulative = 0
+                for bound, bucket in zip((*self.buckets, '+Inf'), sample['buckets']):
+                    cumulative += bucket
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{labels}}} {sample["sum"]}')
+                lines.append(f'{self.name}_count{{{labels}}} {sample["count"]}')
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Время обработки запроса.', DURATION_BUCKETS)
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'Количество SQL-запросов за HTTP-запрос.', QUERY_BUCKETS)
+REQUEST_DB_DURATION = Histogram('http_request_db_duration_seconds', 'Суммарное время SQL-запросов за HTTP-запрос.',
+                                DURATION_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_DURATION)
+
+
+class QueryTimer:
+    """execute_wrapper, считающий запросы и их время и логирующий медленные запросы."""
+
+    def __init__(self, view_name):
+        self.view_name = view_name
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                logger.warning('Медленный запрос (%.1f мс) в %s: %s', duration * 1000, self.view_name(), sql)
+
+
+_current_timer = contextvars.ContextVar('query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    # Таймер текущего запроса берется из contextvar: под ASGI SQL выполняется в
+    # потоках sync_to_async, куда контекст копируется, а соединения - нет.
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def install_query_timer_on_connect(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+def get_view_name(view_func, method):
+    """Имя обработчика для меток: MealViewSet.list, ProductViewSet.retrieve, CatalogueCacheStatsView..."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    actions = getattr(view_func, 'actions', None)
+    if actions and method.lower() in actions:
+        return f'{view_class.__name__}.{actions[method.lower()]}'
+    return view_class.__name__
+
+
+def request_view_name(request):
+    # resolver_match заполняется до вызова представления; без process_view
+    # middleware не требует перехода в поток в асинхронной цепочке.
+    match = getattr(request, 'resolver_match', None)
+    return get_view_name(match.func, request.method) if match is not None else 'unmatched'
+
+
+class InstrumentationMiddleware:
+    """
+    Замеряет время запроса, количество и время SQL-запросов, добавляет
+    заголовок Server-Timing и копит гистограммы для /metrics.
+    Работает и под WSGI, и под ASGI, не переводя асинхронные запросы в потоки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Соединения, открытые до загрузки модуля (например, в тестах), сигнала не получили.
+        for connection in connections.all():
+            install_query_timer(connection)
+        timer, started, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer, started)
+
+    async def __acall__(self, request):
+        timer, started, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.finish(request, response, timer, started)
+
+    @staticmethod
+    def start(request):
+        timer = QueryTimer(lambda: request_view_name(request))
+        return timer, time.perf_counter(), _current_timer.set(timer)
+
+    @staticmethod
+    def finish(request, response, timer, started):
+        duration = time.perf_counter() - started
+        labels = (request_view_name(request), request.method)
+        REQUEST_DURATION.observe(labels, duration)
+        REQUEST_QUERIES.observe(labels, timer.count)
+        REQUEST_DB_DURATION.observe(labels, timer.duration)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+        )
+        return response
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    stats = cache.get_stats()
+    lines.extend(['# HELP catalogue_cache_requests_total Ответы кеша каталога.',
+                  '# TYPE catalogue_cache_requests_total counter'])
+    lines.extend(f'catalogue_cache_requests_total{{result="{stat}"}} {stats[stat]}' for stat in cache.STATS)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,186 @@
+"""
+Очередь фоновых задач в Postgres (модель Job).
+
+Задача ставится в очередь enqueue() в той же транзакции, что и изменение, которое
+ее породило: если транзакция откатится, задачи тоже не будет. Воркеры
+(`manage.py run_workers`) забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED,
+поэтому несколько процессов не получают одну и ту же задачу и не ждут друг друга.
+Упавшая задача возвращается в очередь с экспоненциальной задержкой, пока не
+исчерпает max_attempts.
+"""
+import contextlib
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрирует функцию func(payload) как задачу типа name; ее результат сохраняется в Job.result."""
+    def register(func):
+        TASKS[name] = func
+        return func
+
+    return register
+
+
+def enqueue(kind, payload=None, user=None, delay=0, max_attempts=None):
+    if kind not in TASKS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}.')
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        user=user,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def run_now(kind, payload=None, user=None):
+    """
+    Выполняет задачу сразу в этом процессе без повторов и сохраняет ее, как сохранил
+    бы воркер: результат виден там же, где результаты фоновых задач. Возвращает Job.
+    """
+    now = timezone.now()
+    job = Job.objects.create(kind=kind, payload=payload or {}, user=user, status=Job.RUNNING, attempts=1,
+                             max_attempts=1, run_after=now, started_at=now, heartbeat_at=now, worker=worker_name())
+    execute(job)
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker=None):
+    """Забирает следующую готовую задачу и помечает ее выполняемой; None, если очередь пуста."""
+    with transaction.atomic():
+        job = (Job.objects.select_for_update(skip_locked=True)
+               .filter(status=Job.QUEUED, run_after__lte=timezone.now())
+               .order_by('run_after', 'id').first())
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.finished_at = None
+        job.worker = worker or worker_name()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at', 'finished_at', 'worker'])
+    return job
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка перед повтором со случайным разбросом, чтобы повторы не шли пачкой."""
+    delay = min(settings.JOBS_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+
+@contextlib.contextmanager
+def heartbeat(job):
+    """
+    Пока выполняется тело with, отдельный поток раз в JOBS_HEARTBEAT_SECONDS
+    обновляет heartbeat_at задачи: по нему requeue_stale отличает долгую задачу
+    от пропавшего воркера.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.JOBS_HEARTBEAT_SECONDS):
+                try:
+                    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.exception('Не удалось обновить heartbeat задачи %s', job)
+        finally:
+            # Соединения Django у каждого потока свои; закрываются соединения этого потока.
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def execute(job):
+    try:
+        with heartbeat(job):
+            result = TASKS[job.kind](job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        job.finished_at = timezone.now()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = job.finished_at + timedelta(seconds=retry_delay(job.attempts))
+            logger.warning('Задача %s упала (попытка %s из %s), повтор после %s',
+                           job, job.attempts, job.max_attempts, job.run_after)
+        else:
+            job.status = Job.FAILED
+            logger.error('Задача %s упала после %s попыток:\n%s', job, job.attempts, job.error)
+        job.save(update_fields=['status', 'run_after', 'finished_at', 'error'])
+        return False
+    job.status = Job.SUCCEEDED
+    job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'finished_at'])
+    return True
+
+
+def requeue_stale():
+    """
+    Возвращает в очередь задачи, чей воркер пропал (не подавал сигнала дольше
+    JOBS_STALE_SECONDS); задачи без оставшихся попыток помечает упавшими.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING,
+                               heartbeat_at__lt=now - timedelta(seconds=settings.JOBS_STALE_SECONDS))
+    error = 'Воркер не завершил задачу.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, finished_at=now, error=error)
+    return failed + stale.update(status=Job.QUEUED, run_after=now, error=error)
+
+
+def run_pending(limit=None, worker=None):
+    """Выполняет готовые задачи, пока очередь не опустеет (или limit задач); возвращает их число."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        execute(job)
+        count += 1
+    return count
+
+
+def prune(finished_before):
+    """
+    Удаляет завершенные задачи, закончившиеся раньше finished_before, вместе с их
+    файлами в хранилище (выгрузки в result, неудачно загруженные файлы импорта в payload).
+    Возвращает число удаленных задач.
+    """
+    finished = Job.objects.filter(status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=finished_before)
+    count = 0
+    for job in finished.only('id', 'payload', 'result').iterator():
+        for data in (job.payload, job.result):
+            name = data.get('file') if isinstance(data, dict) else None
+            if name and default_storage.exists(name):
+                default_storage.delete(name)
+        job.delete()
+        count += 1
+    return count
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import duplicates, jobs
+from products.models import Job, Product
+
+
+class Command(BaseCommand):
+    help = ('Ищет кластеры дубликатов продуктов по сходству названий и БЖУ (products.duplicates). '
+            'Слить кластеры можно в админке: Продукты -> Дубликаты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name-similarity', type=float, default=duplicates.NAME_SIMILARITY,
+                            help='Минимальное сходство нормализованных названий (0-1).')
+        parser.add_argument('--max-distance', type=float, default=duplicates.MAX_DISTANCE,
+                            help='Максимальное расстояние между БЖУ продуктов, г на 100 г.')
+        parser.add_argument('--background', action='store_true',
+                            help='Поставить поиск в очередь фоновых задач (manage.py run_workers) '
+                                 'вместо выполнения сразу.')
+
+    def handle(self, *args, name_similarity, max_distance, background, **options):
+        payload = {'name_similarity': name_similarity, 'max_distance': max_distance}
+        if background:
+            job = jobs.enqueue('find_duplicate_products', payload)
+            self.stdout.write(self.style.SUCCESS(f'Поиск поставлен в очередь, задача #{job.id}.'))
+            return
+
+        # Результат сохраняется как у фоновой задачи, чтобы его показала админка.
+        job = jobs.run_now('find_duplicate_products', payload)
+        if job.status != Job.SUCCEEDED:
+            raise CommandError(job.error)
+        clusters = job.result['clusters']
+        products = Product.objects.in_bulk([product_id for cluster in clusters for product_id in cluster])
+        for cluster in clusters:
+            self.stdout.write(' | '.join(
+                f'#{product.id} {product.name} ({product.proteins}/{product.fats}/{product.carbs})'
+                for product in (products[product_id] for product_id in cluster)
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Найдено кластеров: {len(clusters)}.'))
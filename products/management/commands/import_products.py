@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalogue import FORMATS, ProductImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Загружает каталог продуктов из CSV или JSONL файла (upsert по названию).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с продуктами.')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла, по умолчанию определяется по расширению.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Количество строк в одной пачке.')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Создавать отсутствующие категории вместо отклонения строк.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        importer = ProductImporter(chunk_size=options['chunk_size'], create_categories=options['create_categories'])
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as lines:
+                importer.run(read_rows(lines, file_format))
+        except OSError as error:
+            raise CommandError(error)
+        except UnicodeDecodeError:
+            raise CommandError(f'Файл должен быть в кодировке UTF-8; загружено продуктов до ошибки: '
+                               f'{importer.imported}.')
+
+        for error in importer.errors:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено продуктов: {importer.imported}, отклонено строк: {len(importer.errors)}.'
+        ))
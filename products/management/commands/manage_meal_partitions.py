@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products import partitions
+
+
+class Command(BaseCommand):
+    help = ('Создает помесячные секции приемов пищи на месяцы вперед и отсоединяет секции старше '
+            'заданного срока (products.partitions). Запускать по расписанию, например раз в день.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='На сколько месяцев после текущего заранее создать секции.')
+        parser.add_argument('--detach-older-than', type=int, metavar='MONTHS',
+                            help='Отсоединить секции месяцев, закончившихся больше MONTHS месяцев назад. '
+                                 'Их приемы пищи пропадают из приложения, итоги дней (DailyNutrition) остаются.')
+        parser.add_argument('--archive-schema', default='archive',
+                            help='Схема для отсоединенных секций; пустая строка - оставить их в public.')
+
+    def handle(self, *args, months_ahead, detach_older_than, archive_schema, **options):
+        this_month = partitions.month_start(timezone.localdate())
+        blocked = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            existing = partitions.list_partitions(cursor, 'products_meal')
+            for month in partitions.month_range(this_month, partitions.add_months(this_month, months_ahead)):
+                if month in existing:
+                    continue
+                if partitions.default_has_rows(cursor, month):
+                    # Postgres не создаст секцию, пока строки ее диапазона лежат в секции по умолчанию.
+                    blocked.append(month)
+                    continue
+                partitions.create_partitions(cursor, month)
+                self.stdout.write(f'Созданы секции {month:%Y-%m}.')
+
+            if detach_older_than is not None:
+                cutoff = partitions.add_months(this_month, -detach_older_than)
+                for month in sorted(existing):
+                    if month >= cutoff:
+                        break
+                    partitions.detach_partitions(cursor, month, archive_schema)
+                    self.stdout.write(f'Отсоединены секции {month:%Y-%m}' +
+                                      (f' (схема {archive_schema}).' if archive_schema else '.'))
+
+        if blocked:
+            raise CommandError(
+                'Приемы пищи за ' + ', '.join(f'{month:%Y-%m}' for month in blocked) + ' лежат в секции по '
+                'умолчанию (products_meal_default); перенесите их, прежде чем создавать секции этих месяцев.'
+            )
+        self.stdout.write(self.style.SUCCESS('Готово.'))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products import jobs
+
+
+class Command(BaseCommand):
+    help = ('Удаляет завершенные фоновые задачи старше заданного срока вместе с их файлами '
+            '(выгрузки каталога, файлы импорта). Запускать по расписанию, например раз в день.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.JOBS_KEEP_DAYS,
+                            help='Удалить задачи, завершившиеся больше DAYS дней назад.')
+
+    def handle(self, *args, days, **options):
+        count = jobs.prune(timezone.now() - timedelta(days=days))
+        self.stdout.write(f'Удалено задач: {count}.')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products import jobs
+from products.models import DailyNutrition
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу итогов по дням (DailyNutrition) с нуля.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DailyNutrition.REBUILD_BATCH_SIZE,
+                            help='Количество пользователей, обрабатываемых за одну транзакцию.')
+        parser.add_argument('--background', action='store_true',
+                            help='Поставить пересчет в очередь фоновых задач (manage.py run_workers).')
+
+    def handle(self, *args, batch_size, background, **options):
+        if background:
+            job = jobs.enqueue('rebuild_nutrition_rollup', {'batch_size': batch_size})
+            self.stdout.write(self.style.SUCCESS(f'Пересчет поставлен в очередь, задача #{job.id}.'))
+            return
+
+        def progress(done, total):
+            self.stdout.write(f'Обработано пользователей: {done}/{total}')
+
+        rows = DailyNutrition.rebuild(batch_size, progress)
+        self.stdout.write(self.style.SUCCESS(f'Итоги пересчитаны, записей: {rows}.'))
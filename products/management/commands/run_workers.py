@@ -0,0 +1,92 @@
+import contextlib
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from products import jobs
+
+logger = logging.getLogger('products.jobs')
+
+STALE_CHECK_SECONDS = 60
+
+
+def work(poll_interval, burst, stop):
+    """Цикл воркера: забирает задачи по одной, пока не будет установлен stop."""
+    worker = jobs.worker_name()
+    stale_checked = 0
+    while not stop.is_set():
+        # Как после запроса: закрывает соединения старше CONN_MAX_AGE и неисправные.
+        close_old_connections()
+        try:
+            if time.monotonic() - stale_checked > STALE_CHECK_SECONDS:
+                jobs.requeue_stale()
+                stale_checked = time.monotonic()
+            if jobs.run_pending(limit=1, worker=worker):
+                continue
+        except DatabaseError:
+            logger.exception('Воркер %s потерял соединение с базой', worker)
+            connections.close_all()
+        if burst:
+            break
+        stop.wait(poll_interval)
+
+
+def child(poll_interval, burst, stop):
+    # Ctrl+C приходит всей группе процессов; дочерние процессы завершаются по stop
+    # после текущей задачи, а не посреди нее.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    work(poll_interval, burst, stop)
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач (products.jobs).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Количество процессов-воркеров; 1 - выполнять задачи в текущем процессе.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между проверками пустой очереди, секунд.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Выполнить готовые задачи и завершиться, не дожидаясь новых.')
+
+    def handle(self, *args, concurrency, poll_interval, burst, **options):
+        if concurrency <= 1:
+            stop = threading.Event()
+            with self.stop_on_signals(stop):
+                self.stdout.write('Воркер запущен.')
+                work(poll_interval, burst, stop)
+            return
+
+        # Дочерним процессам нужны свои соединения с базой, а не копии родительских.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [
+            context.Process(target=child, args=(poll_interval, burst, stop), name=f'worker-{number}')
+            for number in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        with self.stop_on_signals(stop):
+            self.stdout.write(f'Запущено воркеров: {concurrency}.')
+            for process in processes:
+                process.join()
+
+    @contextlib.contextmanager
+    def stop_on_signals(self, stop):
+        def handler(signum, frame):
+            self.stdout.write('Остановка после текущих задач...')
+            stop.set()
+
+        previous = {signum: signal.signal(signum, handler) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            yield
+        finally:
+            for signum, previous_handler in previous.items():
+                signal.signal(signum, previous_handler)
@@ -0,0 +1,157 @@
+import datetime
+import itertools
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products import cache, partitions
+from products.models import Meal, MealProduct, Product, ProductCategory, User
+
+# Средние БЖУ на 100 г по категориям; значения продуктов разбрасываются вокруг них.
+CATEGORY_PROFILES = (
+    ('Мясо', 20, 12, 0),
+    ('Рыба', 19, 7, 0),
+    ('Молочные продукты', 6, 5, 5),
+    ('Крупы', 11, 2, 65),
+    ('Овощи', 2, 0, 5),
+    ('Фрукты', 1, 0, 12),
+    ('Орехи', 18, 50, 15),
+    ('Хлеб', 8, 3, 48),
+    ('Сладости', 5, 20, 60),
+    ('Напитки', 1, 0, 10),
+)
+# Название приема пищи, его доля и часы, в которые он обычно бывает.
+MEAL_TIMES = (('Завтрак', 0.3, (7, 10)), ('Обед', 0.4, (12, 15)), ('Ужин', 0.3, (18, 21)))
+USERNAME_PREFIX = 'bench_'
+
+
+def portion(rng):
+    # Вес порции - логнормальный с медианой около 120 г.
+    return round(min(max(rng.lognormvariate(4.8, 0.6), 5), 1000), 1)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, каталогом и приемами пищи для нагрузочных тестов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=len(CATEGORY_PROFILES))
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--meals-per-user', type=int, default=100,
+                            help='Среднее число приемов пищи на пользователя (распределение с длинным хвостом).')
+        parser.add_argument('--days', type=int, default=90, help='За сколько последних дней создаются приемы пищи.')
+        parser.add_argument('--password', default='benchmark', help='Пароль всех созданных пользователей.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество строк в одном INSERT.')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Данные для нагрузочных тестов уже есть в базе; запустите команду на пустой базе.')
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            categories = self.create_categories(options['categories'])
+            products = self.create_products(rng, categories, options['products'], batch_size)
+            users = self.create_users(rng, options['users'], options['password'], batch_size)
+        cache.invalidate('categories')
+        cache.invalidate('products')
+        self.stdout.write(f'Создано категорий: {len(categories)}, продуктов: {len(products)}, '
+                          f'пользователей: {len(users)}')
+
+        self.create_partitions(options['days'])
+        # Популярность продуктов по закону Ципфа: несколько продуктов едят часто, большинство - редко.
+        product_ids = [product.id for product in products]
+        rng.shuffle(product_ids)
+        popularity = list(itertools.accumulate(1 / rank ** 1.1 for rank in range(1, len(product_ids) + 1)))
+        meals = meal_products = 0
+        for start in range(0, len(users), 100):
+            chunk = users[start:start + 100]
+            with transaction.atomic():
+                created, items = self.create_meals(rng, chunk, product_ids, popularity, options, batch_size)
+            meals += created
+            meal_products += items
+            self.stdout.write(f'Обработано пользователей: {start + len(chunk)}/{len(users)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано приемов пищи: {meals}, продуктов в них: {meal_products}.'
+        ))
+
+    def create_categories(self, count):
+        names = [
+            name if number < len(CATEGORY_PROFILES) else f'{name} {number // len(CATEGORY_PROFILES) + 1}'
+            for number, (name, *_) in zip(range(count), itertools.cycle(CATEGORY_PROFILES))
+        ]
+        return ProductCategory.objects.bulk_create(ProductCategory(name=name) for name in names)
+
+    def create_products(self, rng, categories, count, batch_size):
+        profiles = itertools.cycle(CATEGORY_PROFILES)
+        category_profiles = [(category, next(profiles)[1:]) for category in categories]
+
+        def product(number):
+            category, means = rng.choice(category_profiles)
+            proteins, fats, carbs = (max(0, round(rng.gauss(mean, mean * 0.3 + 1))) for mean in means)
+            # БЖУ на 100 г в сумме не больше 100 г, и каждое - в пределах валидатора.
+            scale = min(1, 99 / max(proteins + fats + carbs, 1))
+            return Product(name=f'{category.name} {number}', proteins=int(proteins * scale), fats=int(fats * scale),
+                           carbs=int(carbs * scale), category=category)
+
+        return Product.objects.bulk_create((product(number) for number in range(1, count + 1)),
+                                           batch_size=batch_size)
+
+    def create_users(self, rng, count, password, batch_size):
+        password = make_password(password)
+        today = timezone.localdate()
+
+        def user(number):
+            sex = rng.choice(('М', 'Ж'))
+            height = round(rng.gauss(178 if sex == 'М' else 165, 7))
+            return User(
+                username=f'{USERNAME_PREFIX}{number}', password=password, sex=sex, height=height,
+                weight=round(max(40.0, rng.gauss((height - 100) * 0.95, 12)), 1),
+                birth_date=today - datetime.timedelta(days=rng.randint(18 * 365, 70 * 365)),
+                activity_level=rng.choice(('minimal', 'light', 'moderate', 'moderate', 'high', 'extreme')),
+            )
+
+        return User.objects.bulk_create((user(number) for number in range(1, count + 1)), batch_size=batch_size)
+
+    def create_partitions(self, days):
+        """Секции месяцев, за которые создаются приемы пищи; без них строки легли бы в секцию по умолчанию."""
+        today = timezone.localdate()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for month in partitions.month_range(today - datetime.timedelta(days=max(days, 1) - 1), today):
+                if partitions.default_has_rows(cursor, month):
+                    self.stderr.write(self.style.WARNING(
+                        f'Секции {month:%Y-%m} не созданы: приемы пищи этого месяца уже лежат в секции по умолчанию.'
+                    ))
+                elif partitions.create_partitions(cursor, month):
+                    self.stdout.write(f'Созданы секции {month:%Y-%m}.')
+
+    def create_meals(self, rng, users, product_ids, popularity, options, batch_size):
+        now = timezone.localtime()
+        mean = max(options['meals_per_user'], 1)
+        sigma = 0.8
+        meal_shares = [share for _, share, _ in MEAL_TIMES]
+        meals = []
+        for user in users:
+            # Логнормальное число приемов пищи: у большинства около среднего, у немногих - в разы больше.
+            count = max(1, round(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)))
+            for _ in range(count):
+                name, _, (first_hour, last_hour) = rng.choices(MEAL_TIMES, weights=meal_shares)[0]
+                day = now - datetime.timedelta(days=rng.randrange(max(options['days'], 1)))
+                created_at = day.replace(hour=rng.randint(first_hour, last_hour - 1), minute=rng.randrange(60))
+                meals.append(Meal(user=user, name=name, created_at=min(created_at, now)))
+        meals = Meal.objects.bulk_create(meals, batch_size=batch_size)
+
+        items = [
+            MealProduct(meal=meal, product_id=product_id, weight=portion(rng))
+            for meal in meals
+            for product_id in rng.choices(product_ids, cum_weights=popularity,
+                                          k=min(8, max(1, round(rng.gauss(3, 1.3)))))
+        ]
+        MealProduct.objects.bulk_create(items, batch_size=batch_size)
+        Meal.refresh_totals(meal.id for meal in meals)
+        return len(meals), len(items)
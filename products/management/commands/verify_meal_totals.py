@@ -0,0 +1,49 @@
+from functools import reduce
+import operator
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Abs
+
+from products.models import Meal
+
+TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = 'Сверяет хранимые итоги приемов пищи (Meal.total_*) с продуктами и исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=Meal.REFRESH_BATCH_SIZE,
+                            help='Количество приемов пищи, проверяемых за один запрос.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать расхождения, не исправляя их.')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        drifted = reduce(operator.or_, (
+            Q(**{f'{nutrient}_drift__gt': TOLERANCE}) for nutrient in Meal.TOTAL_NUTRIENTS
+        ))
+        meal_ids = list(Meal.objects.order_by('id').values_list('id', flat=True))
+        mismatched = []
+        for start in range(0, len(meal_ids), batch_size):
+            batch = meal_ids[start:start + batch_size]
+            found = list(
+                Meal.objects.filter(id__in=batch).with_totals().alias(**{
+                    f'{nutrient}_drift': Abs(F(f'total_{nutrient}') - F(f'{nutrient}_sum'))
+                    for nutrient in Meal.TOTAL_NUTRIENTS
+                }).filter(drifted).order_by('id').values_list('id', flat=True)
+            )
+            if found and not dry_run:
+                with transaction.atomic():
+                    Meal.refresh_totals(found)
+            mismatched.extend(found)
+            self.stdout.write(f'Проверено приемов пищи: {start + len(batch)}/{len(meal_ids)}')
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'Расхождений: {len(mismatched)} (id: {", ".join(map(str, mismatched[:20]))}).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено приемов пищи: {len(mismatched)}.'))
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.15 on 2026-10-18 18:39
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='meal',
+            name='weight',
+        ),
+        migrations.RemoveField(
+            model_name='meal',
+            name='products',
+        ),
+        migrations.AlterField(
+            model_name='meal',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='carbs',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99)], verbose_name='Углеводы'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='fats',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99)], verbose_name='Жиры'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='proteins',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99)], verbose_name='Белки'),
+        ),
+        migrations.AlterField(
+            model_name='productcategory',
+            name='name',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.CreateModel(
+            name='MealProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_products', to='products.meal')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='products',
+            field=models.ManyToManyField(through='products.MealProduct', to='products.product'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.15 on 2026-10-18 18:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_meal_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время приема пищи'),
+        ),
+        migrations.CreateModel(
+            name='DailyNutrition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('proteins', models.FloatField(default=0, verbose_name='Белки')),
+                ('fats', models.FloatField(default=0, verbose_name='Жиры')),
+                ('carbs', models.FloatField(default=0, verbose_name='Углеводы')),
+                ('calories', models.FloatField(default=0, verbose_name='Калории')),
+                ('meals_count', models.PositiveIntegerField(default=0, verbose_name='Приемов пищи')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_nutrition', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итоги дня',
+                'verbose_name_plural': 'Итоги дней',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailynutrition',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_nutrition'),
+        ),
+    ]
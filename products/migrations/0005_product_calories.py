@@ -0,0 +1,44 @@
+# Generated by Django 4.2.15 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+CREATE_CALORIES_TRIGGER = '''
+CREATE FUNCTION products_product_set_calories() RETURNS trigger AS $$
+BEGIN
+    NEW.calories := (NEW.carbs + NEW.proteins) * 4 + NEW.fats * 9;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_calories
+    BEFORE INSERT OR UPDATE ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_set_calories();
+
+UPDATE products_product SET calories = (carbs + proteins) * 4 + fats * 9;
+'''
+
+DROP_CALORIES_TRIGGER = '''
+DROP TRIGGER products_product_calories ON products_product;
+DROP FUNCTION products_product_set_calories();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='calories',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Калории'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['proteins'], name='product_proteins_idx'),
+        ),
+        migrations.RunSQL(CREATE_CALORIES_TRIGGER, DROP_CALORIES_TRIGGER),
+    ]
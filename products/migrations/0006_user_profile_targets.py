@@ -0,0 +1,28 @@
+# Generated by Django 4.2.15 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_calories'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='activity_level',
+            field=models.CharField(choices=[('minimal', 'Минимальный'), ('light', 'Низкий'), ('moderate', 'Средний'), ('high', 'Высокий'), ('extreme', 'Очень высокий')], default='moderate', max_length=10, verbose_name='Уровень активности'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='birth_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Дата рождения'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='weight',
+            field=models.DecimalField(decimal_places=1, max_digits=4, null=True, verbose_name='Вес'),
+        ),
+    ]
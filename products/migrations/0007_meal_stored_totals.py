@@ -0,0 +1,53 @@
+# Generated by Django 4.2.15 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+BACKFILL_MEAL_TOTALS = '''
+UPDATE products_meal AS meal
+SET total_proteins = totals.proteins,
+    total_fats = totals.fats,
+    total_carbs = totals.carbs,
+    total_calories = totals.calories
+FROM (
+    SELECT meal_product.meal_id,
+           SUM(product.proteins * meal_product.weight / 100.0) AS proteins,
+           SUM(product.fats * meal_product.weight / 100.0) AS fats,
+           SUM(product.carbs * meal_product.weight / 100.0) AS carbs,
+           SUM(product.calories * meal_product.weight / 100.0) AS calories
+    FROM products_mealproduct AS meal_product
+    JOIN products_product AS product ON product.id = meal_product.product_id
+    GROUP BY meal_product.meal_id
+) AS totals
+WHERE meal.id = totals.meal_id;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_user_profile_targets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='total_calories',
+            field=models.FloatField(default=0, editable=False, verbose_name='Калории'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_carbs',
+            field=models.FloatField(default=0, editable=False, verbose_name='Углеводы'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_fats',
+            field=models.FloatField(default=0, editable=False, verbose_name='Жиры'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='total_proteins',
+            field=models.FloatField(default=0, editable=False, verbose_name='Белки'),
+        ),
+        migrations.RunSQL(BACKFILL_MEAL_TOTALS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.15 on 2026-10-18 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_meal_stored_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meal',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='meals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='mealproduct',
+            name='meal',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='meal_products', to='products.meal'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='products.productcategory', verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='meal_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealproduct',
+            index=models.Index(fields=['meal', 'product'], include=('weight',), name='mealproduct_meal_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+        ),
+    ]
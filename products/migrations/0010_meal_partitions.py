@@ -0,0 +1,173 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+from products import partitions
+
+# Таблицы пересоздаются секционированными: первичный ключ секционированной
+# таблицы должен включать ключ секционирования, а identity-столбцы в них
+# поддерживаются только с Postgres 17, поэтому id берется из обычной
+# последовательности. Внешний ключ продуктов на прием пищи составной
+# (meal_id, meal_created_at) с ON UPDATE CASCADE: при переносе приема пищи
+# в другой месяц его продукты переезжают в секцию того же месяца.
+CREATE_PARTITIONED_TABLES = '''
+ALTER TABLE products_mealproduct RENAME TO products_mealproduct_unpartitioned;
+ALTER TABLE products_meal RENAME TO products_meal_unpartitioned;
+ALTER INDEX products_meal_pkey RENAME TO products_meal_unpartitioned_pkey;
+ALTER INDEX products_mealproduct_pkey RENAME TO products_mealproduct_unpartitioned_pkey;
+ALTER INDEX meal_user_created_idx RENAME TO meal_user_created_unpartitioned_idx;
+ALTER INDEX mealproduct_meal_product_idx RENAME TO mealproduct_meal_product_unpartitioned_idx;
+ALTER INDEX products_mealproduct_product_id_0415db7f RENAME TO products_mealproduct_product_id_unpartitioned;
+
+CREATE TABLE products_meal (
+    id bigint NOT NULL,
+    name varchar(10) NULL,
+    user_id bigint NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    total_calories double precision NOT NULL,
+    total_carbs double precision NOT NULL,
+    total_fats double precision NOT NULL,
+    total_proteins double precision NOT NULL,
+    CONSTRAINT products_meal_pkey PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE products_mealproduct (
+    id bigint NOT NULL,
+    weight double precision NOT NULL,
+    meal_id bigint NOT NULL,
+    product_id bigint NOT NULL,
+    meal_created_at timestamp with time zone NOT NULL,
+    CONSTRAINT products_mealproduct_pkey PRIMARY KEY (id, meal_created_at)
+) PARTITION BY RANGE (meal_created_at);
+'''
+
+COPY_ROWS = '''
+INSERT INTO products_meal (id, name, user_id, created_at, total_calories, total_carbs, total_fats, total_proteins)
+SELECT id, name, user_id, created_at, total_calories, total_carbs, total_fats, total_proteins
+FROM products_meal_unpartitioned;
+
+INSERT INTO products_mealproduct (id, weight, meal_id, product_id, meal_created_at)
+SELECT meal_product.id, meal_product.weight, meal_product.meal_id, meal_product.product_id, meal.created_at
+FROM products_mealproduct_unpartitioned AS meal_product
+JOIN products_meal_unpartitioned AS meal ON meal.id = meal_product.meal_id;
+
+DROP TABLE products_mealproduct_unpartitioned, products_meal_unpartitioned;
+
+CREATE SEQUENCE products_meal_id_seq OWNED BY products_meal.id;
+SELECT setval('products_meal_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM products_meal;
+ALTER TABLE products_meal ALTER COLUMN id SET DEFAULT nextval('products_meal_id_seq');
+CREATE SEQUENCE products_mealproduct_id_seq OWNED BY products_mealproduct.id;
+SELECT setval('products_mealproduct_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM products_mealproduct;
+ALTER TABLE products_mealproduct ALTER COLUMN id SET DEFAULT nextval('products_mealproduct_id_seq');
+
+CREATE INDEX meal_user_created_idx ON products_meal (user_id, created_at, id);
+CREATE INDEX mealproduct_meal_product_idx ON products_mealproduct (meal_id, product_id) INCLUDE (weight);
+CREATE INDEX products_mealproduct_product_id_0415db7f ON products_mealproduct (product_id);
+
+ALTER TABLE products_meal ADD CONSTRAINT products_meal_user_id_128a316c_fk_products_user_id
+    FOREIGN KEY (user_id) REFERENCES products_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE products_mealproduct ADD CONSTRAINT products_mealproduct_product_id_0415db7f_fk_products_product_id
+    FOREIGN KEY (product_id) REFERENCES products_product (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE products_mealproduct ADD CONSTRAINT products_mealproduct_meal_fk
+    FOREIGN KEY (meal_id, meal_created_at) REFERENCES products_meal (id, created_at)
+    ON UPDATE CASCADE ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED;
+'''
+
+# Обратно - в обычные таблицы; отсоединенные секции в них не возвращаются.
+UNPARTITION_TABLES = '''
+ALTER TABLE products_mealproduct RENAME TO products_mealproduct_partitioned;
+ALTER TABLE products_meal RENAME TO products_meal_partitioned;
+ALTER INDEX products_meal_pkey RENAME TO products_meal_partitioned_pkey;
+ALTER INDEX products_mealproduct_pkey RENAME TO products_mealproduct_partitioned_pkey;
+ALTER INDEX meal_user_created_idx RENAME TO meal_user_created_partitioned_idx;
+ALTER INDEX mealproduct_meal_product_idx RENAME TO mealproduct_meal_product_partitioned_idx;
+ALTER INDEX products_mealproduct_product_id_0415db7f RENAME TO products_mealproduct_product_id_partitioned;
+ALTER SEQUENCE products_meal_id_seq RENAME TO products_meal_partitioned_id_seq;
+ALTER SEQUENCE products_mealproduct_id_seq RENAME TO products_mealproduct_partitioned_id_seq;
+
+CREATE TABLE products_meal (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name varchar(10) NULL,
+    user_id bigint NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    total_calories double precision NOT NULL,
+    total_carbs double precision NOT NULL,
+    total_fats double precision NOT NULL,
+    total_proteins double precision NOT NULL
+);
+CREATE TABLE products_mealproduct (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    weight double precision NOT NULL,
+    meal_id bigint NOT NULL,
+    product_id bigint NOT NULL
+);
+
+INSERT INTO products_meal (id, name, user_id, created_at, total_calories, total_carbs, total_fats, total_proteins)
+SELECT id, name, user_id, created_at, total_calories, total_carbs, total_fats, total_proteins
+FROM products_meal_partitioned;
+INSERT INTO products_mealproduct (id, weight, meal_id, product_id)
+SELECT id, weight, meal_id, product_id FROM products_mealproduct_partitioned;
+SELECT setval(pg_get_serial_sequence('products_meal', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM products_meal;
+SELECT setval(pg_get_serial_sequence('products_mealproduct', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM products_mealproduct;
+
+DROP TABLE products_mealproduct_partitioned, products_meal_partitioned;
+
+CREATE INDEX meal_user_created_idx ON products_meal (user_id, created_at, id);
+CREATE INDEX mealproduct_meal_product_idx ON products_mealproduct (meal_id, product_id) INCLUDE (weight);
+CREATE INDEX products_mealproduct_product_id_0415db7f ON products_mealproduct (product_id);
+
+ALTER TABLE products_meal ADD CONSTRAINT products_meal_user_id_128a316c_fk_products_user_id
+    FOREIGN KEY (user_id) REFERENCES products_user (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE products_mealproduct ADD CONSTRAINT products_mealproduct_product_id_0415db7f_fk_products_product_id
+    FOREIGN KEY (product_id) REFERENCES products_product (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE products_mealproduct ADD CONSTRAINT products_mealproduct_meal_id_a8a561ab_fk_products_meal_id
+    FOREIGN KEY (meal_id) REFERENCES products_meal (id) DEFERRABLE INITIALLY DEFERRED;
+'''
+
+MONTHS_AHEAD = 3
+
+
+def create_partitions(apps, schema_editor):
+    # Секции на каждый месяц существующей истории и несколько месяцев вперед.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(created_at), MAX(created_at) FROM products_meal_unpartitioned')
+        first, last = cursor.fetchone()
+        today = timezone.localdate()
+        ahead = partitions.add_months(today, MONTHS_AHEAD)
+        first = min(timezone.localdate(first), today) if first else today
+        last = max(timezone.localdate(last), ahead) if last else ahead
+        for month in partitions.month_range(first, last):
+            partitions.create_partitions(cursor, month)
+        partitions.create_default_partitions(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_jobs'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_PARTITIONED_TABLES, migrations.RunSQL.noop),
+                migrations.RunPython(create_partitions, migrations.RunPython.noop),
+                migrations.RunSQL(COPY_ROWS, UNPARTITION_TABLES),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='mealproduct',
+                    name='meal_created_at',
+                    field=models.DateTimeField(editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='mealproduct',
+                    name='meal',
+                    field=models.ForeignKey(db_constraint=False, db_index=False,
+                                            on_delete=django.db.models.deletion.CASCADE,
+                                            related_name='meal_products', to='products.meal'),
+                ),
+            ],
+        ),
+    ]
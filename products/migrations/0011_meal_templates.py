@@ -0,0 +1,68 @@
+# Generated by Django 4.2.15 on 2026-10-18 20:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Счетчики недавних и частых продуктов заполняются по уже записанной истории.
+BACKFILL_PRODUCT_USAGE = '''
+INSERT INTO products_productusage (user_id, product_id, uses, last_used_at)
+SELECT meal.user_id, meal_product.product_id, COUNT(*), MAX(meal_product.meal_created_at)
+FROM products_mealproduct AS meal_product
+JOIN products_meal AS meal ON meal.id = meal_product.meal_id AND meal.created_at = meal_product.meal_created_at
+GROUP BY meal.user_id, meal_product.product_id;
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_meal_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+                ('meal_name', models.CharField(blank=True, choices=[('Завтрак', 'Завтрак'), ('Обед', 'Обед'), ('Ужин', 'Ужин')], max_length=10, null=True, verbose_name='Прием пищи')),
+                ('total_proteins', models.FloatField(default=0, editable=False, verbose_name='Белки')),
+                ('total_fats', models.FloatField(default=0, editable=False, verbose_name='Жиры')),
+                ('total_carbs', models.FloatField(default=0, editable=False, verbose_name='Углеводы')),
+                ('total_calories', models.FloatField(default=0, editable=False, verbose_name='Калории')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_templates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Шаблон приема пищи',
+                'verbose_name_plural': 'Шаблоны приемов пищи',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uses', models.PositiveIntegerField(default=0, verbose_name='Добавлений')),
+                ('last_used_at', models.DateTimeField(verbose_name='Последний прием пищи')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='product_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Использование продукта',
+                'verbose_name_plural': 'Использование продуктов',
+            },
+        ),
+        migrations.CreateModel(
+            name='MealTemplateItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='products.mealtemplate')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='productusage',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_product_usage'),
+        ),
+        migrations.RunSQL(BACKFILL_PRODUCT_USAGE, migrations.RunSQL.noop),
+    ]
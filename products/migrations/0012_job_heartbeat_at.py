@@ -0,0 +1,22 @@
+# Generated by Django 4.2.15 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+# Выполняющиеся задачи считаются живыми с момента начала, как было до сигналов воркера.
+BACKFILL_HEARTBEAT = "UPDATE products_job SET heartbeat_at = started_at WHERE status = 'running';"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_meal_templates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний сигнал воркера'),
+        ),
+        migrations.RunSQL(BACKFILL_HEARTBEAT, migrations.RunSQL.noop),
+    ]
@@ -1,6 +1,18 @@
+import datetime
+import operator
+from collections import defaultdict, deque
+from functools import reduce
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Count, F, FloatField, Max, Min, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, Upper
+from django.utils import timezone
+
+from products import nutrition
 
 
 class User(AbstractUser):
@@ -8,8 +20,17 @@ class User(AbstractUser):
         ('М', 'Мужской'),
         ('Ж', 'Женский')
     ])
-    weight = models.DecimalField(verbose_name='Вес', max_digits=3, decimal_places=1, null=True)
+    weight = models.DecimalField(verbose_name='Вес', max_digits=4, decimal_places=1, null=True)
     height = models.IntegerField(verbose_name='Рост', null=True)
+    birth_date = models.DateField(verbose_name='Дата рождения', null=True, blank=True)
+    activity_level = models.CharField(verbose_name='Уровень активности', max_length=10, default='moderate', choices=[
+        ('minimal', 'Минимальный'),
+        ('light', 'Низкий'),
+        ('moderate', 'Средний'),
+        ('high', 'Высокий'),
+        ('extreme', 'Очень высокий')
+    ])
+    PROFILE_FIELDS = ('sex', 'weight', 'height', 'birth_date', 'activity_level')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -39,57 +60,557 @@ class Product(models.Model):
     proteins = models.IntegerField(verbose_name='Белки', validators=nutrients_validator)
     fats = models.IntegerField(verbose_name='Жиры', validators=nutrients_validator)
     carbs = models.IntegerField(verbose_name='Углеводы', validators=nutrients_validator)
-    category = models.ForeignKey(verbose_name='Категория', to=ProductCategory, on_delete=models.CASCADE)
+    # Отдельный индекс по category_id не нужен: его заменяет product_category_name_idx.
+    category = models.ForeignKey(verbose_name='Категория', to=ProductCategory, on_delete=models.CASCADE,
+                                 db_index=False)
+    # Хранимое значение calculate_calories(). В базе его поддерживает триггер
+    # products_product_calories (миграция 0005), поэтому оно верно и после
+    # QuerySet.update() и bulk_create(), минуя save().
+    calories = models.IntegerField(verbose_name='Калории', editable=False, default=0, db_index=True)
+    NUTRIENT_FIELDS = ('proteins', 'fats', 'carbs')
 
     def calculate_calories(self):
-        return (self.carbs + self.proteins)*4 + self.fats*9
+        return int(nutrition.with_calories([(self.proteins, self.fats, self.carbs)])[0, -1])
+
+    def save(self, *args, **kwargs):
+        self.calories = self.calculate_calories()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields).isdisjoint(self.NUTRIENT_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'calories'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            # Поиск по сходству (%>) идет по триграммному индексу, а автодополнение
+            # (istartswith -> UPPER(name) LIKE 'q%') - по диапазону в B-tree индексе.
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_idx'),
+            models.Index(OpClass(Upper('name'), name='text_pattern_ops'), name='product_name_prefix_idx'),
+            models.Index(fields=['proteins'], name='product_proteins_idx'),
+            # Продукты категории по названию - без сортировки.
+            models.Index(fields=['category', 'name'], name='product_category_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+def meal_product_totals(name):
+    """
+    Итоги по продуктам приема пищи - коррелированный подзапрос на нутриент; name -
+    шаблон имени ('total_{}', '{}_sum'). Не JOIN с GROUP BY: первичный ключ
+    секционированной products_meal - (id, created_at), и по одному id Postgres не группирует.
+    """
+    # Условие на meal_created_at оставляет подзапросу одну секцию products_mealproduct.
+    meal_products = MealProduct.objects.filter(
+        meal=OuterRef('pk'), meal_created_at=OuterRef('created_at'),
+    ).order_by().values('meal')
+
+    def total(nutrient):
+        expression = Sum(F(f'product__{nutrient}') * F('weight') / 100.0, output_field=FloatField())
+        return Coalesce(Subquery(meal_products.annotate(total=expression).values('total')), Value(0.0))
+
+    return {name.format(nutrient): total(nutrient) for nutrient in Meal.TOTAL_NUTRIENTS}
+
+
+def stored_totals():
+    """Выражения для UPDATE хранимых итогов Meal.total_*."""
+    return meal_product_totals('total_{}')
+
+
+class MealQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Итоги, посчитанные заново по продуктам (*_sum) - для сверки с хранимыми."""
+        return self.annotate(**meal_product_totals('{}_sum'))
+
+    def daily_totals(self):
+        return self.order_by().values('user_id', date=TruncDate('created_at')).annotate(
+            meals_count=Count('id'),
+            **{f'{nutrient}_sum': Sum(f'total_{nutrient}') for nutrient in Meal.TOTAL_NUTRIENTS},
+        )
+
+
 class Meal(models.Model):
     name = models.CharField(null=True, max_length=10, choices=[
         ('Завтрак', 'Завтрак'),
         ('Обед', 'Обед'),
         ('Ужин', 'Ужин')
     ])
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meals')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meals', db_index=False)
     products = models.ManyToManyField(Product, through='MealProduct')
+    created_at = models.DateTimeField(verbose_name='Время приема пищи', default=timezone.now)
+    # Хранимые итоги по продуктам приема пищи. Их пересчитывает refresh_totals()
+    # при изменении MealProduct или БЖУ продукта (products.signals), а
+    # `manage.py verify_meal_totals` находит и исправляет расхождения.
+    total_proteins = models.FloatField(verbose_name='Белки', default=0, editable=False)
+    total_fats = models.FloatField(verbose_name='Жиры', default=0, editable=False)
+    total_carbs = models.FloatField(verbose_name='Углеводы', default=0, editable=False)
+    total_calories = models.FloatField(verbose_name='Калории', default=0, editable=False)
+    TOTAL_NUTRIENTS = ('proteins', 'fats', 'carbs', 'calories')
+    REFRESH_BATCH_SIZE = 1000
 
-    def total_proteins(self):
-        return sum([meal_product.total_proteins() for meal_product in self.meal_products.all()])
+    objects = MealQuerySet.as_manager()
 
-    def total_fats(self):
-        return sum([meal_product.total_fats() for meal_product in self.meal_products.all()])
+    class Meta:
+        indexes = [
+            # Приемы пищи пользователя за период и в порядке курсорной пагинации
+            # (-created_at, -id - обратным проходом); заменяет индекс по user_id.
+            models.Index(fields=['user', 'created_at', 'id'], name='meal_user_created_idx'),
+        ]
 
-    def total_carbs(self):
-        return sum([meal_product.total_carbs() for meal_product in self.meal_products.all()])
+    def save(self, *args, **kwargs):
+        # Итоги пишет только refresh_totals(): значения в загруженном экземпляре
+        # могут устареть и не должны перезаписывать пересчитанные.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.total_fields()
+            ]
+        super().save(*args, **kwargs)
 
-    def total_calories(self):
-        return sum([meal_product.total_calories() for meal_product in self.meal_products.all()])
+    @classmethod
+    def total_fields(cls):
+        return [f'total_{nutrient}' for nutrient in cls.TOTAL_NUTRIENTS]
+
+    def calculate_totals(self):
+        """Итоги по загруженным продуктам, без обращения к хранимым полям."""
+        return nutrition.meal_totals(self.meal_products.all())
+
+    @classmethod
+    def refresh_totals(cls, meal_ids, batch_size=REFRESH_BATCH_SIZE):
+        """
+        Пересчитывает хранимые итоги приемов пищи пачками UPDATE по batch_size
+        приемов, а затем итоги дней (DailyNutrition), в которые они попадают.
+        """
+        meal_ids = sorted(set(meal_ids))
+        for start in range(0, len(meal_ids), batch_size):
+            batch = meal_ids[start:start + batch_size]
+            cls.objects.filter(id__in=batch).update(**stored_totals())
+            DailyNutrition.refresh_pairs({
+                (user_id, timezone.localdate(created_at))
+                for user_id, created_at in cls.objects.filter(id__in=batch).values_list('user_id', 'created_at')
+            })
+        return len(meal_ids)
+
+    @classmethod
+    def refresh_totals_for_products(cls, product_ids, batch_size=REFRESH_BATCH_SIZE):
+        meal_ids = MealProduct.objects.filter(product_id__in=product_ids).values_list('meal_id', flat=True)
+        return cls.refresh_totals(meal_ids.distinct(), batch_size)
+
+    @classmethod
+    def schedule_refresh_totals(cls, meal_ids=None, product_ids=None):
+        """
+        Пересчет итогов после изменений каталога: сразу, в текущей транзакции, или,
+        при JOBS_DEFER_MEAL_TOTALS, фоновой задачей, поставленной в той же транзакции.
+        """
+        if settings.JOBS_DEFER_MEAL_TOTALS:
+            from products import jobs
+
+            if product_ids is not None:
+                jobs.enqueue('refresh_meal_totals_for_products', {'product_ids': list(product_ids)})
+            else:
+                jobs.enqueue('refresh_meal_totals', {'meal_ids': list(meal_ids)})
+        elif product_ids is not None:
+            cls.refresh_totals_for_products(product_ids)
+        else:
+            cls.refresh_totals(meal_ids)
+
+    def sync_meal_products(self, items):
+        """
+        Приводит продукты приема пищи к списку items [(product_id, weight), ...].
+        Строки сопоставляются с текущими по продукту (по порядку, если продукт
+        встречается несколько раз): совпавшие с другим весом обновляются одним
+        bulk_update, лишние удаляются одним DELETE, недостающие создаются одним
+        bulk_create - число запросов не зависит от числа изменений.
+        """
+        existing = defaultdict(deque)
+        for meal_product in self.meal_products.order_by('id'):
+            existing[meal_product.product_id].append(meal_product)
+        created, updated = [], []
+        for product_id, weight in items:
+            if existing[product_id]:
+                meal_product = existing[product_id].popleft()
+                if meal_product.weight != weight:
+                    meal_product.weight = weight
+                    updated.append(meal_product)
+            else:
+                created.append(MealProduct(meal=self, product_id=product_id, weight=weight))
+        deleted = [meal_product.id for meal_products in existing.values() for meal_product in meal_products]
+
+        with transaction.atomic():
+            MealProduct.objects.bulk_create(created)
+            MealProduct.objects.bulk_update(updated, ['weight'])
+            if deleted:
+                # Удаление через MealProductQuerySet само пересчитывает итоги.
+                MealProduct.objects.filter(id__in=deleted).delete()
+            elif created or updated:
+                Meal.refresh_totals([self.id])
 
     def __str__(self):
         return f'Прием пищи {self.user.username}'
 
 
+class MealProductQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        MealProduct.fill_meal_created_at(objs)
+        with transaction.atomic():
+            created = super().bulk_create(objs, *args, **kwargs)
+            ProductUsage.record(objs)
+        return created
+
+    def delete(self):
+        # Итоги затронутых приемов пищи пересчитываются один раз на все удаленные
+        # строки; обработчик post_delete для строк этого QuerySet их пропускает.
+        meal_ids = set(self.values_list('meal_id', flat=True))
+        with transaction.atomic():
+            deleted = super().delete()
+            Meal.refresh_totals(meal_ids)
+        return deleted
+
+
 class MealProduct(models.Model):
-    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='meal_products')
+    # Таблица секционирована по месяцам meal_created_at (products.partitions). Внешний
+    # ключ в базе составной - (meal_id, meal_created_at) с ON UPDATE CASCADE, - поэтому
+    # Django его не создает, а meal_created_at меняет только база при смене Meal.created_at.
+    meal = models.ForeignKey(Meal, on_delete=models.CASCADE, related_name='meal_products', db_index=False,
+                             db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     weight = models.FloatField()
+    meal_created_at = models.DateTimeField(editable=False)
+
+    objects = MealProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Продукты приемов пищи читаются по meal_id (prefetch, итоги); с product_id и
+            # weight в индексе подсчет итогов обходится без чтения таблицы. Уникальности
+            # нет: один продукт может входить в прием пищи несколькими порциями.
+            models.Index(fields=['meal', 'product'], include=['weight'], name='mealproduct_meal_product_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.fill_meal_created_at([self])
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'meal_created_at'
+            ]
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                ProductUsage.record([self])
+
+    @staticmethod
+    def fill_meal_created_at(meal_products):
+        """Заполняет ключ секционирования по приему пищи (загруженному или одним запросом по meal_id)."""
+        missing = [meal_product for meal_product in meal_products if meal_product.meal_created_at is None]
+        loaded = {meal_product.meal_id: meal_product.meal.created_at for meal_product in missing
+                  if MealProduct.meal.is_cached(meal_product)}
+        meal_ids = {meal_product.meal_id for meal_product in missing} - loaded.keys()
+        if meal_ids:
+            loaded.update(Meal.objects.filter(id__in=meal_ids).values_list('id', 'created_at'))
+        for meal_product in missing:
+            meal_product.meal_created_at = loaded.get(meal_product.meal_id)
+
+    def totals(self):
+        return nutrition.meal_totals([self])
 
     def total_proteins(self):
-        return (self.product.proteins * self.weight) / 100
+        return self.totals()['proteins']
 
     def total_fats(self):
-        return (self.product.fats * self.weight) / 100
+        return self.totals()['fats']
 
     def total_carbs(self):
-        return (self.product.carbs * self.weight) / 100
+        return self.totals()['carbs']
 
     def total_calories(self):
-        return (self.product.calculate_calories() * self.weight) / 100
+        return self.totals()['calories']
+
+
+def template_item_totals(name):
+    """Итоги по продуктам шаблона - коррелированный подзапрос на нутриент, как meal_product_totals()."""
+    items = MealTemplateItem.objects.filter(template=OuterRef('pk')).order_by().values('template')
+
+    def total(nutrient):
+        expression = Sum(F(f'product__{nutrient}') * F('weight') / 100.0, output_field=FloatField())
+        return Coalesce(Subquery(items.annotate(total=expression).values('total')), Value(0.0))
+
+    return {name.format(nutrient): total(nutrient) for nutrient in Meal.TOTAL_NUTRIENTS}
+
+
+class MealTemplateQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related(Prefetch(
+            'items', queryset=MealTemplateItem.objects.select_related('product__category').order_by('id')))
+
+
+class MealTemplate(models.Model):
+    """Сохраненный набор продуктов с весами ("Мой завтрак"), из которого одним запросом создается прием пищи."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meal_templates')
+    name = models.CharField(verbose_name='Название', max_length=50)
+    meal_name = models.CharField(verbose_name='Прием пищи', null=True, blank=True, max_length=10,
+                                 choices=Meal._meta.get_field('name').choices)
+    # Хранимые итоги, как у Meal: пересчитываются при изменении продуктов шаблона или
+    # их БЖУ (products.signals) и копируются в приемы пищи, созданные по шаблону.
+    total_proteins = models.FloatField(verbose_name='Белки', default=0, editable=False)
+    total_fats = models.FloatField(verbose_name='Жиры', default=0, editable=False)
+    total_carbs = models.FloatField(verbose_name='Углеводы', default=0, editable=False)
+    total_calories = models.FloatField(verbose_name='Калории', default=0, editable=False)
+
+    objects = MealTemplateQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Шаблон приема пищи'
+        verbose_name_plural = 'Шаблоны приемов пищи'
+
+    @classmethod
+    def refresh_totals(cls, template_ids):
+        return cls.objects.filter(id__in=set(template_ids)).update(**template_item_totals('total_{}'))
+
+    @classmethod
+    def refresh_totals_for_products(cls, product_ids):
+        return cls.refresh_totals(
+            MealTemplateItem.objects.filter(product_id__in=product_ids).values_list('template_id', flat=True)
+        )
+
+    def set_items(self, items):
+        """Заменяет продукты шаблона списком items [(product_id, weight), ...] и пересчитывает итоги."""
+        with transaction.atomic():
+            self.items.all().delete()
+            MealTemplateItem.objects.bulk_create(
+                MealTemplateItem(template=self, product_id=product_id, weight=weight) for product_id, weight in items
+            )
+            MealTemplate.refresh_totals([self.id])
+
+    def create_meal(self, user, name=None, created_at=None):
+        """
+        Прием пищи с продуктами шаблона: по одному INSERT на прием пищи и его продукты,
+        итоги копируются из шаблона, затем пересчитываются итоги дня - число запросов
+        не зависит от числа продуктов. Продукты шаблона должны быть загружены вместе
+        с product (prefetch items): они же становятся продуктами приема пищи в ответе.
+        """
+        meal = Meal(user=user, name=name if name is not None else self.meal_name,
+                    **{field: getattr(self, field) for field in Meal.total_fields()})
+        if created_at is not None:
+            meal.created_at = created_at
+        items = list(self.items.all())
+        with transaction.atomic():
+            Meal.objects.bulk_create([meal])
+            meal_products = MealProduct.objects.bulk_create([
+                MealProduct(meal=meal, product=item.product, weight=item.weight) for item in items
+            ])
+            DailyNutrition.refresh(meal.user_id, timezone.localdate(meal.created_at))
+        # В ответ продукты приема пищи идут из памяти, как после prefetch_related.
+        queryset = meal.meal_products.all()
+        queryset._result_cache, queryset._prefetch_done = meal_products, True
+        meal._prefetched_objects_cache = {'meal_products': queryset}
+        return meal
+
+    def __str__(self):
+        return self.name
+
+
+class MealTemplateItem(models.Model):
+    template = models.ForeignKey(MealTemplate, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+
+class ProductUsage(models.Model):
+    """
+    Сколько раз и когда в последний раз пользователь добавлял продукт в прием пищи -
+    для списка недавних и частых продуктов без группировки всей его истории.
+    Счетчики только растут: удаление приема пищи их не уменьшает.
+    """
+    # Индекс уникальности начинается с user_id: продукты пользователя читаются по нему,
+    # а сортировка нескольких сотен строк отдельного индекса не требует.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_usage', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    uses = models.PositiveIntegerField(verbose_name='Добавлений', default=0)
+    last_used_at = models.DateTimeField(verbose_name='Последний прием пищи')
+
+    class Meta:
+        verbose_name = 'Использование продукта'
+        verbose_name_plural = 'Использование продуктов'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_product_usage'),
+        ]
+
+    @classmethod
+    def record(cls, meal_products):
+        """Учитывает новые продукты приемов пищи; пользователи - из загруженных приемов пищи или одним запросом."""
+        users = {meal_product.meal_id: meal_product.meal.user_id for meal_product in meal_products
+                 if MealProduct.meal.is_cached(meal_product)}
+        meal_ids = {meal_product.meal_id for meal_product in meal_products} - users.keys()
+        if meal_ids:
+            users.update(Meal.objects.filter(id__in=meal_ids).values_list('id', 'user_id'))
+        usage = {}
+        for meal_product in meal_products:
+            key = (users[meal_product.meal_id], meal_product.product_id)
+            uses, last_used_at = usage.get(key, (0, meal_product.meal_created_at))
+            usage[key] = (uses + 1, max(last_used_at, meal_product.meal_created_at))
+        cls.add([(*key, uses, last_used_at) for key, (uses, last_used_at) in usage.items()])
+
+    @classmethod
+    def add(cls, rows):
+        """
+        Прибавляет счетчики rows [(user_id, product_id, uses, last_used_at), ...] одним
+        INSERT ... ON CONFLICT. Строки идут в порядке ключа, чтобы параллельные
+        транзакции блокировали их в одном порядке.
+        """
+        rows = sorted(rows)
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} AS existing (user_id, product_id, uses, last_used_at) '
+                f'SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::integer[], %s::timestamptz[]) '
+                f'ON CONFLICT (user_id, product_id) DO UPDATE SET uses = existing.uses + EXCLUDED.uses, '
+                f'last_used_at = GREATEST(existing.last_used_at, EXCLUDED.last_used_at)',
+                [list(column) for column in zip(*rows)],
+            )
+
+    @classmethod
+    def merge(cls, product_ids, winner_id):
+        """Переносит счетчики продуктов product_ids на winner_id (слияние дубликатов)."""
+        usage = cls.objects.filter(product_id__in=product_ids).values('user_id').annotate(
+            total=Sum('uses'), last=Max('last_used_at')).order_by()
+        cls.add([(row['user_id'], winner_id, row['total'], row['last']) for row in usage])
+
+
+class DailyNutrition(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_nutrition')
+    date = models.DateField(verbose_name='Дата')
+    proteins = models.FloatField(verbose_name='Белки', default=0)
+    fats = models.FloatField(verbose_name='Жиры', default=0)
+    carbs = models.FloatField(verbose_name='Углеводы', default=0)
+    calories = models.FloatField(verbose_name='Калории', default=0)
+    meals_count = models.PositiveIntegerField(verbose_name='Приемов пищи', default=0)
+    ROLLUP_FIELDS = ('proteins', 'fats', 'carbs', 'calories', 'meals_count')
+    REBUILD_BATCH_SIZE = 500
+
+    class Meta:
+        verbose_name = 'Итоги дня'
+        verbose_name_plural = 'Итоги дней'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_nutrition'),
+        ]
+
+    @classmethod
+    def from_totals(cls, totals):
+        return cls(
+            user_id=totals['user_id'],
+            date=totals['date'],
+            proteins=totals['proteins_sum'],
+            fats=totals['fats_sum'],
+            carbs=totals['carbs_sum'],
+            calories=totals['calories_sum'],
+            meals_count=totals['meals_count'],
+        )
+
+    @classmethod
+    def rebuild(cls, batch_size=REBUILD_BATCH_SIZE, progress=None):
+        """
+        Пересчитывает таблицу с нуля, по batch_size пользователей в транзакции;
+        после каждой пачки вызывает progress(обработано, всего). Возвращает число записей.
+        Итоги дней раньше самого раннего приема пищи не трогаются: это история
+        отсоединенных секций (manage_meal_partitions), пересчитать ее не из чего.
+        """
+        first = Meal.objects.aggregate(first=Min('created_at'))['first']
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        rows = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                if first is not None:
+                    cls.objects.filter(user_id__in=batch, date__gte=timezone.localdate(first)).delete()
+                created = cls.objects.bulk_create(
+                    cls.from_totals(totals) for totals in Meal.objects.filter(user_id__in=batch).daily_totals()
+                )
+            rows += len(created)
+            if progress is not None:
+                progress(start + len(batch), len(user_ids))
+        return rows
+
+    @classmethod
+    def refresh(cls, user_id, date):
+        """Пересчитывает итоги одного дня пользователя по его приемам пищи."""
+        cls.refresh_days(user_id, [date])
+
+    @classmethod
+    def refresh_days(cls, user_id, dates):
+        """Пересчитывает итоги нескольких дней пользователя одним агрегирующим запросом."""
+        return cls.refresh_pairs({(user_id, date) for date in dates})
+
+    @classmethod
+    def refresh_pairs(cls, pairs):
+        """Пересчитывает итоги для набора пар (пользователь, дата) одним агрегирующим запросом."""
+        pairs = set(pairs)
+        if not pairs:
+            return []
+        user_ids = {user_id for user_id, _ in pairs}
+        dates = {date for _, date in pairs}
+        # Диапазон created_at, а не created_at__date: так фильтр идет по meal_user_created_idx.
+        start = timezone.make_aware(datetime.datetime.combine(min(dates), datetime.time.min))
+        end = timezone.make_aware(datetime.datetime.combine(max(dates) + datetime.timedelta(days=1), datetime.time.min))
+        meals = Meal.objects.filter(user_id__in=user_ids, created_at__gte=start, created_at__lt=end)
+        rollups = [
+            cls.from_totals(totals)
+            for totals in meals.daily_totals()
+            if (totals['user_id'], totals['date']) in pairs
+        ]
+        cls.objects.bulk_create(rollups, update_conflicts=True, unique_fields=['user', 'date'],
+                                update_fields=cls.ROLLUP_FIELDS)
+        empty = pairs - {(rollup.user_id, rollup.date) for rollup in rollups}
+        if empty:
+            empty_days = reduce(operator.or_, (Q(user_id=user_id, date=date) for user_id, date in empty))
+            cls.objects.filter(empty_days).delete()
+        return rollups
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди products.jobs; ее выполняет `manage.py run_workers`."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    kind = models.CharField(verbose_name='Тип', max_length=50)
+    payload = models.JSONField(verbose_name='Параметры', default=dict, blank=True)
+    status = models.CharField(verbose_name='Статус', max_length=10, default=QUEUED, choices=[
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (SUCCEEDED, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ])
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    attempts = models.PositiveIntegerField(verbose_name='Попыток', default=0)
+    max_attempts = models.PositiveIntegerField(verbose_name='Максимум попыток', default=5)
+    run_after = models.DateTimeField(verbose_name='Не раньше', default=timezone.now)
+    created_at = models.DateTimeField(verbose_name='Создана', default=timezone.now)
+    started_at = models.DateTimeField(verbose_name='Начата', null=True, blank=True)
+    # Воркер обновляет его, пока выполняет задачу (products.jobs.heartbeat).
+    heartbeat_at = models.DateTimeField(verbose_name='Последний сигнал воркера', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+    worker = models.CharField(verbose_name='Воркер', max_length=100, blank=True)
+    result = models.JSONField(verbose_name='Результат', null=True, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            # Очередь выбирается по run_after среди задач в статусе queued; частичный
+            # индекс не растет вместе с историей выполненных задач.
+            models.Index(fields=['run_after', 'id'], condition=Q(status='queued'), name='job_queued_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.id}'
@@ -0,0 +1,161 @@
+import threading
+import time
+
+import numpy as np
+
+from django.conf import settings
+
+from products import cache
+
+NUTRIENTS = ('proteins', 'fats', 'carbs', 'calories')
+
+
+def with_calories(macros):
+    """Добавляет к столбцам (белки, жиры, углеводы) столбец калорий: (углеводы + белки) * 4 + жиры * 9."""
+    macros = np.asarray(macros).reshape(-1, 3)
+    calories = (macros[:, 2] + macros[:, 0]) * 4 + macros[:, 1] * 9
+    return np.column_stack([macros, calories])
+
+
+def item_totals(nutrients, weights):
+    """
+    БЖУ и калории порций: nutrients - матрица (n, 4) на 100 г, weights - граммы (n,).
+    Порядок операций тот же, что был в MealProduct.total_*: (нутриент * вес) / 100.
+    """
+    return np.asarray(nutrients, dtype=np.float64) * np.asarray(weights, dtype=np.float64)[:, None] / 100
+
+
+def plan_totals(nutrients, weights, plan_index, plans_count):
+    """
+    Суммы по планам: строка i результата - сумма порций, у которых plan_index == i.
+    bincount складывает порции по порядку, как sum() в Meal.total_*, поэтому итоги совпадают до бита.
+    """
+    items = item_totals(nutrients, weights)
+    return np.stack([
+        np.bincount(plan_index, weights=items[:, column], minlength=plans_count)
+        for column in range(len(NUTRIENTS))
+    ], axis=1).reshape(plans_count, len(NUTRIENTS))
+
+
+def meal_totals(meal_products):
+    """Итоги одного приема пищи по сохраненным или несохраненным MealProduct."""
+    meal_products = list(meal_products)
+    nutrients = with_calories([
+        (meal_product.product.proteins, meal_product.product.fats, meal_product.product.carbs)
+        for meal_product in meal_products
+    ])
+    weights = [meal_product.weight for meal_product in meal_products]
+    return as_dict(plan_totals(nutrients, weights, np.zeros(len(weights), dtype=np.int64), 1)[0])
+
+
+def read_plans(plans, max_items):
+    """
+    Разбирает планы вида [[{"product": id, "weight": граммы}, ...], ...] в плоские
+    массивы id продуктов, весов и размеров планов. Ошибки формата - ValueError.
+    """
+    product_ids = []
+    weights = []
+    sizes = []
+    for index, plan in enumerate(plans):
+        if not isinstance(plan, list):
+            raise ValueError(f'План {index}: ожидается список продуктов.')
+        for item in plan:
+            product = item.get('product') if isinstance(item, dict) else None
+            weight = item.get('weight') if isinstance(item, dict) else None
+            if type(product) is not int or product < 1:
+                raise ValueError(f'План {index}: product должен быть положительным целым числом.')
+            if type(weight) not in (int, float) or not 0 <= weight < float('inf'):
+                raise ValueError(f'План {index}: weight должен быть неотрицательным числом.')
+            product_ids.append(product)
+            weights.append(weight)
+        sizes.append(len(plan))
+        if len(product_ids) > max_items:
+            raise ValueError(f'Можно оценить не более {max_items} продуктов за раз.')
+    return (np.array(product_ids, dtype=np.int64), np.array(weights, dtype=np.float64),
+            np.array(sizes, dtype=np.int64))
+
+
+def as_dict(totals):
+    return {nutrient: float(value) for nutrient, value in zip(NUTRIENTS, totals)}
+
+
+class UnknownProducts(Exception):
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+class NutrientMatrix:
+    """Нутриенты всех продуктов в виде массива (n, 4), упорядоченного по id продукта."""
+
+    def __init__(self, ids, nutrients, version=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.nutrients = np.asarray(nutrients, dtype=np.float64).reshape(-1, len(NUTRIENTS))
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, version=None):
+        from products.models import Product
+
+        rows = np.array(Product.objects.order_by('id').values_list('id', 'proteins', 'fats', 'carbs'),
+                        dtype=np.int64).reshape(-1, 4)
+        return cls(rows[:, 0], with_calories(rows[:, 1:]), version)
+
+    def index(self, product_ids):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self.ids):
+            positions = np.zeros(len(product_ids), dtype=np.int64)
+            found = np.zeros(len(product_ids), dtype=bool)
+        else:
+            positions = np.minimum(np.searchsorted(self.ids, product_ids), len(self.ids) - 1)
+            found = self.ids[positions] == product_ids
+        if not found.all():
+            raise UnknownProducts(np.unique(product_ids[~found]).tolist())
+        return positions
+
+    def contains(self, product_ids):
+        try:
+            self.index(product_ids)
+        except UnknownProducts:
+            return False
+        return True
+
+    def is_stale(self, version, product_ids):
+        """
+        Перечитывать ли матрицу: сменилась версия каталога, матрица старше
+        NUTRIENT_MATRIX_MAX_AGE или в ней нет запрошенных продуктов. Последнее
+        проверяется не чаще раза в NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS, чтобы
+        запросы с несуществующими id не перечитывали каталог каждый раз.
+        """
+        age = time.monotonic() - self.loaded_at
+        if self.version != version or age > settings.NUTRIENT_MATRIX_MAX_AGE:
+            return True
+        return age > settings.NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS and not self.contains(product_ids)
+
+    def evaluate(self, product_ids, weights, sizes):
+        """
+        Итоги планов из плоских массивов (см. read_plans): первые sizes[0] порций
+        относятся к плану 0 и т.д. Возвращает массив (len(sizes), 4).
+        """
+        plan_index = np.repeat(np.arange(len(sizes)), sizes)
+        return plan_totals(self.nutrients[self.index(product_ids)], weights, plan_index, len(sizes))
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def get_matrix(product_ids=()):
+    """
+    Матрица нутриентов процесса. Версия каталога (products.cache) видна другим
+    процессам только через общий кеш, а импорт меняет продукты без сигналов,
+    поэтому матрица перечитывается и по возрасту, и когда в ней нет product_ids
+    (см. NutrientMatrix.is_stale).
+    """
+    global _matrix
+    version = cache.get_versions(['products'])[0]
+    with _matrix_lock:
+        if _matrix is None or _matrix.is_stale(version, product_ids):
+            _matrix = NutrientMatrix.load(version)
+        return _matrix
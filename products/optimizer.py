@@ -0,0 +1,74 @@
+import numpy as np
+from scipy.optimize import minimize
+
+from products import nutrition
+
+# Регуляризация к нижним границам делает решение единственным, когда продуктов
+# больше, чем целей. Она берется относительно среднего квадрата столбца матрицы,
+# чтобы смещать итоги не больше чем на ~1e-6 от цели при любых масштабах.
+REGULARIZATION = 1e-6
+# Переменные решателя - веса в сотнях грамм: так строки системы одного порядка.
+WEIGHT_SCALE = 100.0
+
+
+def optimize_weights(nutrients, targets, lower, upper):
+    """
+    Подбирает веса продуктов (г) в границах [lower, upper], при которых итоги
+    БЖУ и калорий ближе всего к целям в смысле наименьших квадратов:
+
+        min ||A x - b||^2 + r * ||x - lower||^2,  lower <= x <= upper
+
+    nutrients - матрица (n, 4) на 100 г со столбцами nutrition.NUTRIENTS, targets -
+    словарь {нутриент: цель}; нутриенты без цели не учитываются. Отклонения
+    считаются относительно цели, чтобы калории не перевешивали граммы БЖУ.
+
+    Целей не больше четырех, поэтому задача решается через двойственную: она
+    гладкая, имеет размерность len(targets), а x(z) = clip(lower - A^T z)
+    выражается покоординатно. Двойственная переменная z масштабирована на r,
+    поэтому малое r не портит обусловленность. Время растет линейно по числу
+    продуктов, матрица n x n не строится.
+    """
+    nutrients = np.asarray(nutrients, dtype=np.float64).reshape(-1, len(nutrition.NUTRIENTS))
+    lower = np.asarray(lower, dtype=np.float64) / WEIGHT_SCALE
+    upper = np.asarray(upper, dtype=np.float64) / WEIGHT_SCALE
+    columns = [nutrition.NUTRIENTS.index(nutrient) for nutrient in targets]
+    goal = np.array(list(targets.values()), dtype=np.float64)
+    scale = np.maximum(goal, 1.0)
+    matrix = nutrients[:, columns].T / scale[:, None]
+    rhs = goal / scale
+    column_norm = np.mean(np.sum(matrix ** 2, axis=0)) if matrix.size else 0.0
+    regularization = REGULARIZATION * (column_norm if column_norm > 0 else 1.0)
+
+    def weights(dual):
+        return np.clip(lower - matrix.T @ dual, lower, upper)
+
+    def objective(dual):
+        x = weights(dual)
+        residual = matrix @ x - rhs
+        value = -regularization * dual @ dual + np.sum((x - lower) ** 2) + 2 * dual @ residual
+        return -value, 2 * (regularization * dual - residual)
+
+    def hessian(dual):
+        unclipped = lower - matrix.T @ dual
+        free = matrix[:, (unclipped > lower) & (unclipped < upper)]
+        return 2 * (regularization * np.eye(len(rhs)) + free @ free.T)
+
+    result = minimize(objective, np.zeros(len(rhs)), jac=True, hess=hessian, method='trust-exact',
+                      options={'gtol': 1e-10})
+    return weights(result.x) * WEIGHT_SCALE
+
+
+def optimize_plan(matrix, product_ids, targets, lower, upper):
+    """
+    Подбирает веса для продуктов из матрицы каталога (nutrition.NutrientMatrix).
+    Веса округляются до 0.1 г, итоги считаются по округленным весам;
+    в результат попадают только продукты с ненулевым весом.
+    """
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    nutrients = matrix.nutrients[matrix.index(product_ids)]
+    weights = np.round(optimize_weights(nutrients, targets, lower, upper), 1)
+    totals = nutrition.plan_totals(nutrients, weights, np.zeros(len(weights), dtype=np.int64), 1)[0]
+    used = weights > 0
+    items = [{'product': product, 'weight': weight}
+             for product, weight in zip(product_ids[used].tolist(), weights[used].tolist())]
+    return items, nutrition.as_dict(totals)
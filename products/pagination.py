@@ -0,0 +1,87 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    CursorPagination, чей курсор хранит значения всех полей сортировки, а не только
+    первого. DRF продолжает страницу после равных значений первого поля смещением
+    (OFFSET), и при сортировке по неуникальному полю (?ordering=-proteins) большая
+    группа равных значений читалась бы глубокими OFFSET. Здесь сортировка всегда
+    заканчивается id, поэтому позиция уникальна и смещение не нужно.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not {'id', 'pk'} & {field.lstrip('-') for field in ordering}:
+            ordering = (*ordering, '-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # DRF фильтрует только по первому полю позиции; курсор без позиции отдается ему,
+        # а после всех полей позиции выбирает условие ниже.
+        self.ordering = self.get_ordering(request, queryset, view)
+        cursor = super().decode_cursor(request)
+        position = None if cursor is None else cursor.position
+        if position is not None:
+            queryset = queryset.filter(self.after_position(position, cursor.reverse))
+        page = super().paginate_queryset(queryset, request, view)
+        if position is not None:
+            if cursor.reverse:
+                self.has_next, self.next_position = True, position
+            else:
+                self.has_previous, self.previous_position = True, position
+        return page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        return None if cursor is None else cursor._replace(position=None)
+
+    def after_position(self, position, reverse):
+        """Условие на строки после позиции (до нее для reverse) в порядке self.ordering."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition, equal = Q(), {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [field.lstrip('-') for field in ordering]
+        if isinstance(instance, dict):
+            values = [instance[field] for field in fields]
+        else:
+            values = [getattr(instance, field) for field in fields]
+        return json.dumps(values, cls=DjangoJSONEncoder)
+
+
+class ProductCursorPagination(KeysetCursorPagination):
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class MealCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class JobCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,115 @@
+"""
+Помесячные секции таблиц приемов пищи (декларативное секционирование Postgres).
+
+products_meal секционирована по created_at, products_mealproduct - по копии
+времени приема пищи meal_created_at; секции одного месяца называются
+<таблица>_pYYYY_MM. Строки вне созданных секций попадают в секции
+<таблица>_default. Секции заранее создает и отсоединяет
+`manage.py manage_meal_partitions`.
+"""
+import datetime
+import re
+
+from django.utils import timezone
+
+# Родительская таблица раньше дочерней: в таком порядке секции создаются, в обратном - отсоединяются.
+PARTITIONED_TABLES = (('products_meal', 'created_at'), ('products_mealproduct', 'meal_created_at'))
+PARTITION_NAME = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first, last):
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def month_bounds(month):
+    start = timezone.make_aware(datetime.datetime.combine(month, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(add_months(month, 1), datetime.time.min))
+    return start, end
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def list_partitions(cursor, table):
+    """Помесячные секции таблицы: {первое число месяца: имя секции}."""
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = %s::regclass',
+        [table],
+    )
+    partitions = {}
+    for name, in cursor.fetchall():
+        match = PARTITION_NAME.search(name)
+        if match:
+            partitions[datetime.date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_default_partitions(cursor):
+    for table, _ in PARTITIONED_TABLES:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+
+def default_has_rows(cursor, month):
+    """Есть ли в секции по умолчанию приемы пищи месяца month - тогда его секцию создать нельзя."""
+    start, end = month_bounds(month)
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM "products_meal_default" WHERE created_at >= %s AND created_at < %s)',
+        [start, end],
+    )
+    return cursor.fetchone()[0]
+
+
+def create_partitions(cursor, month):
+    """Создает секции месяца во всех таблицах; возвращает False, если они уже есть."""
+    if month in list_partitions(cursor, PARTITIONED_TABLES[0][0]):
+        return False
+    # DDL над таблицей не выполняется, пока в транзакции есть отложенные проверки внешних ключей.
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    start, end = month_bounds(month)
+    for table, _ in PARTITIONED_TABLES:
+        cursor.execute(
+            f'CREATE TABLE "{partition_name(table, month)}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    return True
+
+
+def detach_partitions(cursor, month, schema=None):
+    """
+    Отсоединяет секции месяца: строки пропадают из приложения, но остаются в
+    отдельных таблицах (в схеме schema, если она указана) - их можно выгрузить
+    pg_dump и удалить.
+    """
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    if schema:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+    for table, _ in reversed(PARTITIONED_TABLES):
+        name = partition_name(table, month)
+        cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+        # Отсоединенная секция сохраняет внешние ключи таблицы. Архив от них отвязывается целиком:
+        # ключ на products_meal не дал бы отсоединить секцию приемов пищи того же месяца, а ключи
+        # на пользователей и продукты - удалить тех, на кого ссылаются архивные строки.
+        # Ключ на секционированную таблицу хранится с дочерними ключами на каждую ее секцию
+        # (conparentid); они удаляются вместе с ним.
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f' AND conparentid = 0",
+            [name],
+        )
+        for constraint, in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{constraint}"')
+        if schema:
+            cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA "{schema}"')
@@ -4,7 +4,8 @@ from rest_framework.permissions import BasePermission
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        # Сравнение по user_id не подгружает пользователя объекта отдельным запросом.
+        return obj.user_id == request.user.id
 
 
 class IsAdminOrReadOnly(BasePermission):
@@ -0,0 +1,35 @@
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# Числа меньше 1e-4 и от 1e16 по модулю orjson записывает иначе, чем json: 0.00001
+# вместо 1e-05, 1e-9 вместо 1e-09, 1e16 вместо 1e+16. Проверки идут по готовому
+# ответу поиском подстрок: совпадение внутри строки только отправит ответ на обычный путь.
+EXPONENT = re.compile(rb'e[-0-9]')
+SMALL_FLOAT = b'0.0000'
+LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson с теми же байтами ответа. Данные, которые orjson записал
+    бы иначе или не умеет записывать (даты, Decimal, ленивые строки переводов, очень
+    малые и большие числа, U+2028/U+2029), и ответы с отступами пишет обычный JSONRenderer.
+    Исключение - NaN и бесконечности: orjson пишет их как null, а JSONRenderer при
+    STRICT_JSON отказывается их записывать (ответ 500). Проверять каждое число ради
+    этого пришлось бы на всех ответах с null, поэтому здесь ответ получает null.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if (EXPONENT.search(ret) or SMALL_FLOAT in ret
+                or b'\xe2' in ret and any(separator in ret for separator in LINE_SEPARATORS)):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret
@@ -0,0 +1,154 @@
+"""
+Быстрая сериализация списков: записи строятся из строк .values() без создания
+моделей и без обхода полей DRF на каждой записи.
+
+По полям сериализатора (с учетом ?fields=) один раз генерируется функция
+строка -> dict, которая дает то же, что serializer.data. Поддерживаются поля
+моделей, SlugRelatedField, PrimaryKeyRelatedField и вложенные сериализаторы;
+вложенные списки (many=True) читаются одним запросом на страницу. Для других
+полей compile_serializer выбрасывает Unsupported, и список отдается обычным путем.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import relations, serializers
+
+
+class Unsupported(Exception):
+    """Поле сериализатора нельзя построить из строки .values()."""
+
+
+# Поля DRF, которые отдают значение из .values() как есть, и типы полей модели,
+# для которых это так: to_representation вернул бы то же значение того же типа.
+PASSTHROUGH_FIELDS = (
+    (serializers.IntegerField, {'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField',
+                                'SmallIntegerField', 'PositiveIntegerField', 'PositiveBigIntegerField',
+                                'PositiveSmallIntegerField'}),
+    (serializers.FloatField, {'FloatField'}),
+    (serializers.CharField, {'CharField', 'TextField'}),
+    (serializers.BooleanField, {'BooleanField'}),
+)
+# Поля, представление которых зависит от контекста запроса или не хранится в строке.
+UNSUPPORTED_FIELDS = (relations.ManyRelatedField, serializers.SerializerMethodField, serializers.FileField,
+                      serializers.HiddenField)
+
+
+def model_field(model, path):
+    field = None
+    for name in path:
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model
+    return field
+
+
+def is_passthrough(field, model_field):
+    if model_field is None:
+        return False
+    for field_class, internal_types in PASSTHROUGH_FIELDS:
+        if isinstance(field, field_class):
+            return model_field.get_internal_type() in internal_types
+    return False
+
+
+class CompiledSerializer:
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.pk = self.model._meta.pk.attname
+        self.columns = [self.pk]
+        self.related = {}
+        self.namespace = {}
+        source = f'def to_representation(row, related):\n    return {self.compile_fields(serializer, self.model)}\n'
+        self.columns = list(dict.fromkeys(self.columns))
+        exec(compile(source, f'<{type(serializer).__name__}>', 'exec'), self.namespace)
+        self.to_representation = self.namespace['to_representation']
+
+    def compile_fields(self, serializer, model, prefix=''):
+        items = [
+            f'{name!r}: {self.compile_field(name, field, model, prefix)}'
+            for name, field in serializer.fields.items() if not field.write_only
+        ]
+        return '{' + ', '.join(items) + '}'
+
+    def compile_field(self, name, field, model, prefix):
+        if field.source == '*' or isinstance(field, UNSUPPORTED_FIELDS):
+            raise Unsupported(name)
+        path = prefix + '__'.join(field.source_attrs)
+        target = model_field(model, field.source_attrs)
+        # Поле, которое принимает id, а отдает запись целиком (MealProductProductField).
+        if getattr(field, 'representation_serializer', None) is not None:
+            field = field.representation_serializer()
+
+        if isinstance(field, serializers.ListSerializer):
+            if prefix or target is None or not target.one_to_many:
+                raise Unsupported(name)
+            self.related[name] = (CompiledSerializer(field.child), target.field.attname, field.source)
+            return f'related[{name!r}].get(row[{self.pk!r}], [])'
+
+        if isinstance(field, serializers.BaseSerializer):
+            if target is None or not target.is_relation:
+                raise Unsupported(name)
+            related_model = target.related_model
+            pk_column = f'{path}__{related_model._meta.pk.name}'
+            self.columns.append(pk_column)
+            fields = self.compile_fields(field, related_model, path + '__')
+            return f'(None if row[{pk_column!r}] is None else {fields})' if target.null else fields
+
+        if isinstance(field, relations.SlugRelatedField):
+            column, passthrough = f'{path}__{field.slug_field}', True
+        elif isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+            column, passthrough = path, True
+        elif isinstance(field, relations.RelatedField):
+            raise Unsupported(name)
+        else:
+            column, passthrough = path, is_passthrough(field, target)
+        self.columns.append(column)
+        if passthrough:
+            return f'row[{column!r}]'
+        converter = f'_field_{len(self.namespace)}'
+        self.namespace[converter] = field.to_representation
+        return f'(None if row[{column!r}] is None else {converter}(row[{column!r}]))'
+
+    def values(self, queryset, *extra):
+        """Строки queryset со столбцами, нужными для записей, и дополнительными extra (например, для курсора)."""
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, *extra]))
+
+    def serialize(self, rows, queryset=None):
+        """
+        Записи для строк rows из values(). Вложенные списки читаются с условиями
+        Prefetch из queryset (например, периодом ?from=&to=), если он есть.
+        """
+        related = {}
+        for name, (child, foreign_key, source) in self.related.items():
+            related[name] = groups = {}
+            ids = {row[self.pk] for row in rows}
+            if not ids:
+                continue
+            child_rows = child.values(self.related_queryset(queryset, source, child.model), foreign_key)
+            child_rows = list(child_rows.filter(**{f'{foreign_key}__in': ids}))
+            for child_row, data in zip(child_rows, child.serialize(child_rows)):
+                groups.setdefault(child_row[foreign_key], []).append(data)
+        to_representation = self.to_representation
+        return [to_representation(row, related) for row in rows]
+
+    @staticmethod
+    def related_queryset(queryset, source, model):
+        related = model._default_manager.all()
+        for lookup in getattr(queryset, '_prefetch_related_lookups', ()):
+            if isinstance(lookup, Prefetch) and lookup.prefetch_to == source and lookup.queryset is not None:
+                related = lookup.queryset
+        return related if related.ordered else related.order_by('pk')
+
+
+_compiled = {}
+
+
+def compile_serializer(serializer):
+    """Скомпилированный сериализатор; кешируется по классу и набору полей."""
+    key = (type(serializer), tuple(serializer.fields))
+    if key not in _compiled:
+        _compiled[key] = CompiledSerializer(serializer)
+    return _compiled[key]
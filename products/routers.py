@@ -0,0 +1,115 @@
+"""
+Чтение с реплик Postgres (settings.DATABASE_REPLICAS).
+
+ReplicaRoutingMiddleware решает для каждого запроса, можно ли читать с реплики:
+можно только в GET/HEAD/OPTIONS и только если клиент ничего не записывал последние
+DB_REPLICA_PIN_SECONDS секунд - иначе реплика могла еще не получить его изменения.
+Запись всегда идет на основную базу; после первой записи в запросе, внутри
+транзакции и вне HTTP-запросов (команды, воркеры) чтение тоже идет на основную базу.
+"""
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной базы через репликацию.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def pin_keys(request, response=None):
+    """
+    Ключи кеша, по которым клиент привязывается к основной базе: заголовок
+    Authorization и cookie сессии (в том числе новой, выданной при входе).
+    По ним не нужно обращаться к базе, чтобы узнать пользователя.
+    """
+    credentials = [request.META.get('HTTP_AUTHORIZATION'), request.COOKIES.get(settings.SESSION_COOKIE_NAME)]
+    if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        credentials.append(response.cookies[settings.SESSION_COOKIE_NAME].value)
+    return [f'db:pin:{hashlib.sha256(value.encode()).hexdigest()}' for value in credentials if value]
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    @staticmethod
+    def start(request):
+        replica = None
+        if settings.DATABASE_REPLICAS and request.method in SAFE_METHODS:
+            keys = pin_keys(request)
+            if not keys or not cache.get_many(keys):
+                replica = random.choice(settings.DATABASE_REPLICAS)
+        state = RoutingState(replica)
+        return state, _state.set(state)
+
+    @staticmethod
+    def finish(request, response, state):
+        if settings.DATABASE_REPLICAS and (state.wrote or request.method not in SAFE_METHODS):
+            keys = pin_keys(request, response)
+            if keys:
+                cache.set_many(dict.fromkeys(keys, True), timeout=settings.DB_REPLICA_PIN_SECONDS)
+        return response
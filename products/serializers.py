@@ -1,16 +1,41 @@
+import datetime
+
 from django.core.validators import RegexValidator
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
 
-from products.models import Meal, Product, ProductCategory, User, MealProduct
+from products.models import (Job, Meal, MealTemplate, MealTemplateItem, Product, ProductCategory, ProductUsage, User,
+                             MealProduct)
+
+
+class SparseFieldsMixin:
+    """Оставляет в сериализаторе только поля, переданные в `fields` (параметр ?fields= у списков)."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    meals = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'meals', 'is_staff')
 
 
-class ProductCategorySerializer(serializers.ModelSerializer):
+class ProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'sex', 'weight', 'height', 'birth_date', 'activity_level')
+        read_only_fields = ('id', 'username')
+
+
+class ProductCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductCategory
         fields = ('id', 'name')
@@ -21,7 +46,7 @@ class ProductCategorySerializer(serializers.ModelSerializer):
                                    message="Название категории должно быть на русском языке.")])
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'name', 'proteins', 'fats', 'carbs', 'calories', 'category')
@@ -46,40 +71,276 @@ class ProductSerializer(serializers.ModelSerializer):
                                         })
     name = serializers.CharField(
         label='Название',
+        max_length=50,
         validators=[RegexValidator(r'^[А-Яа-яЁё\s0-9]+$',
                                    message="Название продукта должно быть на русском языке.")])
 
 
+class ProductImportSerializer(ProductSerializer):
+    # Категория передается по названию и сопоставляется с id пакетно в ProductImporter,
+    # без отдельного запроса на каждую строку.
+    category = serializers.CharField(label='Категория', max_length=50)
+
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=50, trim_whitespace=True)
+    mode = serializers.ChoiceField(choices=['similar', 'prefix'], default='similar')
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class SimilarProductsQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    category = serializers.CharField(required=False, max_length=50)
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    RANGE_FIELDS = ('proteins', 'fats', 'carbs', 'calories')
+
+    category = serializers.CharField(required=False, max_length=50)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.RANGE_FIELDS:
+            for lookup in ('gte', 'lte'):
+                fields[f'{name}__{lookup}'] = serializers.IntegerField(required=False, min_value=0)
+        return fields
+
+
+class MealProductProductField(serializers.IntegerField):
+    """Продукт принимается по id, а отдается целиком, как ProductSerializer."""
+
+    representation_serializer = ProductSerializer
+
+    def to_representation(self, value):
+        return self.representation_serializer(value).data
+
+
+def validate_products(items):
+    # Все продукты списка проверяются одним запросом.
+    product_ids = {item['product'] for item in items}
+    existing_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    errors = [{} if item['product'] in existing_ids else {'product': ['Продукт не найден.']} for item in items]
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    return items
+
 
 class MealProductSerializer(serializers.ModelSerializer):
-    product = ProductSerializer()
+    product = MealProductProductField(min_value=1)
+    weight = serializers.FloatField(min_value=0)
 
     class Meta:
         model = MealProduct
         fields = ['product', 'weight']
 
 
-class MealSerializer(serializers.ModelSerializer):
+class MealSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(slug_field='username', read_only=True)
-    meal_products = MealProductSerializer(many=True, read_only=True)
-    total_proteins = serializers.FloatField(read_only=True)
-    total_fats = serializers.FloatField(read_only=True)
-    total_carbs = serializers.FloatField(read_only=True)
-    total_calories = serializers.FloatField(read_only=True)
+    meal_products = MealProductSerializer(many=True, required=False)
 
     class Meta:
         model = Meal
-        fields = ['id', 'name', 'user', 'products', 'weight', 'total_proteins',
+        fields = ['id', 'name', 'user', 'created_at', 'meal_products', 'total_proteins',
                   'total_fats', 'total_carbs', 'total_calories']
 
-    def get_total_proteins(self, obj):
-        return sum(product.proteins for product in obj.products.all()) * obj.weight/100
+    def validate_meal_products(self, items):
+        return validate_products(items)
+
+    def create(self, validated_data):
+        items = validated_data.pop('meal_products', None)
+        with transaction.atomic():
+            meal = super().create(validated_data)
+            if items:
+                meal.sync_meal_products([(item['product'], item['weight']) for item in items])
+        return self.reloaded(meal) if items else meal
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop('meal_products', None)
+        with transaction.atomic():
+            # UPDATE приема пищи блокирует его строку до конца транзакции, поэтому
+            # параллельные изменения продуктов одного приема пищи не перемешиваются.
+            meal = super().update(instance, validated_data)
+            if items is not None:
+                meal.sync_meal_products([(item['product'], item['weight']) for item in items])
+        return self.reloaded(meal) if items is not None else meal
+
+    @staticmethod
+    def reloaded(meal):
+        """Прием пищи заново из базы: с пересчитанными итогами и продуктами для ответа."""
+        meal_products = MealProduct.objects.select_related('product__category').filter(
+            meal_created_at=meal.created_at).order_by('id')
+        return Meal.objects.select_related('user').prefetch_related(
+            Prefetch('meal_products', queryset=meal_products)
+        ).get(pk=meal.pk)
+
+
+class MealTemplateItemSerializer(serializers.ModelSerializer):
+    product = MealProductProductField(min_value=1)
+    weight = serializers.FloatField(min_value=0)
+
+    class Meta:
+        model = MealTemplateItem
+        fields = ['product', 'weight']
+
+
+class MealTemplateSerializer(serializers.ModelSerializer):
+    MAX_ITEMS = 100
+
+    items = MealTemplateItemSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+
+    class Meta:
+        model = MealTemplate
+        fields = ['id', 'name', 'meal_name', 'items', 'total_proteins', 'total_fats', 'total_carbs', 'total_calories']
+
+    def validate_items(self, items):
+        return validate_products(items)
 
-    def get_total_fats(self, obj):
-        return sum(product.fats for product in obj.products.all()) * obj.weight/100
+    def create(self, validated_data):
+        items = validated_data.pop('items')
+        with transaction.atomic():
+            template = super().create(validated_data)
+            template.set_items([(item['product'], item['weight']) for item in items])
+        return self.reloaded(template)
 
-    def get_total_carbs(self, obj):
-        return sum(product.carbs for product in obj.products.all()) * obj.weight/100
+    def update(self, instance, validated_data):
+        items = validated_data.pop('items', None)
+        with transaction.atomic():
+            template = super().update(instance, validated_data)
+            if items is not None:
+                template.set_items([(item['product'], item['weight']) for item in items])
+        return self.reloaded(template)
 
-    def get_total_calories(self, obj):
-        return sum(product.calories for product in obj.products.all()) * obj.weight/100
+    @staticmethod
+    def reloaded(template):
+        """Шаблон заново из базы: с пересчитанными итогами и продуктами для ответа."""
+        return MealTemplate.objects.with_items().get(pk=template.pk)
+
+
+class MealFromTemplateSerializer(serializers.Serializer):
+    name = serializers.ChoiceField(choices=Meal._meta.get_field('name').choices, required=False, allow_null=True)
+    created_at = serializers.DateTimeField(required=False)
+
+
+class ProductUsageSerializer(serializers.ModelSerializer):
+    product = ProductSerializer()
+
+    class Meta:
+        model = ProductUsage
+        fields = ['product', 'uses', 'last_used_at']
+
+
+class RecentProductsQuerySerializer(serializers.Serializer):
+    order = serializers.ChoiceField(choices=['recent', 'frequent'], default='recent')
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+
+class BulkMealProductSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    weight = serializers.FloatField(min_value=0)
+
+
+class BulkMealSerializer(serializers.Serializer):
+    name = serializers.ChoiceField(choices=Meal._meta.get_field('name').choices, required=False, allow_null=True)
+    created_at = serializers.DateTimeField(required=False)
+    meal_products = BulkMealProductSerializer(many=True, allow_empty=False)
+
+
+class MacroTargetsSerializer(serializers.Serializer):
+    proteins = serializers.FloatField(min_value=0, required=False)
+    fats = serializers.FloatField(min_value=0, required=False)
+    carbs = serializers.FloatField(min_value=0, required=False)
+    calories = serializers.FloatField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('Укажите хотя бы одну цель.')
+        return attrs
+
+
+class OptimizeItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    min_weight = serializers.FloatField(min_value=0, required=False)
+    max_weight = serializers.FloatField(min_value=0, required=False)
+
+
+class MealOptimizeSerializer(serializers.Serializer):
+    MAX_ITEMS = 1000
+
+    items = OptimizeItemSerializer(many=True, required=False, allow_empty=False, max_length=MAX_ITEMS)
+    category = serializers.PrimaryKeyRelatedField(queryset=ProductCategory.objects.all(), required=False)
+    targets = MacroTargetsSerializer()
+    min_weight = serializers.FloatField(min_value=0, default=0)
+    max_weight = serializers.FloatField(min_value=0, default=500)
+
+    def validate(self, attrs):
+        if ('items' in attrs) == ('category' in attrs):
+            raise serializers.ValidationError('Укажите либо список продуктов items, либо категорию category.')
+        for item in attrs.get('items', []):
+            item.setdefault('min_weight', attrs['min_weight'])
+            item.setdefault('max_weight', attrs['max_weight'])
+            if item['min_weight'] > item['max_weight']:
+                raise serializers.ValidationError({'items': 'Минимальный вес не может быть больше максимального.'})
+        if attrs['min_weight'] > attrs['max_weight']:
+            raise serializers.ValidationError('Минимальный вес не может быть больше максимального.')
+        return attrs
+
+
+class DateRangeQuerySerializer(serializers.Serializer):
+    DEFAULT_PERIOD_DAYS = 90
+
+    to = serializers.DateField(required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # `from` - зарезервированное слово, поэтому поле добавляется здесь.
+        fields['from'] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, attrs):
+        attrs.setdefault('to', timezone.localdate())
+        attrs.setdefault('from', attrs['to'] - datetime.timedelta(days=self.DEFAULT_PERIOD_DAYS - 1))
+        if attrs['from'] > attrs['to']:
+            raise serializers.ValidationError('Начало периода не может быть позже его окончания.')
+        return attrs
+
+    @staticmethod
+    def datetime_range(params):
+        """
+        Начало дня `from` и начало дня после `to` в текущем часовом поясе: фильтр
+        created_at__gte/__lt по ним идет по индексу, а не по выражению от created_at.
+        """
+        start = datetime.datetime.combine(params['from'], datetime.time.min)
+        end = datetime.datetime.combine(params['to'] + datetime.timedelta(days=1), datetime.time.min)
+        return timezone.make_aware(start), timezone.make_aware(end)
+
+
+class NutritionSummaryQuerySerializer(DateRangeQuerySerializer):
+    granularity = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+
+
+class ProgressQuerySerializer(DateRangeQuerySerializer):
+    MAX_PERIOD_DAYS = 366
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if (attrs['to'] - attrs['from']).days >= self.MAX_PERIOD_DAYS:
+            raise serializers.ValidationError(f'Период не может быть длиннее {self.MAX_PERIOD_DAYS} дней.')
+        return attrs
+
+
+class NutritionSummarySerializer(serializers.Serializer):
+    period = serializers.DateField()
+    proteins = serializers.FloatField()
+    fats = serializers.FloatField()
+    carbs = serializers.FloatField()
+    calories = serializers.FloatField()
+    meals_count = serializers.IntegerField()
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # Трассировка ошибки видна только в админке: пользователю хватает статуса.
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'started_at',
+                  'finished_at', 'result')
+        read_only_fields = fields
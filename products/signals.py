@@ -0,0 +1,128 @@
+import functools
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products import cache, nutrition, similarity, targets
+from products.models import (DailyNutrition, Meal, MealProduct, MealProductQuerySet, MealTemplate, MealTemplateItem,
+                             Product, ProductCategory, User)
+
+
+def meal_date(meal):
+    return timezone.localdate(meal.created_at)
+
+
+@receiver(pre_save, sender=Meal)
+def remember_meal_date(sender, instance, **kwargs):
+    instance._previous_date = None
+    if instance.pk is not None:
+        previous = Meal.objects.filter(pk=instance.pk).values_list('created_at', flat=True).first()
+        if previous is not None:
+            instance._previous_date = timezone.localdate(previous)
+
+
+@receiver(post_save, sender=Meal)
+def refresh_rollup_on_meal_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    date = meal_date(instance)
+    DailyNutrition.refresh(instance.user_id, date)
+    previous_date = getattr(instance, '_previous_date', None)
+    if previous_date is not None and previous_date != date:
+        DailyNutrition.refresh(instance.user_id, previous_date)
+
+
+@receiver(post_delete, sender=Meal)
+def refresh_rollup_on_meal_delete(sender, instance, **kwargs):
+    DailyNutrition.refresh(instance.user_id, meal_date(instance))
+
+
+def deleted_with(origin, *models):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in models
+
+
+# Product.save и MealProduct.save открывают транзакцию, и итоги ниже пересчитываются в ней же.
+@receiver(post_save, sender=MealProduct)
+@receiver(post_delete, sender=MealProduct)
+def refresh_meal_on_meal_product_change(sender, instance, raw=False, origin=None, **kwargs):
+    # При удалении приема пищи, продукта, категории, пользователя или QuerySet продуктов
+    # приема пищи итоги пересчитываются один раз в их собственных обработчиках, а не на
+    # каждую строку MealProduct.
+    if raw or deleted_with(origin, Meal, Product, ProductCategory, User) or isinstance(origin, MealProductQuerySet):
+        return
+    Meal.refresh_totals([instance.meal_id])
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_nutrients(sender, instance, raw=False, **kwargs):
+    instance._previous_nutrients = None
+    if instance.pk is not None and not raw:
+        instance._previous_nutrients = Product.objects.filter(pk=instance.pk).values_list(
+            *Product.NUTRIENT_FIELDS).first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_meals_on_product_change(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_nutrients', None)
+    if created or raw or previous is None:
+        return
+    if previous != tuple(getattr(instance, field) for field in Product.NUTRIENT_FIELDS):
+        Meal.schedule_refresh_totals(product_ids=[instance.pk])
+        MealTemplate.refresh_totals_for_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_meals(sender, instance, **kwargs):
+    instance._meal_ids = list(MealProduct.objects.filter(product=instance).values_list('meal_id', flat=True))
+    instance._template_ids = list(
+        MealTemplateItem.objects.filter(product=instance).values_list('template_id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_meals_on_product_delete(sender, instance, **kwargs):
+    meal_ids = getattr(instance, '_meal_ids', [])
+    if meal_ids:
+        Meal.schedule_refresh_totals(meal_ids=meal_ids)
+    # Продукты шаблонов удалены каскадом раньше самого продукта.
+    template_ids = getattr(instance, '_template_ids', [])
+    if template_ids:
+        MealTemplate.refresh_totals(template_ids)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, **kwargs):
+    cache.invalidate('products')
+
+
+# Регистрируются после invalidate_product_cache: к моменту обновления индекса
+# похожих продуктов версия каталога уже сброшена этим изменением.
+@receiver(post_save, sender=Product)
+def update_similarity_index_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        nutrients = tuple(getattr(instance, nutrient) for nutrient in nutrition.NUTRIENTS)
+        transaction.on_commit(functools.partial(similarity.product_changed, instance.pk, nutrients,
+                                                instance.category_id))
+
+
+@receiver(post_delete, sender=Product)
+def update_similarity_index_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(functools.partial(similarity.product_changed, instance.pk))
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_category_cache(sender, **kwargs):
+    # В ответах по продуктам категория выводится по названию.
+    cache.invalidate('categories', 'products')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_targets(sender, instance, update_fields=None, **kwargs):
+    # Вход в систему сохраняет только last_login - цели от него не зависят.
+    if update_fields is None or not set(update_fields).isdisjoint(User.PROFILE_FIELDS):
+        targets.invalidate(instance.id)
@@ -0,0 +1,181 @@
+"""
+Продукты, похожие по составу: ближайшие соседи по белкам, жирам, углеводам и
+калориям на 100 г (GET /products/products/{id}/similar/).
+
+Индекс держится в памяти процесса: KD-деревья (scipy.spatial.cKDTree) по всему
+каталогу и по каждой категории. Нутриенты делятся на их стандартное отклонение
+по каталогу, чтобы калории (сотни) не заглушали граммы. Индекс строится при
+первом запросе. Сохранения и удаления продуктов в этом процессе (products.signals)
+применяются к нему после коммита без перестройки: старые записи деревьев
+скрываются, а новые значения ложатся в небольшую добавку, которую запрос
+просматривает целиком. Когда добавка вырастает, деревья пересобираются из памяти,
+без запроса к базе. Изменения из других процессов и в обход сигналов (импорт)
+видны по версии каталога (products.cache) - тогда индекс перечитывается целиком,
+как матрица нутриентов (products.nutrition).
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from scipy.spatial import cKDTree
+
+from products import cache
+from products.nutrition import NUTRIENTS
+
+# Добавка сливается с деревьями, когда в ней больше записей, чем это число или эта доля каталога.
+MAX_PENDING = 1000
+MAX_PENDING_FRACTION = 0.01
+
+
+class SimilarityIndex:
+    def __init__(self, ids, nutrients, category_ids, version=None):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.build(ids, nutrients, category_ids)
+
+    @classmethod
+    def load(cls, version=None):
+        from products.models import Product
+
+        rows = np.array(Product.objects.order_by('id').values_list('id', *NUTRIENTS, 'category_id'),
+                        dtype=np.int64).reshape(-1, len(NUTRIENTS) + 2)
+        return cls(rows[:, 0], rows[:, 1:-1], rows[:, -1], version)
+
+    def build(self, ids, nutrients, category_ids):
+        order = np.argsort(ids, kind='stable')
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.nutrients = np.asarray(nutrients, dtype=np.float64).reshape(-1, len(NUTRIENTS))[order]
+        self.category_ids = np.asarray(category_ids, dtype=np.int64)[order]
+        scale = self.nutrients.std(axis=0) if len(self.ids) else np.ones(len(NUTRIENTS))
+        self.scale = np.where(scale > 0, scale, 1.0)
+        points = self.nutrients / self.scale
+
+        # Деревья: None - весь каталог, иначе id категории. Позиции - строки self.ids в дереве.
+        self.trees = {None: (cKDTree(points), np.arange(len(self.ids)))}
+        by_category = np.argsort(self.category_ids, kind='stable')
+        categories, starts = np.unique(self.category_ids[by_category], return_index=True)
+        for category_id, positions in zip(categories.tolist(), np.split(by_category, starts[1:])):
+            self.trees[category_id] = (cKDTree(points[positions]), positions)
+
+        self.hidden = np.zeros(len(self.ids), dtype=bool)
+        self.hidden_count = 0
+        # id продукта -> (нутриенты, id категории) для продуктов, сохраненных после построения деревьев.
+        self.pending = {}
+        self.pending_arrays = None
+
+    def nearest(self, nutrients, k, category_ids=None, exclude=()):
+        """
+        id не более k продуктов, ближайших к nutrients (белки, жиры, углеводы, калории),
+        от ближних к дальним. category_ids - множество категорий, None - все.
+        """
+        point = np.asarray(nutrients, dtype=np.float64) / self.scale
+        exclude = set(exclude)
+        wanted = k + len(exclude)
+        with self.lock:
+            if category_ids is None:
+                trees = [self.trees[None]]
+            else:
+                trees = [self.trees[category_id] for category_id in category_ids if category_id in self.trees]
+            found = [self.query_tree(tree, positions, point, wanted) for tree, positions in trees]
+            found.append(self.query_pending(point, category_ids))
+        distances = np.concatenate([distances for distances, _ in found])
+        ids = np.concatenate([ids for _, ids in found])
+        # При равных расстояниях первым идет меньший id.
+        ids = ids[np.lexsort((ids, distances))].tolist()
+        return [product_id for product_id in ids if product_id not in exclude][:k]
+
+    def query_tree(self, tree, positions, point, k):
+        """Ближайшие видимые записи дерева: скрытые отбрасываются, и при нехватке поиск повторяется шире."""
+        count = min(k, tree.n)
+        while count:
+            distances, found = tree.query(point, k=count)
+            found_positions = positions[np.atleast_1d(found)]
+            visible = ~self.hidden[found_positions]
+            if visible.sum() >= k or count == tree.n:
+                return np.atleast_1d(distances)[visible], self.ids[found_positions[visible]]
+            count = min(count * 2, tree.n)
+        return np.empty(0), np.empty(0, dtype=np.int64)
+
+    def query_pending(self, point, category_ids):
+        if self.pending_arrays is None:
+            ids = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+            nutrients = np.array([nutrients for nutrients, _ in self.pending.values()],
+                                 dtype=np.float64).reshape(-1, len(NUTRIENTS))
+            categories = np.fromiter((category_id for _, category_id in self.pending.values()), dtype=np.int64,
+                                     count=len(self.pending))
+            self.pending_arrays = ids, nutrients, categories
+        ids, nutrients, categories = self.pending_arrays
+        if category_ids is not None:
+            selected = np.isin(categories, list(category_ids))
+            ids, nutrients = ids[selected], nutrients[selected]
+        return np.linalg.norm(nutrients / self.scale - point, axis=1), ids
+
+    def update(self, product_id, nutrients, category_id):
+        with self.lock:
+            self.hide(product_id)
+            self.pending[product_id] = (tuple(nutrients), category_id)
+            self.changed()
+
+    def remove(self, product_id):
+        with self.lock:
+            self.hide(product_id)
+            self.pending.pop(product_id, None)
+            self.changed()
+
+    def hide(self, product_id):
+        position = np.searchsorted(self.ids, product_id)
+        if position < len(self.ids) and self.ids[position] == product_id and not self.hidden[position]:
+            self.hidden[position] = True
+            self.hidden_count += 1
+
+    def changed(self):
+        self.pending_arrays = None
+        if len(self.pending) + self.hidden_count > max(MAX_PENDING, len(self.ids) * MAX_PENDING_FRACTION):
+            self.compact()
+
+    def compact(self):
+        """Пересобирает деревья из видимых записей и добавки."""
+        visible = ~self.hidden
+        pending = list(self.pending.items())
+        self.build(
+            np.concatenate([self.ids[visible], [product_id for product_id, _ in pending]]),
+            np.concatenate([self.nutrients[visible],
+                            np.array([nutrients for _, (nutrients, _) in pending]).reshape(-1, len(NUTRIENTS))]),
+            np.concatenate([self.category_ids[visible], [category_id for _, (_, category_id) in pending]]),
+        )
+
+    def is_stale(self, version):
+        age = time.monotonic() - self.loaded_at
+        return self.version != version or age > settings.SIMILAR_PRODUCTS_INDEX_MAX_AGE
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс процесса; перечитывается, когда меняется версия каталога или индекс устаревает по возрасту."""
+    global _index
+    version = cache.get_versions(['products'])[0]
+    with _index_lock:
+        if _index is None or _index.is_stale(version):
+            _index = SimilarityIndex.load(version)
+        return _index
+
+
+def product_changed(product_id, nutrients=None, category_id=None):
+    """
+    Применяет к индексу процесса сохранение продукта (nutrients - белки, жиры,
+    углеводы, калории) или его удаление (nutrients=None). Вызывается после коммита,
+    когда версия каталога уже сброшена этим изменением: индекс принимает ее как свою.
+    """
+    with _index_lock:
+        if _index is None:
+            return
+        if nutrients is None:
+            _index.remove(product_id)
+        else:
+            _index.update(product_id, nutrients, category_id)
+        _index.version = cache.get_versions(['products'])[0]
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.utils import timezone
+
+from products.cache import get_cache
+
+# Коэффициенты физической активности к базовому обмену (BMR -> TDEE).
+ACTIVITY_FACTORS = {
+    'minimal': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'high': 1.725,
+    'extreme': 1.9,
+}
+# Поправка формулы Миффлина - Сан Жеора по полу.
+SEX_OFFSETS = {'М': 5, 'Ж': -161}
+PROTEINS_PER_KG = 1.6
+FATS_SHARE = 0.3
+REQUIRED_FIELDS = ('sex', 'weight', 'height', 'birth_date')
+
+
+class IncompleteProfile(Exception):
+    def __init__(self, fields):
+        super().__init__(fields)
+        self.fields = fields
+
+
+def age(birth_date, today):
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+
+def calculate_targets(user, today):
+    """
+    Дневные цели по профилю: BMR по формуле Миффлина - Сан Жеора, TDEE = BMR *
+    коэффициент активности. Белки - PROTEINS_PER_KG на кг веса, жиры - FATS_SHARE
+    калорий, углеводы - остаток калорий.
+    """
+    missing = [field for field in REQUIRED_FIELDS if getattr(user, field) is None]
+    if missing:
+        raise IncompleteProfile(missing)
+    weight = float(user.weight)
+    bmr = 10 * weight + 6.25 * user.height - 5 * age(user.birth_date, today) + SEX_OFFSETS[user.sex]
+    calories = bmr * ACTIVITY_FACTORS[user.activity_level]
+    proteins = PROTEINS_PER_KG * weight
+    fats = FATS_SHARE * calories / 9
+    carbs = max(calories - proteins * 4 - fats * 9, 0) / 4
+    return {
+        'bmr': round(bmr, 1),
+        'tdee': round(calories, 1),
+        'proteins': round(proteins, 1),
+        'fats': round(fats, 1),
+        'carbs': round(carbs, 1),
+        'calories': round(calories, 1),
+    }
+
+
+def targets_key(user_id, today):
+    # Дата в ключе: возраст, а с ним и цели, меняются без изменения профиля.
+    return f'targets:{user_id}:{today.isoformat()}'
+
+
+def get_targets(user):
+    """Цели пользователя на сегодня; запоминаются в кеше до изменения профиля (products.signals)."""
+    today = timezone.localdate()
+    cache = get_cache()
+    key = targets_key(user.id, today)
+    targets = cache.get(key)
+    if targets is None:
+        targets = calculate_targets(user, today)
+        cache.set(key, targets, timeout=24 * 60 * 60)
+    return targets
+
+
+def invalidate(user_id):
+    def delete():
+        get_cache().delete(targets_key(user_id, timezone.localdate()))
+
+    # Как и products.cache.invalidate: повторное удаление после коммита убирает
+    # цели, посчитанные конкурентным запросом по старому профилю.
+    delete()
+    transaction.on_commit(delete)
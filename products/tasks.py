@@ -0,0 +1,60 @@
+"""Фоновые задачи проекта; выполняются воркерами `manage.py run_workers` (products.jobs)."""
+import codecs
+import tempfile
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from products import duplicates
+from products.catalogue import ProductImporter, export_rows, read_rows
+from products.jobs import task
+from products.models import DailyNutrition, Meal
+
+
+@task('refresh_meal_totals')
+def refresh_meal_totals(payload):
+    return {'meals': Meal.refresh_totals(payload['meal_ids'])}
+
+
+@task('refresh_meal_totals_for_products')
+def refresh_meal_totals_for_products(payload):
+    return {'meals': Meal.refresh_totals_for_products(payload['product_ids'])}
+
+
+@task('rebuild_nutrition_rollup')
+def rebuild_nutrition_rollup(payload):
+    return {'rows': DailyNutrition.rebuild(payload.get('batch_size', DailyNutrition.REBUILD_BATCH_SIZE))}
+
+
+@task('find_duplicate_products')
+def find_duplicate_products(payload):
+    clusters = duplicates.find_duplicates(payload.get('name_similarity', duplicates.NAME_SIMILARITY),
+                                          payload.get('max_distance', duplicates.MAX_DISTANCE))
+    return {'clusters': clusters}
+
+
+@task('import_products')
+def import_products(payload):
+    # Upsert по названию идемпотентен, поэтому повтор после сбоя посреди файла безопасен.
+    importer = ProductImporter(create_categories=payload.get('create_categories', False))
+    with default_storage.open(payload['file'], 'rb') as file:
+        importer.run(read_rows(codecs.iterdecode(file, 'utf-8-sig'), payload['file_format']))
+    default_storage.delete(payload['file'])
+    return {'imported': importer.imported, 'errors': importer.errors}
+
+
+@task('export_products')
+def export_products(payload):
+    file_format = payload['file_format']
+    with tempfile.TemporaryFile() as file:
+        for line in export_rows(file_format):
+            file.write(line.encode())
+        file.seek(0)
+        name = default_storage.save(f'exports/products-{uuid.uuid4().hex}.{file_format}', File(file))
+    return {'file': name, 'file_format': file_format}
+
+
+def save_upload(upload, file_format):
+    """Сохраняет загруженный файл до выполнения задачи import_products; возвращает имя в хранилище."""
+    return default_storage.save(f'imports/{uuid.uuid4().hex}.{file_format}', upload)
@@ -1,9 +1,41 @@
-from django.test import TestCase
+import datetime
+import importlib
+import json
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+import numpy as np
+
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from products.models import Product, ProductCategory, User, Meal
+from products import duplicates, jobs, nutrition, partitions, representations, similarity, targets
+from products.cache import invalidate
+from products.renderers import FastJSONRenderer
+from products.routers import ReplicaRouter, ReplicaRoutingMiddleware
+from products.models import (DailyNutrition, Job, MealTemplate, Product, ProductCategory, ProductUsage, User, Meal,
+                             MealProduct)
+from products.serializers import MealSerializer, UserSerializer
+from products.views import MealViewSet
 
 
 class UserViewSetTestCase(TestCase):
@@ -237,3 +269,1740 @@ class ProductViewSetTestCase(TestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Product.objects.count(), 0)
+
+    def test_list_products_sparse_fields(self):
+        self.client.force_authenticate(user=self.regular_user)
+        url = reverse('products:products-list')
+        response = self.client.get(url, {'fields': 'id,name,calories'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'id': self.product.id, 'name': 'Продукт 1', 'calories': 165}])
+
+    def test_list_products_cursor_pagination(self):
+        Product.objects.create(name='Продукт 2', proteins=1, fats=1, carbs=1, category=self.category)
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.get(reverse('products:products-list'), {'page_size': 1})
+        self.assertEqual([product['name'] for product in response.data['results']], ['Продукт 1'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([product['name'] for product in response.data['results']], ['Продукт 2'])
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_pages_through_equal_values_without_offset(self):
+        Product.objects.bulk_create(Product(name=f'Тофу {number}', proteins=12, fats=4, carbs=2,
+                                            category=self.category) for number in range(7))
+        self.client.force_authenticate(user=self.regular_user)
+        url = reverse('products:products-list')
+        expected = list(Product.objects.order_by('-proteins', '-id').values_list('name', flat=True))
+        names, pages = [], []
+        response = self.client.get(url, {'ordering': '-proteins', 'page_size': 3, 'fields': 'name'})
+        while True:
+            names += [product['name'] for product in response.data['results']]
+            pages.append(response.data)
+            if response.data['next'] is None:
+                break
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.data['next'])
+            self.assertNotIn('OFFSET', queries.captured_queries[-1]['sql'])
+        self.assertEqual(names, expected)
+
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual([product['name'] for product in response.data['results']], names[3:6])
+
+    def test_calories_stored_on_every_write_path(self):
+        self.assertEqual(Product.objects.get(pk=self.product.pk).calories, 165)
+        self.product.fats = 10
+        self.product.save(update_fields=['fats'])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).calories, 210)
+        Product.objects.filter(pk=self.product.pk).update(carbs=0)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).calories, 130)
+        Product.objects.bulk_create([Product(name='Продукт 1', proteins=0, fats=0, carbs=10, category=self.category)],
+                                    update_conflicts=True, unique_fields=['name'],
+                                    update_fields=['proteins', 'fats', 'carbs'])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).calories, 40)
+
+    def test_list_products_filters_and_ordering(self):
+        other_category = ProductCategory.objects.create(name='Мясо')
+        Product.objects.create(name='Курица', proteins=25, fats=3, carbs=0, category=other_category)
+        Product.objects.create(name='Говядина', proteins=26, fats=15, carbs=0, category=other_category)
+        Product.objects.create(name='Тофу', proteins=12, fats=4, carbs=2, category=self.category)
+        self.client.force_authenticate(user=self.regular_user)
+        url = reverse('products:products-list')
+
+        response = self.client.get(url, {'calories__lte': 200, 'proteins__gte': 12, 'ordering': '-proteins'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['name'] for product in response.data['results']], ['Курица', 'Тофу'])
+
+        response = self.client.get(url, {'category': 'Мясо', 'ordering': 'calories'})
+        self.assertEqual([product['name'] for product in response.data['results']], ['Курица', 'Говядина'])
+
+        response = self.client.get(url, {'calories__lte': 'много'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MealViewSetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product1 = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                               carbs=20, category=self.category)
+        self.product2 = Product.objects.create(name='Продукт 2', proteins=20, fats=10,
+                                               carbs=0, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.other_user = User.objects.create_user(
+            username='other', email='other@example.com', password='other123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def create_meals(self, count, user=None):
+        for _ in range(count):
+            meal = Meal.objects.create(name='Обед', user=user or self.user)
+            MealProduct.objects.create(meal=meal, product=self.product1, weight=150)
+            MealProduct.objects.create(meal=meal, product=self.product2, weight=50)
+
+    def test_list_meals_totals(self):
+        self.create_meals(1)
+        Meal.objects.create(name='Ужин', user=self.user)
+        url = reverse('products:meals-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        empty_meal, meal = response.data['results']
+        self.assertEqual(meal['total_proteins'], 25)
+        self.assertEqual(meal['total_fats'], 12.5)
+        self.assertEqual(meal['total_carbs'], 30)
+        self.assertEqual(meal['total_calories'], 332.5)
+        self.assertEqual(len(meal['meal_products']), 2)
+        self.assertEqual(empty_meal['total_calories'], 0)
+
+    def test_list_meals_totals_match_model_methods(self):
+        self.create_meals(1)
+        meal = Meal.objects.get()
+        response = self.client.get(reverse('products:meals-detail', args=[meal.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = meal.calculate_totals()
+        self.assertEqual(response.data['total_proteins'], totals['proteins'])
+        self.assertEqual(response.data['total_calories'], totals['calories'])
+
+    def test_create_meal_with_products(self):
+        payload = {'name': 'Обед', 'meal_products': [{'product': self.product1.id, 'weight': 150},
+                                                     {'product': self.product2.id, 'weight': 50}]}
+        response = self.client.post(reverse('products:meals-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['product']['id'] for item in response.data['meal_products']],
+                         [self.product1.id, self.product2.id])
+        self.assertEqual(response.data['meal_products'][0]['product']['category'], 'Категория')
+        self.assertEqual(response.data['total_proteins'], 25)
+        self.assertEqual(Meal.objects.get().total_calories, 332.5)
+
+    def test_create_meal_with_unknown_product(self):
+        payload = {'meal_products': [{'product': self.product1.id, 'weight': 100}, {'product': 999999, 'weight': 1}]}
+        response = self.client.post(reverse('products:meals-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['meal_products'][1], {'product': ['Продукт не найден.']})
+        self.assertFalse(Meal.objects.exists())
+
+    def test_update_meal_products_diff(self):
+        self.create_meals(1)
+        meal = Meal.objects.get()
+        kept = meal.meal_products.get(product=self.product1)
+        url = reverse('products:meals-detail', args=[meal.id])
+        payload = {'meal_products': [{'product': self.product1.id, 'weight': 100},
+                                     {'product': self.product1.id, 'weight': 20}]}
+        response = self.client.patch(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['weight'] for item in response.data['meal_products']], [100, 20])
+        self.assertEqual(response.data['total_proteins'], 12)
+        # Совпавшая по продукту строка обновлена на месте, лишняя удалена.
+        self.assertEqual(meal.meal_products.order_by('id').first().id, kept.id)
+        self.assertEqual(meal.meal_products.count(), 2)
+
+        response = self.client.patch(url, {'name': 'Ужин'}, format='json')
+        self.assertEqual(len(response.data['meal_products']), 2)
+        response = self.client.put(url, {'name': 'Ужин', 'meal_products': []}, format='json')
+        self.assertEqual(response.data['total_calories'], 0)
+        self.assertFalse(meal.meal_products.exists())
+
+    def test_update_meal_products_query_count_is_constant(self):
+        products = Product.objects.bulk_create(
+            Product(name=f'Продукт {number}', proteins=number % 40, fats=1, carbs=1, category=self.category)
+            for number in range(3, 53)
+        )
+        meal = Meal.objects.create(name='Обед', user=self.user)
+        MealProduct.objects.bulk_create(MealProduct(meal=meal, product=product, weight=100) for product in products)
+        url = reverse('products:meals-detail', args=[meal.id])
+
+        def edit(changed):
+            items = [{'product': product.id, 'weight': 100} for product in products[changed:]]
+            items += [{'product': self.product1.id, 'weight': number + 1} for number in range(changed // 2)]
+            items += [{'product': product.id, 'weight': 50} for product in products[:changed - changed // 2]]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.put(url, {'name': 'Обед', 'meal_products': items}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['meal_products']), 50)
+            return len(queries.captured_queries)
+
+        self.assertEqual(edit(2), edit(40))
+
+    def test_owner_check_does_not_load_user(self):
+        self.create_meals(1)
+        meal = Meal.objects.get()
+        url = reverse('products:meals-detail', args=[meal.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, {'fields': 'id,name'}).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse([query for query in queries if '"products_user"' in query['sql']])
+
+    def test_list_meals_only_own(self):
+        self.create_meals(2)
+        self.create_meals(3, user=self.other_user)
+        response = self.client.get(reverse('products:meals-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_list_meals_query_count_is_constant(self):
+        url = reverse('products:meals-list')
+        self.create_meals(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        self.create_meals(20)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 21)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_list_meals_cursor_pagination(self):
+        self.create_meals(5)
+        url = reverse('products:meals-list')
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [meal['id'] for meal in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [meal['id'] for meal in response.data['results']]
+        self.assertEqual(ids, list(Meal.objects.order_by('-created_at').values_list('id', flat=True)))
+
+    def test_list_meals_sparse_fields_skip_queries(self):
+        self.create_meals(3)
+        url = reverse('products:meals-list')
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get(url, {'fields': 'id,total_calories'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'total_calories'})
+        self.assertEqual(response.data['results'][0]['total_calories'], 332.5)
+        self.assertLess(len(sparse.captured_queries), len(full.captured_queries))
+
+
+class DailyNutritionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                              carbs=20, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.day = datetime.datetime(2024, 9, 2, 12, tzinfo=datetime.timezone.utc)
+
+    def create_meal(self, weight=100, created_at=None):
+        meal = Meal.objects.create(name='Обед', user=self.user, created_at=created_at or self.day)
+        MealProduct.objects.create(meal=meal, product=self.product, weight=weight)
+        return meal
+
+    def test_rollup_follows_meal_product_changes(self):
+        meal = self.create_meal()
+        self.create_meal(weight=50)
+        rollup = DailyNutrition.objects.get(user=self.user, date=self.day.date())
+        self.assertEqual(rollup.meals_count, 2)
+        self.assertEqual(rollup.proteins, 15)
+        self.assertEqual(rollup.calories, 247.5)
+
+        meal_product = meal.meal_products.get()
+        meal_product.weight = 200
+        meal_product.save()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.proteins, 25)
+
+        meal_product.delete()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.proteins, 5)
+        self.assertEqual(rollup.meals_count, 2)
+
+    def test_rollup_follows_meal_move_and_delete(self):
+        meal = self.create_meal()
+        meal.created_at = self.day + datetime.timedelta(days=1)
+        meal.save()
+        self.assertFalse(DailyNutrition.objects.filter(date=self.day.date()).exists())
+        self.assertEqual(DailyNutrition.objects.get(date=meal.created_at.date()).proteins, 10)
+
+        meal.delete()
+        self.assertFalse(DailyNutrition.objects.exists())
+
+    def test_summary_by_day_and_week(self):
+        self.create_meal()
+        self.create_meal(created_at=self.day + datetime.timedelta(days=1))
+        self.create_meal(created_at=self.day + datetime.timedelta(days=7))
+        url = reverse('products:meals-summary')
+        params = {'from': '2024-09-01', 'to': '2024-09-30'}
+
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['period'] for row in response.data], ['2024-09-02', '2024-09-03', '2024-09-09'])
+
+        response = self.client.get(url, {**params, 'granularity': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]['period'], '2024-09-02')
+        self.assertEqual(response.data[0]['meals_count'], 2)
+        self.assertEqual(response.data[0]['proteins'], 20)
+
+    def test_summary_invalid_params(self):
+        url = reverse('products:meals-summary')
+        response = self.client.get(url, {'from': '2024-09-30', 'to': '2024-09-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'granularity': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        self.create_meal()
+        self.create_meal(created_at=self.day + datetime.timedelta(days=1))
+        DailyNutrition.objects.all().delete()
+        call_command('rebuild_nutrition_rollup', batch_size=1, stdout=StringIO())
+        self.assertEqual(DailyNutrition.objects.count(), 2)
+        self.assertEqual(DailyNutrition.objects.get(date=self.day.date()).calories, 165)
+
+    def test_stored_totals_follow_meal_products(self):
+        meal = self.create_meal()
+        meal.refresh_from_db()
+        self.assertEqual((meal.total_proteins, meal.total_fats, meal.total_carbs, meal.total_calories),
+                         (10, 5, 20, 165))
+        meal_product = meal.meal_products.get()
+        meal_product.weight = 50
+        meal_product.save()
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 5)
+        meal_product.delete()
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_calories, 0)
+
+    def test_stored_totals_follow_product_changes(self):
+        meal = self.create_meal(weight=200)
+        self.product.proteins = 20
+        self.product.save()
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 40)
+        self.assertEqual(DailyNutrition.objects.get(date=self.day.date()).calories, 410)
+
+        self.product.delete()
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 0)
+        self.assertEqual(DailyNutrition.objects.get(date=self.day.date()).proteins, 0)
+
+    def test_verify_command_repairs_drift(self):
+        meal = self.create_meal()
+        # QuerySet.update() минует сигналы: хранимые итоги расходятся с продуктами.
+        Product.objects.filter(pk=self.product.pk).update(proteins=30)
+
+        out = StringIO()
+        call_command('verify_meal_totals', dry_run=True, stdout=out)
+        self.assertIn(f'id: {meal.id}', out.getvalue())
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 10)
+
+        call_command('verify_meal_totals', batch_size=1, stdout=StringIO())
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 30)
+        self.assertEqual(DailyNutrition.objects.get(date=self.day.date()).proteins, 30)
+
+
+class BulkMealTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product1 = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                               carbs=20, category=self.category)
+        self.product2 = Product.objects.create(name='Продукт 2', proteins=20, fats=10,
+                                               carbs=0, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('products:meals-bulk')
+
+    def meal_payload(self, created_at='2024-09-02T12:00:00Z'):
+        return {
+            'name': 'Обед',
+            'created_at': created_at,
+            'meal_products': [
+                {'product': self.product1.id, 'weight': 150},
+                {'product': self.product2.id, 'weight': 50},
+            ],
+        }
+
+    def test_bulk_create_meals(self):
+        payload = [self.meal_payload(), self.meal_payload('2024-09-03T08:00:00Z')]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result['index'] for result in response.data], [0, 1])
+        self.assertEqual(Meal.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(MealProduct.objects.count(), 4)
+        self.assertEqual(DailyNutrition.objects.get(date=datetime.date(2024, 9, 2)).proteins, 25)
+
+    def test_bulk_create_reports_invalid_items(self):
+        missing_product = self.meal_payload()
+        missing_product['meal_products'][1]['product'] = 999999
+        payload = [self.meal_payload(), missing_product, {'name': 'Полдник', 'meal_products': []}]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertIn('id', response.data[0])
+        self.assertEqual(response.data[1]['errors']['meal_products'][1], {'product': ['Продукт не найден.']})
+        self.assertIn('name', response.data[2]['errors'])
+        self.assertEqual(Meal.objects.count(), 1)
+
+    def test_bulk_create_rejects_non_list(self):
+        response = self.client.post(self.url, self.meal_payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_rejects_too_many_meal_products(self):
+        payload = [self.meal_payload(), self.meal_payload()]
+        with mock.patch.object(MealViewSet, 'MAX_BULK_MEAL_PRODUCTS', 3):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('3', response.data['detail'])
+        self.assertFalse(Meal.objects.exists())
+
+    def test_bulk_create_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, [self.meal_payload()], format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, [self.meal_payload() for _ in range(50)], format='json')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(MealProduct.objects.count(), 102)
+
+
+class MealEvaluateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product1 = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                               carbs=20, category=self.category)
+        self.product2 = Product.objects.create(name='Продукт 2', proteins=20, fats=10,
+                                               carbs=0, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('products:meals-evaluate')
+
+    def test_evaluate_matches_model_totals(self):
+        items = [(self.product1, 33.3), (self.product2, 71.7), (self.product1, 0.1)]
+        meal = Meal.objects.create(user=self.user, name='Обед')
+        for product, weight in items:
+            MealProduct.objects.create(meal=meal, product=product, weight=weight)
+        plan = [{'product': product.id, 'weight': weight} for product, weight in items]
+
+        response = self.client.post(self.url, {'plans': [plan, [], plan[:1]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = meal.calculate_totals()
+        self.assertEqual(response.data[0], {f'total_{nutrient}': value for nutrient, value in totals.items()})
+        # Прежняя скалярная формула дает те же числа.
+        self.assertEqual(totals['proteins'], sum([(product.proteins * weight) / 100 for product, weight in items]))
+        self.assertEqual(response.data[1]['total_calories'], 0)
+        self.assertEqual(response.data[2]['total_calories'], 165 * 33.3 / 100)
+        self.assertEqual(Meal.objects.count(), 1)
+
+    def test_evaluate_sees_product_changes(self):
+        payload = {'plans': [[{'product': self.product1.id, 'weight': 200}]]}
+        self.assertEqual(self.client.post(self.url, payload, format='json').data[0]['total_proteins'], 20)
+        self.product1.proteins = 15
+        self.product1.save()
+        self.assertEqual(self.client.post(self.url, payload, format='json').data[0]['total_proteins'], 30)
+
+    def test_evaluate_reports_unknown_products(self):
+        payload = {'plans': [[{'product': self.product1.id, 'weight': 100}, {'product': 999999, 'weight': 50}]]}
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['products'], [999999])
+
+        # Повторный запрос с неизвестным id сразу после перечитывания каталог не перечитывает.
+        with mock.patch.object(nutrition.NutrientMatrix, 'load') as load:
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        load.assert_not_called()
+
+    def test_evaluate_sees_changes_without_version_bump(self):
+        # Так выглядят изменения из другого процесса без общего кеша: версия каталога здесь не меняется.
+        payload = {'plans': [[{'product': self.product1.id, 'weight': 200}]]}
+        self.assertEqual(self.client.post(self.url, payload, format='json').data[0]['total_proteins'], 20)
+        Product.objects.filter(pk=self.product1.pk).update(proteins=15)
+        new_product, = Product.objects.bulk_create([Product(name='Новый', proteins=30, fats=0, carbs=0,
+                                                            category=self.category)])
+        new_payload = {'plans': [[{'product': new_product.id, 'weight': 100}]]}
+
+        self.assertEqual(self.client.post(self.url, payload, format='json').data[0]['total_proteins'], 20)
+        self.assertEqual(self.client.post(self.url, new_payload, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        with override_settings(NUTRIENT_MATRIX_MISSING_RELOAD_SECONDS=0):
+            response = self.client.post(self.url, new_payload, format='json')
+        self.assertEqual(response.data[0]['total_proteins'], 30)
+        with override_settings(NUTRIENT_MATRIX_MAX_AGE=0):
+            self.assertEqual(self.client.post(self.url, payload, format='json').data[0]['total_proteins'], 30)
+
+    def test_evaluate_rejects_invalid_plans(self):
+        for payload in ([], {'plans': [[{'product': self.product1.id, 'weight': -1}]]},
+                        {'plans': [[{'product': 'abc', 'weight': 10}]]}, {'plans': [{'product': 1}]}):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MealOptimizeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product1 = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                               carbs=20, category=self.category)
+        self.product2 = Product.objects.create(name='Продукт 2', proteins=20, fats=10,
+                                               carbs=0, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('products:meals-optimize')
+
+    def weights(self, response):
+        return {item['product']: item['weight'] for item in response.data['items']}
+
+    def test_optimize_hits_reachable_targets(self):
+        # 200 г первого продукта дают 40 г углеводов и 20 г белка, 50 г второго - еще 10 г белка.
+        payload = {
+            'items': [{'product': self.product1.id}, {'product': self.product2.id}],
+            'targets': {'proteins': 30, 'carbs': 40},
+        }
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        weights = self.weights(response)
+        self.assertAlmostEqual(weights[self.product1.id], 200, delta=1)
+        self.assertAlmostEqual(weights[self.product2.id], 50, delta=1)
+        self.assertAlmostEqual(response.data['total_proteins'], 30, delta=0.5)
+        self.assertEqual(Meal.objects.count(), 0)
+
+    def test_optimize_meets_large_target_with_one_product(self):
+        bread = Product.objects.create(name='Хлеб', proteins=3, fats=1, carbs=19, category=self.category)
+        chicken = Product.objects.create(name='Курица', proteins=20, fats=0, carbs=0, category=self.category)
+        for product, goals, weight in ((bread, {'calories': 2200}, 2200 / 97 * 100),
+                                       (chicken, {'proteins': 150}, 750)):
+            response = self.client.post(self.url, {'items': [{'product': product.id}], 'targets': goals,
+                                                   'max_weight': 5000}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertAlmostEqual(self.weights(response)[product.id], weight, delta=0.1)
+            for nutrient, target in goals.items():
+                self.assertAlmostEqual(response.data[f'total_{nutrient}'], target, delta=0.1)
+
+    def test_optimize_meets_two_targets_with_two_products(self):
+        rice = Product.objects.create(name='Рис', proteins=5, fats=2, carbs=70, category=self.category)
+        fish = Product.objects.create(name='Рыба', proteins=25, fats=5, carbs=0, category=self.category)
+        response = self.client.post(self.url, {
+            'items': [{'product': rice.id}, {'product': fish.id}],
+            'targets': {'calories': 2200, 'proteins': 100},
+            'max_weight': 5000,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(response.data['total_calories'], 2200, delta=0.5)
+        self.assertAlmostEqual(response.data['total_proteins'], 100, delta=0.1)
+
+    def test_optimize_respects_bounds(self):
+        payload = {
+            'category': self.category.id,
+            'targets': {'proteins': 30, 'carbs': 40},
+            'max_weight': 100,
+        }
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.weights(response)[self.product1.id], 100)
+
+        payload = {
+            'items': [{'product': self.product1.id, 'min_weight': 250}, {'product': self.product2.id}],
+            'targets': {'carbs': 40},
+        }
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(self.weights(response), {self.product1.id: 250})
+
+    def test_optimize_rejects_invalid_requests(self):
+        item = {'product': self.product1.id}
+        for payload in ({'items': [item], 'category': self.category.id, 'targets': {'proteins': 30}},
+                        {'items': [item], 'targets': {}},
+                        {'items': [{'product': 999999}], 'targets': {'proteins': 30}},
+                        {'items': [{'product': self.product1.id, 'min_weight': 50, 'max_weight': 10}],
+                         'targets': {'proteins': 30}}):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserProgressTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                              carbs=20, category=self.category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123',
+            sex='М', weight=80, height=180, birth_date=datetime.date(1990, 1, 1),
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('products:users-progress')
+
+    def add_meal(self, created_at, weight):
+        meal = Meal.objects.create(user=self.user, name='Обед', created_at=created_at)
+        MealProduct.objects.create(meal=meal, product=self.product, weight=weight)
+
+    def test_calculate_targets(self):
+        result = targets.calculate_targets(self.user, datetime.date(2024, 6, 1))
+        # BMR = 10 * 80 + 6.25 * 180 - 5 * 34 + 5, TDEE = BMR * 1.55
+        self.assertEqual(result['bmr'], 1760)
+        self.assertEqual(result['calories'], 2728)
+        self.assertEqual(result['proteins'], 128)
+        self.assertEqual(result['fats'], 90.9)
+        self.assertEqual(result['carbs'], 349.4)
+
+    def test_progress_per_day(self):
+        self.add_meal(timezone.make_aware(datetime.datetime(2024, 9, 2, 12)), 200)
+        self.add_meal(timezone.make_aware(datetime.datetime(2024, 9, 2, 19)), 100)
+        self.add_meal(timezone.make_aware(datetime.datetime(2024, 9, 4, 8)), 50)
+        params = {'from': '2024-09-02', 'to': '2024-09-04'}
+        targets.get_targets(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        days = response.data['days']
+        self.assertEqual([day['date'] for day in days],
+                         [datetime.date(2024, 9, 2), datetime.date(2024, 9, 3), datetime.date(2024, 9, 4)])
+        self.assertEqual(days[0]['meals_count'], 2)
+        self.assertEqual(days[0]['proteins'], 30)
+        self.assertEqual(days[1]['calories'], 0)
+        self.assertEqual(days[2]['proteins_percent'],
+                         round(5 / response.data['targets']['proteins'] * 100, 1))
+
+    def test_targets_follow_profile_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['targets']['proteins'], 128)
+        response = self.client.patch(reverse('products:users-me'), {'weight': '90.0'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['targets']['proteins'], 144)
+
+    def test_progress_requires_profile(self):
+        self.user.height = None
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['fields'], ['height'])
+
+
+class AsyncReadTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.products = [
+            Product.objects.create(name=f'Продукт {number}', proteins=number, fats=5, carbs=20,
+                                   category=self.category)
+            for number in range(1, 4)
+        ]
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.other_user = User.objects.create_user(
+            username='other', email='other@example.com', password='other123'
+        )
+        self.meals = []
+        for day, user in ((1, self.user), (2, self.user), (3, self.other_user)):
+            meal = Meal.objects.create(user=user, name='Обед',
+                                       created_at=timezone.make_aware(datetime.datetime(2024, 9, day, 12)))
+            MealProduct.objects.create(meal=meal, product=self.products[0], weight=150)
+            MealProduct.objects.create(meal=meal, product=self.products[1], weight=55.5)
+            self.meals.append(meal)
+        self.client.force_login(self.user)
+
+    def test_product_endpoints_match_sync_api(self):
+        sync = self.client.get(reverse('products:products-list')).json()
+        response = self.client.get(reverse('products:async-products-list'), {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], sync['results'][:2])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(response.json(), {'next': None, 'results': sync['results'][2:]})
+
+        product = self.products[0]
+        response = self.client.get(reverse('products:async-products-detail', args=[product.id]))
+        self.assertEqual(response.json(),
+                         self.client.get(reverse('products:products-detail', args=[product.id])).json())
+        response = self.client.get(reverse('products:async-products-detail', args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_category_endpoints(self):
+        response = self.client.get(reverse('products:async-categories-list'))
+        self.assertEqual(response.json(), [{'id': self.category.id, 'name': 'Категория'}])
+        response = self.client.get(reverse('products:async-categories-detail', args=[self.category.id]))
+        self.assertEqual(response.json(), {'id': self.category.id, 'name': 'Категория'})
+
+    def test_meal_endpoints_match_sync_api(self):
+        sync = self.client.get(reverse('products:meals-list')).json()['results']
+        response = self.client.get(reverse('products:async-meals-list'), {'page_size': 1})
+        self.assertEqual(response.json()['results'], sync[:1])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(response.json(), {'next': None, 'results': sync[1:]})
+
+        meal = self.meals[0]
+        response = self.client.get(reverse('products:async-meals-detail', args=[meal.id]))
+        self.assertEqual(response.json(), self.client.get(reverse('products:meals-detail', args=[meal.id])).json())
+        response = self.client.get(reverse('products:async-meals-detail', args=[self.meals[2].id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_meal_totals(self):
+        response = self.client.get(reverse('products:async-meals-totals'), {'from': '2024-09-01', 'to': '2024-09-03'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['meals_count'], 2)
+        self.assertEqual(response.json()['proteins'], 2 * (1 * 150 / 100 + 2 * 55.5 / 100))
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self.client.get(reverse('products:async-products-list'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('products:async-products-list'))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_async_requests_are_instrumented(self):
+        response = self.client.get(reverse('products:async-products-list'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+class ProductCatalogueTestCase(TestCase):
+    CSV = (
+        'name,proteins,fats,carbs,category\n'
+        'Гречка,13,3,68,Крупы\n'
+        'Продукт 1,11,6,21,Крупы\n'
+        'Рис,7,1,abc,Крупы\n'
+        'Овсянка,12,6,60,Неизвестная\n'
+    )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Крупы')
+        self.product = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                              carbs=20, category=self.category)
+        self.admin_user = User.objects.create_superuser(
+            username='admin123', email='admin123@example.com', password='admin123'
+        )
+        self.regular_user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+
+    def test_import_command_upserts_and_reports_errors(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as file:
+            file.write(self.CSV)
+            file.flush()
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_products', file.name, chunk_size=2, stdout=stdout, stderr=stderr)
+        self.assertIn('Загружено продуктов: 2, отклонено строк: 2', stdout.getvalue())
+        self.assertEqual(Product.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.proteins, 11)
+        self.assertEqual(Product.objects.get(name='Гречка').category, self.category)
+
+    def test_import_refreshes_template_totals(self):
+        template = MealTemplate.objects.create(user=self.regular_user, name='Завтрак')
+        template.set_items([(self.product.id, 200)])
+        self.client.force_authenticate(user=self.admin_user)
+        upload = SimpleUploadedFile('products.csv', self.CSV.encode())
+        self.client.post(reverse('products:products-import-products'), {'file': upload}, format='multipart')
+        template.refresh_from_db()
+        self.assertEqual(template.total_proteins, 11 * 200 / 100)
+        self.assertEqual(template.total_calories, Product.objects.get(pk=self.product.pk).calories * 200 / 100)
+
+    def test_import_endpoint_jsonl(self):
+        self.client.force_authenticate(user=self.admin_user)
+        lines = [
+            {'name': 'Гречка', 'proteins': 13, 'fats': 3, 'carbs': 68, 'category': 'Крупы'},
+            {'name': 'Творог', 'proteins': 18, 'fats': 5, 'carbs': 3, 'category': 'Молочные'},
+            {'name': 'Gречка', 'proteins': 13, 'fats': 3, 'carbs': 68, 'category': 'Крупы'},
+        ]
+        upload = SimpleUploadedFile('products.jsonl', '\n'.join(
+            json.dumps(line, ensure_ascii=False) for line in lines
+        ).encode())
+        url = reverse('products:products-import-products')
+        response = self.client.post(url, {'file': upload, 'create_categories': 'true'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3])
+        self.assertTrue(ProductCategory.objects.filter(name='Молочные').exists())
+
+    def test_import_rejects_non_utf8_file(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('products:products-import-products')
+        for background in ('false', 'true'):
+            upload = SimpleUploadedFile('products.csv', self.CSV.encode('cp1251'))
+            response = self.client.post(url, {'file': upload, 'background': background}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.data)
+        self.assertFalse(Job.objects.exists())
+
+    def test_import_rejects_bad_byte_after_first_chunk(self):
+        self.client.force_authenticate(user=self.admin_user)
+        rows = ''.join(f'Продукт {number},10,5,20,Крупы\n' for number in range(1500))
+        content = ('name,proteins,fats,carbs,category\n' + rows).encode() + b'\xff\xfe,1,1,1,\xca\xf0\n'
+        response = self.client.post(reverse('products:products-import-products'),
+                                    {'file': SimpleUploadedFile('products.csv', content)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_import_endpoint_admin_only(self):
+        self.client.force_authenticate(user=self.regular_user)
+        upload = SimpleUploadedFile('products.csv', self.CSV.encode())
+        response = self.client.post(reverse('products:products-import-products'), {'file': upload},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_csv_and_jsonl(self):
+        self.client.force_authenticate(user=self.regular_user)
+        url = reverse('products:products-export')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         'name,proteins,fats,carbs,category\r\nПродукт 1,10,5,20,Крупы\r\n')
+
+        response = self.client.get(url, {'file_format': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{'name': 'Продукт 1', 'proteins': 10, 'fats': 5, 'carbs': 20, 'category': 'Крупы'}])
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = ProductCategory.objects.create(name='Крупы')
+        for name in ('Гречка варёная', 'Гречка сухая', 'Рис белый', 'Овсянка', 'Греческий йогурт'):
+            Product.objects.create(name=name, proteins=10, fats=5, carbs=20, category=category)
+        self.user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.url = reverse('products:products-search')
+
+    def test_search_requires_authentication(self):
+        response = self.client.get(self.url, {'q': 'гречка'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_search_by_similarity(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {'q': 'гречка'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [product['name'] for product in response.data]
+        self.assertEqual(set(names[:2]), {'Гречка варёная', 'Гречка сухая'})
+        self.assertNotIn('Рис белый', names)
+
+    def test_search_by_prefix(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {'q': 'гречк', 'mode': 'prefix'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['name'] for product in response.data], ['Гречка сухая', 'Гречка варёная'])
+
+    def test_search_requires_query(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogueCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Категория')
+        self.product = Product.objects.create(name='Продукт 1', proteins=10, fats=5,
+                                              carbs=20, category=self.category)
+        self.admin_user = User.objects.create_superuser(
+            username='admin123', email='admin123@example.com', password='admin123'
+        )
+        self.client.force_authenticate(user=self.admin_user)
+        self.url = reverse('products:products-detail', args=[self.product.id])
+
+    def test_cached_response_skips_database(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Продукт 1')
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+        'other': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+    })
+    def test_write_through_another_cache_instance_invalidates_cache(self):
+        # Два клиента одного общего кеша - как два процесса с Redis.
+        self.assertIsNot(caches['default'], caches['other'])
+        self.assertEqual(self.client.get(self.url).data['name'], 'Продукт 1')
+        with override_settings(CATALOGUE_CACHE_ALIAS='other'):
+            self.product.name = 'Продукт 2'
+            self.product.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['name'], 'Продукт 2')
+        self.assertGreater(len(queries.captured_queries), 0)
+
+    def test_write_invalidates_cache(self):
+        self.client.get(self.url)
+        self.client.patch(self.url, {'name': 'Измененный продукт'})
+        self.assertEqual(self.client.get(self.url).data['name'], 'Измененный продукт')
+
+        self.category.name = 'Новая категория'
+        self.category.save()
+        self.assertEqual(self.client.get(self.url).data['category'], 'Новая категория')
+
+    def test_etag_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.create(name='Продукт 2', proteins=1, fats=1, carbs=1, category=self.category)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_stats(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get(reverse('products:cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['hits'], response.data['misses']), (1, 1))
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(
+            username='admin123', email='admin123@example.com', password='admin123'
+        )
+        self.regular_user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+
+    def test_server_timing_header(self):
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.get(reverse('products:meals-list'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+    def test_metrics_endpoint(self):
+        self.client.force_authenticate(user=self.regular_user)
+        self.client.get(reverse('products:meals-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('http_request_duration_seconds_count{view="MealViewSet.list",method="GET"}',
+                      response.content.decode())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_logged(self):
+        self.client.force_authenticate(user=self.regular_user)
+        with self.assertLogs('products.instrumentation', level='WARNING') as logs:
+            self.client.get(reverse('products:meals-list'))
+        self.assertIn('MealViewSet.list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class SeedBenchmarkDataTestCase(TestCase):
+    def test_seed_creates_consistent_data(self):
+        call_command('seed_benchmark_data', users=3, products=50, meals_per_user=5, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='bench_').count(), 3)
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertTrue(Meal.objects.exists())
+        self.assertFalse(Product.objects.filter(proteins__gt=Product.MAX_VALUE).exists())
+        meal = Meal.objects.with_totals().get(pk=MealProduct.objects.values('meal_id')[:1])
+        self.assertAlmostEqual(meal.total_calories, meal.calories_sum)
+        self.assertEqual(DailyNutrition.objects.aggregate(count=Sum('meals_count'))['count'], Meal.objects.count())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM products_meal_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark_data', users=1, stdout=StringIO())
+
+
+class QueryPlanTestCase(TestCase):
+    """Ключевые запросы идут по индексам на наборе данных seed_benchmark_data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_benchmark_data', users=100, products=2000, meals_per_user=20, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = User.objects.filter(username__startswith='bench_').first()
+
+    def assertIndexScan(self, queryset, index_name):
+        def nodes(plan):
+            yield plan
+            for child in plan.get('Plans', []):
+                yield from nodes(child)
+
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        indexes = {node['Index Name'] for node in nodes(plan) if 'Index Name' in node}
+        # Секции таблиц приемов пищи читаются по своим копиям индекса родительской таблицы.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT parent.relname FROM pg_inherits '
+                           'JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid '
+                           'JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent '
+                           'WHERE child.relname = ANY(%s)', [list(indexes)])
+            indexes.update(name for name, in cursor.fetchall())
+        self.assertIn(index_name, indexes, queryset.explain())
+
+    def test_meal_list_uses_user_created_index(self):
+        self.assertIndexScan(Meal.objects.filter(user=self.user).order_by('-created_at', '-id')[:20],
+                             'meal_user_created_idx')
+
+    def test_meal_period_uses_user_created_index(self):
+        end = timezone.now()
+        meals = Meal.objects.filter(user=self.user, created_at__gte=end - datetime.timedelta(days=7),
+                                    created_at__lt=end)
+        self.assertIndexScan(meals.daily_totals(), 'meal_user_created_idx')
+
+    def test_meal_products_use_meal_product_index(self):
+        meal_ids = list(Meal.objects.filter(user=self.user).values_list('id', flat=True)[:20])
+        self.assertIndexScan(MealProduct.objects.filter(meal_id__in=meal_ids), 'mealproduct_meal_product_idx')
+
+    def test_category_products_use_category_name_index(self):
+        category = ProductCategory.objects.first()
+        self.assertIndexScan(Product.objects.filter(category=category).order_by('name')[:20],
+                             'product_category_name_idx')
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ProductCategory.objects.create(name='Крупы')
+        self.product = Product.objects.create(name='Гречка', proteins=10, fats=5, carbs=20, category=self.category)
+        self.admin_user = User.objects.create_superuser(
+            username='admin123', email='admin123@example.com', password='admin123'
+        )
+        self.regular_user = User.objects.create_user(
+            username='regular', email='regular@example.com', password='regular123'
+        )
+        self.meal = Meal.objects.create(name='Обед', user=self.regular_user)
+        MealProduct.objects.create(meal=self.meal, product=self.product, weight=200)
+
+    def test_run_workers_executes_queued_jobs(self):
+        Meal.objects.filter(pk=self.meal.pk).update(total_proteins=0)
+        job = jobs.enqueue('refresh_meal_totals', {'meal_ids': [self.meal.id]})
+        # Как и тестовый клиент Django, не закрывает соединение внутри транзакции теста.
+        with mock.patch('products.management.commands.run_workers.close_old_connections'):
+            call_command('run_workers', burst=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (Job.SUCCEEDED, 1, {'meals': 1}))
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.total_proteins, 20)
+
+    def test_claim_skips_running_and_delayed_jobs(self):
+        first = jobs.enqueue('refresh_meal_totals', {'meal_ids': []})
+        jobs.enqueue('refresh_meal_totals', {'meal_ids': []}, delay=60)
+        self.assertEqual(jobs.claim().id, first.id)
+        self.assertIsNone(jobs.claim())
+
+        # Давно начатая задача с недавним сигналом воркера еще выполняется.
+        Job.objects.filter(pk=first.pk).update(started_at=timezone.now() - datetime.timedelta(hours=1))
+        with override_settings(JOBS_STALE_SECONDS=60):
+            self.assertEqual(jobs.requeue_stale(), 0)
+        Job.objects.filter(pk=first.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=2))
+        with override_settings(JOBS_STALE_SECONDS=60):
+            self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim().attempts, 2)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        calls = []
+
+        def flaky(payload):
+            calls.append(payload)
+            raise ValueError('сбой')
+
+        with mock.patch.dict(jobs.TASKS, {'flaky': flaky}):
+            job = jobs.enqueue('flaky', max_attempts=2)
+            self.assertEqual(jobs.run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIn('ValueError', job.error)
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            jobs.run_pending()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, len(calls)), (Job.FAILED, 2, 2))
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(reverse('products:jobs-retry', args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+
+    def test_background_import_and_status(self):
+        self.client.force_authenticate(user=self.admin_user)
+        content = 'name,proteins,fats,carbs,category\nГречка,13,3,68,Крупы\n'
+        upload = SimpleUploadedFile('products.csv', content.encode())
+        response = self.client.post(reverse('products:products-import-products'),
+                                    {'file': upload, 'background': 'true'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Product.objects.get().proteins, 10)
+
+        jobs.run_pending()
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['status'], Job.SUCCEEDED)
+        self.assertEqual(response.data['result'], {'imported': 1, 'errors': []})
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.total_proteins, 26)
+
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.get(reverse('products:jobs-detail', args=[response.data['id']]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_background_export_download(self):
+        self.client.force_authenticate(user=self.regular_user)
+        response = self.client.post(reverse('products:products-export'), {'file_format': 'jsonl'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Job.objects.exists())
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(reverse('products:products-export'), {'file_format': 'jsonl'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['id']
+        download = reverse('products:jobs-download', args=[job_id])
+        self.assertEqual(self.client.get(download).status_code, status.HTTP_404_NOT_FOUND)
+
+        jobs.run_pending()
+        response = self.client.get(download)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['name'], 'Гречка')
+        self.assertEqual([job['id'] for job in self.client.get(reverse('products:jobs-list')).data['results']],
+                         [job_id])
+
+    def test_prune_jobs_deletes_old_jobs_and_files(self):
+        old_job = jobs.enqueue('export_products', {'file_format': 'csv'}, user=self.admin_user)
+        recent_job = jobs.enqueue('export_products', {'file_format': 'csv'}, user=self.admin_user)
+        queued_job = jobs.enqueue('export_products', {'file_format': 'csv'}, user=self.admin_user, delay=60)
+        jobs.run_pending()
+        old_job.refresh_from_db()
+        recent_job.refresh_from_db()
+        Job.objects.filter(pk=old_job.pk).update(finished_at=timezone.now() - datetime.timedelta(days=8))
+        self.assertTrue(default_storage.exists(old_job.result['file']))
+
+        call_command('prune_jobs', days=7, stdout=StringIO())
+        self.assertEqual(set(Job.objects.values_list('id', flat=True)), {recent_job.id, queued_job.id})
+        self.assertFalse(default_storage.exists(old_job.result['file']))
+        self.assertTrue(default_storage.exists(recent_job.result['file']))
+        default_storage.delete(recent_job.result['file'])
+
+    @override_settings(JOBS_DEFER_MEAL_TOTALS=True)
+    def test_deferred_meal_totals_after_product_edit(self):
+        self.product.proteins = 20
+        self.product.save()
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.total_proteins, 20)
+        self.assertEqual(Job.objects.get().kind, 'refresh_meal_totals_for_products')
+
+        jobs.run_pending()
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.total_proteins, 40)
+
+
+class JobHeartbeatTestCase(TransactionTestCase):
+    @override_settings(JOBS_HEARTBEAT_SECONDS=0.05, JOBS_STALE_SECONDS=1)
+    def test_long_running_job_is_not_requeued(self):
+        requeued = []
+
+        def slow(payload):
+            long_ago = timezone.now() - datetime.timedelta(hours=1)
+            Job.objects.filter(kind='slow').update(started_at=long_ago, heartbeat_at=long_ago)
+            time.sleep(0.3)
+            requeued.append(jobs.requeue_stale())
+            return {}
+
+        with mock.patch.dict(jobs.TASKS, {'slow': slow}):
+            job = jobs.enqueue('slow')
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((requeued, job.status, job.attempts), ([0], Job.SUCCEEDED, 1))
+
+
+class ProductionSettingsTestCase(SimpleTestCase):
+    def load(self):
+        sys.modules.pop('nutrition_tracker.settings_production', None)
+        try:
+            return importlib.import_module('nutrition_tracker.settings_production')
+        finally:
+            sys.modules.pop('nutrition_tracker.settings_production', None)
+
+    def test_requires_shared_cache(self):
+        with mock.patch('nutrition_tracker.settings.CACHES',
+                        {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'REDIS_URL'):
+                self.load()
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                             'LOCATION': 'redis://redis:6379/0'}}
+        with mock.patch('nutrition_tracker.settings.CACHES', redis):
+            self.assertEqual(self.load().CACHES, redis)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DB_REPLICA_PIN_SECONDS=60)
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request, write=False):
+        databases = []
+
+        def view(request):
+            if write:
+                databases.append(self.router.db_for_write(Product))
+            databases.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return databases[-1]
+
+    def test_safe_methods_read_from_replica(self):
+        self.assertEqual(self.route(self.factory.get('/')), 'replica1')
+        self.assertIsNone(self.route(self.factory.post('/')))
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    def test_reads_after_write_stay_on_primary(self):
+        self.assertIsNone(self.route(self.factory.get('/'), write=True))
+
+    def test_client_is_pinned_to_primary_after_write(self):
+        self.factory.cookies[settings.SESSION_COOKIE_NAME] = 'session'
+        self.route(self.factory.post('/'))
+        self.assertIsNone(self.route(self.factory.get('/')))
+        self.assertEqual(self.route(RequestFactory().get('/', HTTP_AUTHORIZATION='Basic other')), 'replica1')
+        self.assertEqual(self.route(RequestFactory().get('/')), 'replica1')
+
+        cache.clear()
+        self.assertEqual(self.route(self.factory.get('/')), 'replica1')
+
+    def test_migrations_are_not_applied_to_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'products'))
+        self.assertIsNone(self.router.allow_migrate('default', 'products'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Реплики не настроены (DB_REPLICA_HOSTS).')
+class ReplicaReadTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.replica = connections[settings.DATABASE_REPLICAS[0]]
+        self.user = User.objects.create_user(username='regular', password='regular123')
+        category = ProductCategory.objects.create(name='Крупы')
+        self.product = Product.objects.create(name='Гречка', proteins=10, fats=5, carbs=20, category=category)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def get_meals(self):
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(self.replica) as replica:
+            response = self.client.get(reverse('products:meals-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        primary_queries, replica_queries = self.get_meals()
+        self.assertEqual(primary_queries, 0)
+        self.assertGreater(replica_queries, 0)
+
+        response = self.client.post(reverse('products:meals-list'),
+                                    {'name': 'Обед', 'meal_products': [{'product': self.product.id, 'weight': 100}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        primary_queries, replica_queries = self.get_meals()
+        self.assertGreater(primary_queries, 0)
+        self.assertEqual(replica_queries, 0)
+
+        # Окно DB_REPLICA_PIN_SECONDS истекло.
+        cache.clear()
+        self.assertEqual(self.get_meals()[0], 0)
+
+
+class MealPartitionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='regular', password='regular123')
+        category = ProductCategory.objects.create(name='Крупы')
+        self.product = Product.objects.create(name='Гречка', proteins=10, fats=5, carbs=20, category=category)
+        self.this_month = partitions.month_start(timezone.localdate())
+        self.months = [partitions.add_months(self.this_month, -2), partitions.add_months(self.this_month, -1),
+                       self.this_month]
+        with connection.cursor() as cursor:
+            for month in self.months[:2]:
+                partitions.create_partitions(cursor, month)
+        self.meals = []
+        for month in self.months:
+            meal = Meal.objects.create(user=self.user, name='Обед', created_at=partitions.month_bounds(month)[0])
+            MealProduct.objects.create(meal=meal, product=self.product, weight=100)
+            self.meals.append(meal)
+
+    def partition_of(self, table, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {table} WHERE id = %s', [pk])
+            return cursor.fetchone()[0]
+
+    def test_rows_are_stored_in_month_partitions(self):
+        meal = self.meals[0]
+        meal_product = meal.meal_products.get()
+        self.assertEqual(meal_product.meal_created_at, meal.created_at)
+        self.assertEqual(self.partition_of('products_meal', meal.id), f'products_meal_p{self.months[0]:%Y_%m}')
+        self.assertEqual(self.partition_of('products_mealproduct', meal_product.id),
+                         f'products_mealproduct_p{self.months[0]:%Y_%m}')
+
+    def test_moving_meal_moves_its_products(self):
+        meal = self.meals[2]
+        meal.created_at = partitions.month_bounds(self.months[0])[0] + datetime.timedelta(days=3)
+        meal.save()
+        meal_product = MealProduct.objects.get(meal=meal)
+        self.assertEqual(meal_product.meal_created_at, meal.created_at)
+        self.assertEqual(self.partition_of('products_mealproduct', meal_product.id),
+                         f'products_mealproduct_p{self.months[0]:%Y_%m}')
+
+        meal_product.weight = 200
+        meal_product.save()
+        meal.refresh_from_db()
+        self.assertEqual(meal.total_proteins, 20)
+
+    def test_period_query_reads_only_its_partitions(self):
+        self.client.force_authenticate(user=self.user)
+        month = self.months[1]
+        last_day = partitions.add_months(month, 1) - datetime.timedelta(days=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:meals-list'), {'from': month, 'to': last_day})
+        self.assertEqual([meal['id'] for meal in response.data['results']], [self.meals[1].id])
+        self.assertEqual(len(response.data['results'][0]['meal_products']), 1)
+        self.assertEqual(self.scanned_partitions(queries),
+                         {f'products_meal_p{month:%Y_%m}', f'products_mealproduct_p{month:%Y_%m}'})
+
+    def test_meal_products_are_read_by_partition_key(self):
+        self.client.force_authenticate(user=self.user)
+        for fast in (True, False):
+            with override_settings(FAST_SERIALIZATION=fast), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('products:meals-list'))
+            self.assertEqual(len(response.data['results']), 3)
+            meal_products_sql = [query['sql'] for query in queries if 'FROM "products_mealproduct"' in query['sql']]
+            self.assertEqual(len(meal_products_sql), 1)
+            self.assertIn('"products_mealproduct"."meal_created_at" IN', meal_products_sql[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:async-meals-list'))
+        self.assertEqual(len(response.json()['results']), 3)
+        meal_products_sql = [query['sql'] for query in queries if 'FROM "products_mealproduct"' in query['sql']]
+        self.assertEqual(len(meal_products_sql), 1)
+        self.assertIn('"products_mealproduct"."meal_created_at" IN', meal_products_sql[0])
+
+        month = self.months[1]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:meals-detail', args=[self.meals[1].id]))
+        self.assertEqual(len(response.data['meal_products']), 1)
+        # Сам прием пищи ищется по id во всех секциях, его продукты - только в секции его месяца.
+        self.assertEqual({name for name in self.scanned_partitions(queries) if 'mealproduct' in name},
+                         {f'products_mealproduct_p{month:%Y_%m}'})
+
+    def scanned_partitions(self, queries):
+        """Секции приемов пищи и их продуктов, которые читают планы запросов queries."""
+        def relations(plan):
+            if 'Relation Name' in plan:
+                yield plan['Relation Name']
+            for child in plan.get('Plans', []):
+                yield from relations(child)
+
+        scanned = set()
+        with connection.cursor() as cursor:
+            for query in queries:
+                if 'products_meal' in query['sql']:
+                    cursor.execute('EXPLAIN (FORMAT JSON) ' + query['sql'])
+                    scanned.update(relations(cursor.fetchone()[0][0]['Plan']))
+        return {name for name in scanned if name.startswith('products_meal')}
+
+    def test_command_creates_and_detaches_partitions(self):
+        out = StringIO()
+        call_command('manage_meal_partitions', months_ahead=5, detach_older_than=1, stdout=out)
+        with connection.cursor() as cursor:
+            existing = partitions.list_partitions(cursor, 'products_mealproduct')
+            cursor.execute('SELECT COUNT(*) FROM archive.products_mealproduct_p' + f'{self.months[0]:%Y_%m}')
+            archived = cursor.fetchone()[0]
+        self.assertIn(partitions.add_months(self.this_month, 5), existing)
+        self.assertNotIn(self.months[0], existing)
+        self.assertEqual(archived, 1)
+        self.assertEqual(list(Meal.objects.order_by('created_at')), self.meals[1:])
+
+    def test_archived_rows_outlive_users_products_and_rollup_rebuild(self):
+        archived_day = timezone.localdate(self.meals[0].created_at)
+        call_command('manage_meal_partitions', detach_older_than=1, stdout=StringIO())
+        self.assertEqual(DailyNutrition.rebuild(), 2)
+        self.assertTrue(DailyNutrition.objects.filter(user=self.user, date=archived_day, proteins=10).exists())
+
+        product_id = self.product.id
+        self.product.delete()
+        self.user.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM archive.products_meal_p' + f'{self.months[0]:%Y_%m}')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('SELECT product_id FROM archive.products_mealproduct_p' + f'{self.months[0]:%Y_%m}')
+            self.assertEqual(cursor.fetchone()[0], product_id)
+
+    def test_command_refuses_month_with_rows_in_default_partition(self):
+        month = partitions.add_months(self.this_month, 6)
+        Meal.objects.create(user=self.user, created_at=partitions.month_bounds(month)[0])
+        with self.assertRaisesMessage(CommandError, f'{month:%Y-%m}'):
+            call_command('manage_meal_partitions', months_ahead=6, stdout=StringIO())
+
+
+class FastSerializationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='regular', password='regular123')
+        self.admin_user = User.objects.create_superuser(username='admin123', password='admin123')
+        categories = [ProductCategory.objects.create(name='Крупы'),
+                      ProductCategory.objects.create(name='Строка\u2028с разделителем')]
+        products = [
+            Product.objects.create(name=f'Продукт {number}', proteins=number, fats=number % 3, carbs=20,
+                                   category=categories[number % 2])
+            for number in range(5)
+        ]
+        for day, user in ((1, self.user), (2, self.user), (2, self.admin_user)):
+            created_at = timezone.make_aware(datetime.datetime(2024, 9, day, 12, 30, 0, 123456))
+            meal = Meal.objects.create(user=user, name='Обед' if day == 1 else None, created_at=created_at)
+            MealProduct.objects.create(meal=meal, product=products[day], weight=55.5)
+            MealProduct.objects.create(meal=meal, product=products[0], weight=0.00001)
+        Meal.objects.create(user=self.user, created_at=timezone.make_aware(datetime.datetime(2024, 9, 3)))
+
+    def get_both(self, url, params):
+        """Ответ быстрого пути и ответ обычных сериализаторов с JSONRenderer."""
+        cache.clear()
+        fast = self.client.get(url, params)
+        cache.clear()
+        with override_settings(FAST_SERIALIZATION=False), \
+                mock.patch.object(FastJSONRenderer, 'render', JSONRenderer.render):
+            regular = self.client.get(url, params)
+        self.assertEqual(fast.status_code, status.HTTP_200_OK)
+        return fast, regular
+
+    def test_lists_match_regular_serializers(self):
+        cases = [
+            ('products:products-list', {}),
+            ('products:products-list', {'fields': 'id,category'}),
+            ('products:products-list', {'fields': 'id', 'ordering': '-proteins', 'page_size': 2}),
+            ('products:productcategory-list', {}),
+            ('products:meals-list', {}),
+            ('products:meals-list', {'fields': 'id,meal_products', 'page_size': 1}),
+            ('products:meals-list', {'from': '2024-09-02', 'to': '2024-09-30'}),
+        ]
+        for user in (self.user, self.admin_user):
+            self.client.force_authenticate(user=user)
+            for name, params in cases:
+                with self.subTest(user=user.username, name=name, params=params):
+                    fast, regular = self.get_both(reverse(name), params)
+                    self.assertEqual(fast.content, regular.content)
+                    next_url = fast.json().get('next') if name != 'products:productcategory-list' else None
+                    if next_url:
+                        fast, regular = self.get_both(next_url, {})
+                        self.assertEqual(fast.content, regular.content)
+
+    def test_list_does_not_use_serializer_per_record(self):
+        self.client.force_authenticate(user=self.user)
+        with mock.patch.object(MealSerializer, 'to_representation', side_effect=AssertionError), \
+                self.assertNumQueries(2):
+            response = self.client.get(reverse('products:meals-list'))
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertEqual(response.json()['results'][2]['meal_products'][0]['product']['name'], 'Продукт 1')
+
+    def test_unsupported_serializer(self):
+        with self.assertRaises(representations.Unsupported):
+            representations.compile_serializer(UserSerializer())
+        self.assertEqual(representations.compile_serializer(UserSerializer(fields={'id', 'username'})).columns,
+                         ['id', 'username'])
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'floats': [0.1, 1e-05, 1e16, -0.0, 150.0], 'text': 'Текст "в кавычках"\n\u2028',
+            'created_at': timezone.now(), 'decimal': Decimal('1.50'), 'lazy': gettext_lazy('Категория'),
+            'big': 2 ** 70, 'nested': [{'id': 1, 'name': None, 'ok': True}],
+        }
+        for value in [data, *data.values(), {'id': 1, 'name': 'Гречка'}]:
+            for media_type in ('application/json', 'application/json; indent=4'):
+                with self.subTest(value=value, media_type=media_type):
+                    self.assertEqual(FastJSONRenderer().render(value, media_type),
+                                     JSONRenderer().render(value, media_type))
+
+    def test_renderer_writes_non_finite_floats_as_null(self):
+        data = {'total_calories': float('nan'), 'weights': [float('inf'), -float('inf')]}
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json'),
+                         b'{"total_calories":null,"weights":[null,null]}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data, 'application/json')
+
+
+class DuplicateProductsTestCase(TestCase):
+    def setUp(self):
+        category = ProductCategory.objects.create(name='Крупы')
+        products = [
+            ('Гречка варёная', 12, 3, 60), ('гречка вареная', 12, 3, 61), ('Гречка отварная', 13, 3, 59),
+            ('Гречка жареная', 12, 15, 60), ('Рис', 7, 1, 70), ('Молоко 2,5%', 3, 2, 5), ('Молоко 3,2%', 3, 3, 5),
+        ]
+        self.products = [Product.objects.create(name=name, proteins=proteins, fats=fats, carbs=carbs, category=category)
+                         for name, proteins, fats, carbs in products]
+        self.buckwheat = [product.id for product in self.products[:3]]
+        self.user = User.objects.create_user(username='regular', password='regular123')
+        self.meal = Meal.objects.create(user=self.user, name='Обед')
+        MealProduct.objects.bulk_create([MealProduct(meal=self.meal, product=self.products[1], weight=100),
+                                         MealProduct(meal=self.meal, product=self.products[2], weight=200)])
+        Meal.refresh_totals([self.meal.id])
+
+    def test_clusters_similar_names_with_close_nutrients(self):
+        self.assertEqual(duplicates.normalize_name('Гречка  варёная!'), 'гречка вареная')
+        self.assertEqual(duplicates.find_duplicates(), [self.buckwheat])
+        self.assertEqual(duplicates.find_duplicates(max_distance=15), [self.buckwheat + [self.products[3].id]])
+
+    def test_merge_repoints_meal_products_in_one_update(self):
+        winner = self.products[0]
+        with CaptureQueriesContext(connection) as queries:
+            moved = duplicates.merge_products(winner.id, self.buckwheat)
+        self.assertEqual(moved, 2)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "products_mealproduct"')]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(Product.objects.filter(id__in=self.buckwheat[1:]).exists())
+        self.assertEqual(set(self.meal.meal_products.values_list('product_id', flat=True)), {winner.id})
+        self.meal.refresh_from_db()
+        self.assertEqual(self.meal.total_proteins, 300 * winner.proteins / 100)
+        self.assertEqual(DailyNutrition.objects.get(user=self.user).proteins, self.meal.total_proteins)
+
+    def test_command_and_background_job(self):
+        out = StringIO()
+        call_command('find_duplicate_products', stdout=out)
+        self.assertIn('Найдено кластеров: 1.', out.getvalue())
+        self.assertIn('гречка вареная (12/3/61)', out.getvalue())
+        self.assertEqual(Job.objects.get(kind='find_duplicate_products', status=Job.SUCCEEDED).result,
+                         {'clusters': [self.buckwheat]})
+        call_command('find_duplicate_products', background=True, max_distance=15, stdout=StringIO())
+        jobs.run_pending()
+        self.assertEqual(Job.objects.filter(kind='find_duplicate_products').latest('finished_at').result,
+                         {'clusters': [self.buckwheat + [self.products[3].id]]})
+
+    def test_admin_merges_cluster(self):
+        admin_user = User.objects.create_superuser(username='admin123', password='admin123')
+        client = Client()
+        client.force_login(admin_user)
+        url = reverse('admin:products_product_duplicates')
+        self.assertContains(client.get(url), 'Поиск дубликатов еще не выполнялся.')
+        call_command('find_duplicate_products', stdout=StringIO())
+        self.assertContains(client.get(url), 'Гречка отварная')
+        client.post(url, {'search': '1'})
+        jobs.run_pending()
+        response = client.get(url)
+        self.assertContains(response, 'Гречка отварная')
+        self.assertNotContains(response, 'Рис')
+
+        response = client.post(url, {'merge': '1', 'products': self.buckwheat, 'winner': self.buckwheat[2]})
+        self.assertRedirects(response, url)
+        self.assertEqual(list(Product.objects.filter(id__in=self.buckwheat).values_list('id', flat=True)),
+                         [self.buckwheat[2]])
+        self.assertContains(client.get(url), 'Дубликатов не найдено.')
+        client.force_login(self.user)
+        self.assertEqual(client.get(url).status_code, status.HTTP_302_FOUND)
+
+
+class SimilarProductsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='regular', password='regular123'))
+        self.cereals = ProductCategory.objects.create(name='Крупы')
+        self.dairy = ProductCategory.objects.create(name='Молочные')
+        products = [
+            ('Гречка', 12, 3, 60, self.cereals), ('Рис', 7, 1, 70, self.cereals), ('Овсянка', 12, 6, 60, self.cereals),
+            ('Творог', 17, 5, 3, self.dairy), ('Сырники', 14, 6, 50, self.dairy), ('Масло', 1, 82, 1, self.dairy),
+        ]
+        self.products = {name: Product.objects.create(name=name, proteins=proteins, fats=fats, carbs=carbs,
+                                                      category=category)
+                         for name, proteins, fats, carbs, category in products}
+
+    def similar(self, name, **params):
+        response = self.client.get(reverse('products:products-similar', args=[self.products[name].id]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product['name'] for product in response.data]
+
+    def test_orders_by_nutrient_distance(self):
+        self.assertEqual(self.similar('Гречка', k=3), ['Овсянка', 'Сырники', 'Рис'])
+        self.assertEqual(self.similar('Гречка', category='Крупы'), ['Овсянка', 'Рис'])
+        self.assertEqual(self.similar('Гречка', k=1, category='Молочные'), ['Сырники'])
+        self.assertEqual(self.similar('Гречка', category='Нет такой'), [])
+        url = reverse('products:products-similar', args=[self.products['Гречка'].id])
+        self.assertEqual(self.client.get(url, {'k': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'k': 51}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('products:products-similar', args=[0])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_applies_product_writes_without_reloading(self):
+        index = similarity.get_index()
+        with mock.patch.object(similarity.SimilarityIndex, 'load') as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.products['Перловка'] = Product.objects.create(name='Перловка', proteins=12, fats=3, carbs=61,
+                                                                   category=self.cereals)
+                self.products['Сырники'].fats = 80
+                self.products['Сырники'].save()
+                self.products['Овсянка'].delete()
+            self.assertEqual(self.similar('Гречка', k=3), ['Перловка', 'Рис', 'Творог'])
+            self.assertEqual(self.similar('Масло', k=1), ['Сырники'])
+            load.assert_not_called()
+        self.assertIs(similarity.get_index(), index)
+
+        # Изменения в обход сигналов видны по версии каталога: индекс перечитывается.
+        Product.objects.filter(name='Рис').update(proteins=1, fats=82, carbs=1)
+        invalidate('products')
+        self.assertIsNot(similarity.get_index(), index)
+        self.assertEqual(self.similar('Масло', k=1), ['Рис'])
+
+    def test_compaction_matches_rebuilt_index(self):
+        rng = np.random.default_rng(0)
+        ids = np.arange(1, 2001)
+        macros = rng.integers(0, 100, (len(ids), 3))
+        categories = rng.integers(1, 4, len(ids))
+        index = similarity.SimilarityIndex(ids, nutrition.with_calories(macros), categories)
+        changed = rng.choice(ids, 300, replace=False)
+        macros[changed - 1] = rng.integers(0, 100, (len(changed), 3))
+        with mock.patch.object(similarity, 'MAX_PENDING', 100):
+            for product_id in changed[:200]:
+                index.update(int(product_id), nutrition.with_calories(macros[product_id - 1])[0],
+                             int(categories[product_id - 1]))
+            for product_id in changed[200:]:
+                index.remove(int(product_id))
+        self.assertLess(len(index.pending) + index.hidden_count, 100)
+        # Ответ сверяется с полным перебором по расстояниям: порядок равноудаленных продуктов не важен.
+        kept = ~np.isin(ids, changed[200:])
+        points = nutrition.with_calories(macros) / index.scale
+        for product_id in rng.choice(ids[kept], 50):
+            for category_ids in (None, {int(categories[product_id - 1])}):
+                found = index.nearest(points[product_id - 1] * index.scale, 10, category_ids, exclude=[product_id])
+                eligible = kept & (ids != product_id)
+                if category_ids is not None:
+                    eligible &= categories == categories[product_id - 1]
+                distances = np.linalg.norm(points - points[product_id - 1], axis=1)
+                np.testing.assert_allclose(distances[np.array(found) - 1], np.sort(distances[eligible])[:10])
+
+
+class MealTemplateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='regular', password='regular123')
+        self.client.force_authenticate(self.user)
+        category = ProductCategory.objects.create(name='Завтраки')
+        self.products = [
+            Product.objects.create(name=f'Продукт {number}', proteins=number, fats=number % 7, carbs=number * 2 % 90,
+                                   category=category)
+            for number in range(1, 31)
+        ]
+
+    def create_template(self, products, **data):
+        response = self.client.post(reverse('products:meal-templates-list'), {
+            'name': 'Мой завтрак', 'meal_name': 'Завтрак',
+            'items': [{'product': product.id, 'weight': 50 + index * 10} for index, product in enumerate(products)],
+            **data,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data
+
+    def test_template_keeps_cached_totals(self):
+        data = self.create_template(self.products[:2])
+        self.assertEqual(data['items'][0]['product']['name'], 'Продукт 1')
+        self.assertEqual(data['total_proteins'], 1 * 50 / 100 + 2 * 60 / 100)
+        template = MealTemplate.objects.get(pk=data['id'])
+
+        self.products[0].proteins = 11
+        self.products[0].save()
+        template.refresh_from_db()
+        self.assertEqual(template.total_proteins, 11 * 50 / 100 + 2 * 60 / 100)
+        self.products[1].delete()
+        template.refresh_from_db()
+        self.assertEqual(template.total_proteins, 11 * 50 / 100)
+
+        url = reverse('products:meal-templates-detail', args=[template.id])
+        response = self.client.patch(url, {'items': [{'product': self.products[2].id, 'weight': 200}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data['total_proteins'], 6.0)
+        response = self.client.post(reverse('products:meal-templates-list'), {
+            'name': 'Пустой', 'items': [{'product': 0, 'weight': 10}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(User.objects.create_user(username='other', password='other123'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(reverse('products:meals-from-template', args=[template.id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_meal_from_template_in_constant_queries(self):
+        small = self.create_template(self.products[:2])
+        large = self.create_template(self.products, name='Большой завтрак')
+        created_at = timezone.now() - datetime.timedelta(days=1)
+        queries = []
+        for template in (small, large):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.post(reverse('products:meals-from-template', args=[template['id']]),
+                                            {'created_at': created_at.isoformat()}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+        meal = Meal.objects.with_totals().get(pk=response.data['id'])
+        self.assertEqual(meal.name, 'Завтрак')
+        self.assertEqual(meal.meal_products.count(), 30)
+        self.assertEqual(len(response.data['meal_products']), 30)
+        self.assertEqual(response.data['meal_products'][0]['product']['name'], 'Продукт 1')
+        for nutrient in Meal.TOTAL_NUTRIENTS:
+            self.assertAlmostEqual(getattr(meal, f'total_{nutrient}'), getattr(meal, f'{nutrient}_sum'))
+            self.assertEqual(response.data[f'total_{nutrient}'], large[f'total_{nutrient}'])
+        rollup = DailyNutrition.objects.get(user=self.user, date=timezone.localdate(created_at))
+        self.assertEqual(rollup.meals_count, 2)
+        self.assertAlmostEqual(rollup.proteins, small['total_proteins'] + large['total_proteins'])
+
+    def test_recent_and_frequent_products(self):
+        url = reverse('products:products-recent')
+        now = timezone.now()
+        for days, products in ((3, self.products[:3]), (2, self.products[:1]), (1, self.products[5:6])):
+            response = self.client.post(reverse('products:meals-list'), {
+                'name': 'Обед', 'created_at': (now - datetime.timedelta(days=days)).isoformat(),
+                'meal_products': [{'product': product.id, 'weight': 100} for product in products],
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        template = self.create_template(self.products[1:2])
+        self.client.post(reverse('products:meals-from-template', args=[template['id']]), {}, format='json')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'order': 'frequent', 'limit': 2})
+        self.assertEqual([(item['product']['name'], item['uses']) for item in response.data],
+                         [('Продукт 2', 2), ('Продукт 1', 2)])
+        response = self.client.get(url)
+        self.assertEqual([item['product']['name'] for item in response.data],
+                         ['Продукт 2', 'Продукт 6', 'Продукт 1', 'Продукт 3'])
+        self.assertEqual(self.client.get(url, {'order': 'popular'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Счетчики совпадают с группировкой по всей истории, которую они заменяют.
+        history = (MealProduct.objects.filter(meal__user=self.user).values('product_id')
+                   .annotate(uses=Count('id')).values_list('product_id', 'uses'))
+        self.assertEqual(dict(history), dict(ProductUsage.objects.filter(user=self.user)
+                                             .values_list('product_id', 'uses')))
+
+    def test_merge_moves_template_items_and_usage(self):
+        meal = Meal.objects.create(user=self.user, name='Обед')
+        MealProduct.objects.bulk_create([MealProduct(meal=meal, product=product, weight=100)
+                                         for product in self.products[:3]])
+        template = MealTemplate.objects.get(pk=self.create_template(self.products[1:3])['id'])
+        duplicates.merge_products(self.products[0].id, [product.id for product in self.products[:3]])
+
+        self.assertEqual(set(template.items.values_list('product_id', flat=True)), {self.products[0].id})
+        template.refresh_from_db()
+        self.assertEqual(template.total_proteins, 1 * 50 / 100 + 1 * 60 / 100)
+        self.assertEqual(list(ProductUsage.objects.filter(user=self.user).values_list('product_id', 'uses')),
+                         [(self.products[0].id, 3)])
@@ -1,17 +1,29 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from products.views import (ProductCategoryViewSet, ProductViewSet, UserViewSet, MealViewSet)
+from products import async_views
+from products.views import (CatalogueCacheStatsView, JobViewSet, MealTemplateViewSet, ProductCategoryViewSet,
+                            ProductViewSet, UserViewSet, MealViewSet)
 
 app_name = 'products'
 
 router = routers.DefaultRouter()
 router.register(r'users', UserViewSet, 'users')
-router.register(r'categories', ProductCategoryViewSet, 'categories')
+router.register(r'categories', ProductCategoryViewSet, 'productcategory')
 router.register(r'products', ProductViewSet, 'products')
-router.register(r'meals', UserViewSet, 'meals')
+router.register(r'meals', MealViewSet, 'meals')
+router.register(r'meal-templates', MealTemplateViewSet, 'meal-templates')
+router.register(r'jobs', JobViewSet, 'jobs')
 
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('cache/stats/', CatalogueCacheStatsView.as_view(), name='cache-stats'),
+    path('async/products/', async_views.product_list, name='async-products-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-products-detail'),
+    path('async/categories/', async_views.category_list, name='async-categories-list'),
+    path('async/categories/<int:pk>/', async_views.category_detail, name='async-categories-detail'),
+    path('async/meals/', async_views.meal_list, name='async-meals-list'),
+    path('async/meals/totals/', async_views.meal_totals, name='async-meals-totals'),
+    path('async/meals/<int:pk>/', async_views.meal_detail, name='async-meals-detail'),
 ]
@@ -1,48 +1,540 @@
-from rest_framework import generics
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
+import codecs
+import datetime
 
-from products.models import Meal, Product, ProductCategory, User
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Prefetch, Sum, prefetch_related_objects
+from django.db.models.functions import Length, TruncMonth, TruncWeek, Upper
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import generics, status
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+
+from products.cache import CachedResponseMixin, get_stats
+from products.catalogue import (CONTENT_TYPES, FORMATS, ProductImporter, check_encoding, detect_format, export_rows,
+                                read_rows)
+from products.filters import ProductFilterBackend
+from products.instrumentation import render_metrics
+from products import jobs, nutrition, optimizer, representations, similarity, targets, tasks
+from products.models import (DailyNutrition, Job, Meal, MealProduct, MealTemplate, Product, ProductCategory,
+                             ProductUsage, User)
+from products.pagination import JobCursorPagination, MealCursorPagination, ProductCursorPagination
 from products.permissions import IsAdminOrReadOnly, IsOwner
-from products.serializers import (MealSerializer, ProductCategorySerializer,
-                                  ProductSerializer, UserSerializer)
+from products.serializers import (BulkMealSerializer, DateRangeQuerySerializer, JobSerializer,
+                                  MealFromTemplateSerializer, MealOptimizeSerializer, MealSerializer,
+                                  MealTemplateSerializer, NutritionSummaryQuerySerializer, NutritionSummarySerializer,
+                                  ProductCategorySerializer, ProductSearchQuerySerializer, ProductSerializer,
+                                  ProductUsageSerializer, ProfileSerializer, ProgressQuerySerializer,
+                                  RecentProductsQuerySerializer, SimilarProductsQuerySerializer, UserSerializer)
+
+
+class SparseFieldsViewSetMixin:
+    """Передает ?fields=id,name,... в сериализатор для чтения, чтобы отдавать только нужные поля."""
+
+    def get_requested_fields(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        return {field.strip() for field in fields.split(',') if field.strip()}
+
+    def is_field_requested(self, *fields):
+        requested = self.get_requested_fields()
+        return requested is None or not requested.isdisjoint(fields)
+
+    def get_serializer(self, *args, **kwargs):
+        requested = self.get_requested_fields()
+        if requested is not None:
+            kwargs.setdefault('fields', requested)
+        return super().get_serializer(*args, **kwargs)
+
+
+class FastListMixin:
+    """
+    Отдает list() из строк .values() через products.representations: без моделей и
+    полей DRF на каждой записи, с тем же ответом. Сериализаторы с неподдерживаемыми
+    полями и FAST_SERIALIZATION=False - обычным путем.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        try:
+            compiled = representations.compile_serializer(self.get_serializer())
+        except representations.Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = ()
+        if isinstance(self.paginator, CursorPagination):
+            # Курсор следующей страницы берется из полей сортировки последней строки.
+            ordering = [field.lstrip('-') for field in self.paginator.get_ordering(request, queryset, self)]
+        rows = compiled.values(queryset, *ordering)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            rows = list(rows)
+            return Response(compiled.serialize(rows, self.get_related_queryset(queryset, rows)))
+        return self.get_paginated_response(compiled.serialize(page, self.get_related_queryset(queryset, page)))
 
+    def get_related_queryset(self, queryset, rows):
+        """queryset, чьи Prefetch задают условия вложенных списков для строк rows."""
+        return queryset
 
-class UserViewSet(ModelViewSet):
+
+class UserViewSet(SparseFieldsViewSetMixin, ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
 
+    def get_permissions(self):
+        if self.action in ('me', 'progress'):
+            return [IsAuthenticated()]
+        return super().get_permissions()
+
+    def get_queryset(self):
+        queryset = User.objects.order_by('id')
+        if self.is_field_requested('meals'):
+            queryset = queryset.prefetch_related(Prefetch('meals', queryset=Meal.objects.only('id', 'user_id')))
+        return queryset
+
+    @action(detail=False, methods=['get', 'patch'])
+    def me(self, request):
+        if request.method == 'GET':
+            return Response(ProfileSerializer(request.user).data)
+        serializer = ProfileSerializer(request.user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    @action(detail=False, url_path='me/progress')
+    def progress(self, request):
+        """Дневные цели из профиля против фактических итогов по дням одним группирующим запросом."""
+        query = ProgressQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        try:
+            daily_targets = targets.get_targets(request.user)
+        except targets.IncompleteProfile as error:
+            return Response({'detail': 'Заполните профиль, чтобы рассчитать цели.', 'fields': error.fields},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        start, end = ProgressQuerySerializer.datetime_range(params)
+        actual = {
+            totals['date']: totals
+            for totals in Meal.objects.filter(user=request.user, created_at__gte=start,
+                                              created_at__lt=end).daily_totals()
+        }
+
+        days = []
+        date = params['from']
+        while date <= params['to']:
+            totals = actual.get(date, {})
+            day = {'date': date, 'meals_count': totals.get('meals_count', 0)}
+            for nutrient in nutrition.NUTRIENTS:
+                value = totals.get(f'{nutrient}_sum', 0.0)
+                target = daily_targets[nutrient]
+                day[nutrient] = value
+                day[f'{nutrient}_percent'] = round(value / target * 100, 1) if target else None
+            days.append(day)
+            date += datetime.timedelta(days=1)
+        return Response({'targets': daily_targets, 'days': days})
 
-class ProductCategoryViewSet(ModelViewSet):
+
+class ProductCategoryViewSet(CachedResponseMixin, FastListMixin, SparseFieldsViewSetMixin, ModelViewSet):
+    cache_namespaces = ('categories',)
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedResponseMixin, FastListMixin, SparseFieldsViewSetMixin, ModelViewSet):
+    cache_namespaces = ('products', 'categories')
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductFilterBackend, OrderingFilter]
+    ordering_fields = ('id', 'name', 'proteins', 'fats', 'carbs', 'calories')
+    ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = Product.objects.all()
+        if self.is_field_requested('category'):
+            queryset = queryset.select_related('category')
+        return queryset
 
     def get_permissions(self):
-        if self.action in ('list', 'retrieve'):
+        # POST export ставит задачу выгрузки и занимает место в хранилище, поэтому только для администраторов.
+        if self.action in ('list', 'retrieve', 'export', 'search', 'similar', 'recent') \
+                and self.request.method in SAFE_METHODS:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAdminUser]
         return (permission() for permission in permission_classes)
 
+    @action(detail=False)
+    def search(self, request):
+        query = ProductSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # Условия строятся по UPPER(name), чтобы использовать индекс product_name_trgm_idx.
+        queryset = Product.objects.select_related('category').alias(name_upper=Upper('name'))
+        if params['mode'] == 'prefix':
+            # Короткие названия первыми: для автодополнения это самые вероятные варианты.
+            queryset = queryset.filter(name__istartswith=params['q']).order_by(Length('name'), 'name')
+        else:
+            queryset = queryset.filter(name_upper__trigram_word_similar=params['q'].upper()).annotate(
+                similarity=TrigramWordSimilarity(params['q'].upper(), 'name_upper')
+            ).order_by('-similarity', 'name')
+        serializer = self.get_serializer(queryset[:params['limit']], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def recent(self, request):
+        """Недавние (?order=recent) или частые (?order=frequent) продукты пользователя по счетчикам ProductUsage."""
+        query = RecentProductsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        ordering = ('-last_used_at', '-uses') if params['order'] == 'recent' else ('-uses', '-last_used_at')
+        usage = ProductUsage.objects.filter(user=request.user).select_related('product__category').order_by(
+            *ordering, 'product_id')[:params['limit']]
+        return Response(ProductUsageSerializer(usage, many=True).data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Продукты с самым близким составом (БЖУ и калории на 100 г), от ближних к дальним."""
+        query = SimilarProductsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # Не get_object(): здесь ?category= выбирает категорию соседей, а не фильтрует сам продукт.
+        product = generics.get_object_or_404(Product, pk=pk)
+        category_ids = None
+        if 'category' in params:
+            category_ids = set(ProductCategory.objects.filter(name=params['category']).values_list('id', flat=True))
+        ids = similarity.get_index().nearest([getattr(product, nutrient) for nutrient in nutrition.NUTRIENTS],
+                                             params['k'], category_ids, exclude=[product.pk])
+        # Продукты, удаленные другим процессом после построения индекса, просто пропускаются.
+        products = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([products[product_id] for product_id in ids if product_id in products],
+                                         many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['Файл не передан.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({'file_format': [f'Поддерживаются форматы: {", ".join(FORMATS)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        create_categories = request.data.get('create_categories') in ('1', 'true')
+        importer = ProductImporter(create_categories=create_categories)
+        try:
+            # Кодировка проверяется до загрузки: иначе ошибка в середине файла пришла бы после
+            # уже записанных пачек, а задача с таким файлом падала бы на каждом повторе.
+            check_encoding(upload)
+            if request.data.get('background') in ('1', 'true'):
+                job = jobs.enqueue('import_products', {
+                    'file': tasks.save_upload(upload, file_format),
+                    'file_format': file_format,
+                    'create_categories': create_categories,
+                }, user=request.user)
+                return job_accepted(request, job)
+            importer.run(read_rows(codecs.iterdecode(upload, 'utf-8-sig'), file_format))
+        except UnicodeDecodeError:
+            return Response({'file': ['Файл должен быть в кодировке UTF-8.']}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': importer.imported, 'errors': importer.errors})
+
+    @action(detail=False, methods=['get', 'post'])
+    def export(self, request):
+        """GET отдает выгрузку потоком, POST ставит выгрузку в файл в очередь фоновых задач."""
+        params = request.query_params if request.method == 'GET' else request.data
+        file_format = params.get('file_format', 'csv')
+        if file_format not in FORMATS:
+            return Response({'file_format': [f'Поддерживаются форматы: {", ".join(FORMATS)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'POST':
+            return job_accepted(request, jobs.enqueue('export_products', {'file_format': file_format},
+                                                      user=request.user))
+        response = StreamingHttpResponse(export_rows(file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+
+class MealViewSet(FastListMixin, SparseFieldsViewSetMixin, ModelViewSet):
+    MAX_BULK_MEALS = 1000
+    MAX_BULK_MEAL_PRODUCTS = 20000
+    MAX_EVALUATE_PLANS = 1000
+    MAX_EVALUATE_ITEMS = 50000
+    MAX_OPTIMIZE_CATEGORY_PRODUCTS = 50000
 
-class MealViewSet(ModelViewSet):
     queryset = Meal.objects.all()
     serializer_class = MealSerializer
     permission_classes = [IsAuthenticated, IsOwner]
+    pagination_class = MealCursorPagination
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Meal.objects.all()
+            queryset = Meal.objects.all()
+        else:
+            queryset = Meal.objects.filter(user=self.request.user)
+        if self.action == 'list' and {'from', 'to'} & self.request.query_params.keys():
+            # По периоду ?from=&to= Postgres читает только секции приемов пищи месяцев этого периода.
+            query = DateRangeQuerySerializer(data=self.request.query_params)
+            query.is_valid(raise_exception=True)
+            start, end = DateRangeQuerySerializer.datetime_range(query.validated_data)
+            queryset = queryset.filter(created_at__gte=start, created_at__lt=end)
+        # IsOwner сравнивает user_id, а пользователь нужен только для поля user в ответе.
+        if self.action != 'destroy' and self.is_field_requested('user'):
+            queryset = queryset.select_related('user')
+        return queryset
+
+    def meal_products_prefetch(self, created_at):
+        """
+        Продукты приемов пищи со временем created_at. Они читаются после самих приемов
+        пищи, чтобы задать ключ секции meal_created_at: по одним meal_id Postgres
+        просматривал бы секции всех месяцев.
+        """
+        meal_products = MealProduct.objects.select_related('product__category').filter(
+            meal_created_at__in=created_at).order_by('id')
+        return Prefetch('meal_products', queryset=meal_products)
+
+    def get_related_queryset(self, queryset, rows):
+        if not self.is_field_requested('meal_products'):
+            return queryset
+        return queryset.prefetch_related(self.meal_products_prefetch({row['created_at'] for row in rows}))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        # Обычный путь list(): на странице модели, а не строки .values().
+        if page and isinstance(page[0], Meal) and self.is_field_requested('meal_products'):
+            prefetch_related_objects(page, self.meal_products_prefetch({meal.created_at for meal in page}))
+        return page
+
+    def get_object(self):
+        meal = super().get_object()
+        if self.action != 'destroy' and self.is_field_requested('meal_products'):
+            prefetch_related_objects([meal], self.meal_products_prefetch([meal.created_at]))
+        return meal
+
+    @action(detail=False)
+    def summary(self, request):
+        query = NutritionSummaryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = DailyNutrition.objects.filter(user=request.user,
+                                                 date__gte=params['from'],
+                                                 date__lte=params['to'])
+        if params['granularity'] == 'day':
+            queryset = queryset.annotate(period=F('date')).values(
+                'period', *DailyNutrition.ROLLUP_FIELDS)
         else:
-            return Meal.objects.filter(user=self.request.user)
+            trunc = TruncWeek if params['granularity'] == 'week' else TruncMonth
+            queryset = queryset.values(period=trunc('date')).annotate(
+                **{field: Sum(field) for field in DailyNutrition.ROLLUP_FIELDS})
+        serializer = NutritionSummarySerializer(queryset.order_by('period'), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Ожидается список приемов пищи.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.MAX_BULK_MEALS:
+            return Response({'detail': f'Можно загрузить не более {self.MAX_BULK_MEALS} приемов пищи за раз.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Общее число продуктов считается до сериализаторов: их проверка и bulk_create
+        # растут с числом продуктов, а не приемов пищи.
+        meal_products_count = sum(len(item['meal_products']) for item in request.data
+                                  if isinstance(item, dict) and isinstance(item.get('meal_products'), list))
+        if meal_products_count > self.MAX_BULK_MEAL_PRODUCTS:
+            return Response({'detail': f'Можно загрузить не более {self.MAX_BULK_MEAL_PRODUCTS} продуктов за раз.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = {}
+        valid = []
+        for index, item in enumerate(request.data):
+            serializer = BulkMealSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'errors': serializer.errors}
+
+        product_ids = {item['product'] for _, data in valid for item in data['meal_products']}
+        existing_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        meals = []
+        for index, data in valid:
+            product_errors = [
+                {} if item['product'] in existing_ids else {'product': ['Продукт не найден.']}
+                for item in data['meal_products']
+            ]
+            if any(product_errors):
+                results[index] = {'index': index, 'errors': {'meal_products': product_errors}}
+                continue
+            meal = Meal(user=request.user, name=data.get('name'))
+            if 'created_at' in data:
+                meal.created_at = data['created_at']
+            meals.append((index, meal, data['meal_products']))
+
+        if meals:
+            with transaction.atomic():
+                Meal.objects.bulk_create([meal for _, meal, _ in meals])
+                MealProduct.objects.bulk_create([
+                    MealProduct(meal=meal, product_id=item['product'], weight=item['weight'])
+                    for _, meal, items in meals for item in items
+                ])
+                Meal.refresh_totals([meal.id for _, meal, _ in meals])
+            for index, meal, _ in meals:
+                results[index] = {'index': index, 'id': meal.id}
+
+        response_status = status.HTTP_201_CREATED if len(meals) == len(request.data) else status.HTTP_207_MULTI_STATUS
+        return Response([results[index] for index in sorted(results)], status=response_status)
+
+    @action(detail=False, methods=['post'], url_path=r'from-template/(?P<template_id>\d+)')
+    def from_template(self, request, template_id):
+        """Прием пищи по шаблону пользователя за постоянное число запросов (MealTemplate.create_meal)."""
+        serializer = MealFromTemplateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        template = generics.get_object_or_404(MealTemplate.objects.filter(user=request.user).with_items(),
+                                              pk=template_id)
+        meal = template.create_meal(request.user, **serializer.validated_data)
+        return Response(self.get_serializer(meal).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def evaluate(self, request):
+        """Итоги БЖУ и калорий для несохраненных планов питания без записи в базу."""
+        plans = request.data.get('plans') if isinstance(request.data, dict) else None
+        if not isinstance(plans, list):
+            return Response({'detail': 'Ожидается список планов в поле plans.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(plans) > self.MAX_EVALUATE_PLANS:
+            return Response({'detail': f'Можно оценить не более {self.MAX_EVALUATE_PLANS} планов за раз.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # Планы разбираются без сериализаторов DRF: на тысячах порций их проверка
+        # заняла бы больше времени, чем сам расчет.
+        try:
+            product_ids, weights, sizes = nutrition.read_plans(plans, self.MAX_EVALUATE_ITEMS)
+            totals = nutrition.get_matrix(product_ids).evaluate(product_ids, weights, sizes)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except nutrition.UnknownProducts as error:
+            return Response({'detail': 'Продукты не найдены.', 'products': error.product_ids},
+                            status=status.HTTP_400_BAD_REQUEST)
+        fields = [f'total_{nutrient}' for nutrient in nutrition.NUTRIENTS]
+        return Response([dict(zip(fields, row)) for row in totals.tolist()])
+
+    @action(detail=False, methods=['post'])
+    def optimize(self, request):
+        """Подбирает веса продуктов под цели по БЖУ и калориям (см. products.optimizer)."""
+        serializer = MealOptimizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if 'category' in params:
+            product_ids = list(Product.objects.filter(category=params['category']).order_by('id').values_list(
+                'id', flat=True)[:self.MAX_OPTIMIZE_CATEGORY_PRODUCTS + 1])
+            if not product_ids:
+                return Response({'detail': 'В категории нет продуктов.'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(product_ids) > self.MAX_OPTIMIZE_CATEGORY_PRODUCTS:
+                return Response({'detail': f'В категории больше {self.MAX_OPTIMIZE_CATEGORY_PRODUCTS} продуктов.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            lower = [params['min_weight']] * len(product_ids)
+            upper = [params['max_weight']] * len(product_ids)
+        else:
+            product_ids = [item['product'] for item in params['items']]
+            lower = [item['min_weight'] for item in params['items']]
+            upper = [item['max_weight'] for item in params['items']]
+
+        try:
+            items, totals = optimizer.optimize_plan(nutrition.get_matrix(product_ids), product_ids,
+                                                    params['targets'], lower, upper)
+        except nutrition.UnknownProducts as error:
+            return Response({'detail': 'Продукты не найдены.', 'products': error.product_ids},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'items': items,
+            'targets': params['targets'],
+            **{f'total_{nutrient}': value for nutrient, value in totals.items()},
+        })
+
+
+class MealTemplateViewSet(ModelViewSet):
+    """Шаблоны приемов пищи пользователя; прием пищи по шаблону создает POST /meals/from-template/{id}/."""
+    serializer_class = MealTemplateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def get_queryset(self):
+        return MealTemplate.objects.filter(user=self.request.user).with_items().order_by('name', 'id')
+
+
+def job_accepted(request, job):
+    response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('products:jobs-detail', args=[job.id], request=request)
+    return response
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    """Статусы фоновых задач пользователя (все задачи - для администратора)."""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = JobCursorPagination
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def retry(self, request, pk=None):
+        job = self.get_object()
+        if job.status != Job.FAILED:
+            return Response({'detail': 'Повторить можно только упавшую задачу.'}, status=status.HTTP_400_BAD_REQUEST)
+        job.status = Job.QUEUED
+        job.attempts = 0
+        job.run_after = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'run_after'])
+        return job_accepted(request, job)
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.kind != 'export_products' or job.status != Job.SUCCEEDED:
+            return Response({'detail': 'Файл выгрузки еще не готов.'}, status=status.HTTP_404_NOT_FOUND)
+        file_format = job.result['file_format']
+        return FileResponse(default_storage.open(job.result['file'], 'rb'), as_attachment=True,
+                            filename=f'products.{file_format}', content_type=CONTENT_TYPES[file_format])
+
+
+class CatalogueCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')